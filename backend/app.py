@@ -1,16 +1,29 @@
 import logging
-from datetime import datetime
+import time
+import uuid
+from datetime import date, datetime, timedelta
 
-from flask import Flask, flash, jsonify, redirect, render_template, request, url_for
+from flask import Flask, Response, flash, jsonify, redirect, render_template, request, url_for
 from flask_cors import CORS
 
+from config import Config
+from consistency import WriteSession, current_session
 from database import db_manager
+from idempotency import IdempotencyStore
+from metrics import HTTP_REQUEST_DURATION, LOGGED_ERRORS, ErrorCountingHandler, registry, render_family
+from notifications import ChangeListener
+from pagination import reservation_filters
+from reference_cache import ReferenceDataCache
+from replication import ReplicationMonitor
+from routing import HotelRouter
+from serialization import csv_chunks, dumps, gzip_chunks, ndjson_chunks
 from services.availability_service import AvailabilityService
 from services.booking_service import BookingService
 from services.guest_service import GuestService
 from services.hotel_service import HotelService
 from services.payment_service import PaymentService
 from services.reception_service import ReceptionService
+from slow_queries import slow_query_log
 
 app = Flask(__name__)
 CORS(app)
@@ -18,13 +31,163 @@ app.secret_key = "your-secret-key-here"
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
-
-booking_service = BookingService(db_manager)
-payment_service = PaymentService(db_manager)
-availability_service = AvailabilityService(db_manager)
-hotel_service = HotelService(db_manager)
+logging.getLogger().addHandler(ErrorCountingHandler(LOGGED_ERRORS))
+
+change_listener = ChangeListener()
+hotel_router = HotelRouter(db_manager)
+hotel_router.attach(change_listener)
+reference_cache = ReferenceDataCache(db_manager)
+reference_cache.attach(change_listener)
+
+booking_service = BookingService(db_manager, hotel_router, reference_cache)
+payment_service = PaymentService(db_manager, hotel_router, reference_cache)
+availability_service = AvailabilityService(db_manager, hotel_router, reference_cache)
+hotel_service = HotelService(db_manager, hotel_router, reference_cache)
 guest_service = GuestService(db_manager)
-reception_service = ReceptionService(db_manager)
+reception_service = ReceptionService(db_manager, hotel_router)
+idempotency_store = IdempotencyStore(db_manager)
+replication_monitor = ReplicationMonitor(db_manager)
+
+WRITE_SESSION_COOKIE = "db_lsn"
+
+
+def collect_component_metrics() -> list[str]:
+    # Статистика пулов, кэшей и блокировок бронирования уже собирается компонентами — читаем ее при выгрузке
+    pools = db_manager.pool_stats()
+    nodes = db_manager.node_status()
+    caches = {"reference": reference_cache.stats(), "idempotency": idempotency_store.stats()}
+    locks = booking_service.lock_stats.snapshot()
+
+    lines = render_family(
+        "db_pool_connections",
+        "gauge",
+        "Pool connections by state",
+        ("node", "state"),
+        [((node, state), stats[state]) for node, stats in pools.items() for state in ("in_use", "idle")],
+    )
+    for name, kind, documentation, key in (
+        ("db_pool_max_size", "gauge", "Pool size limit", "max_size"),
+        ("db_pool_waits_total", "counter", "Pool checkouts that had to wait", "waits"),
+        ("db_pool_timeouts_total", "counter", "Pool checkouts that timed out", "timeouts"),
+        ("db_pool_wait_seconds_total", "counter", "Time spent waiting for a pooled connection", "wait_time_total"),
+    ):
+        lines += render_family(name, kind, documentation, ("node",), [((node,), s[key]) for node, s in pools.items()])
+    lines += render_family(
+        "db_node_up",
+        "gauge",
+        "1 if the node's circuit breaker is closed",
+        ("node",),
+        [((node,), s["state"] == "closed") for node, s in nodes.items()],
+    )
+
+    for name, kind, documentation, key in (
+        ("cache_hits_total", "counter", "Cache hits", "hits"),
+        ("cache_misses_total", "counter", "Cache misses", "misses"),
+        ("cache_hit_ratio", "gauge", "Cache hit ratio since start", "hit_ratio"),
+    ):
+        lines += render_family(
+            name, kind, documentation, ("cache",), [((cache,), s[key]) for cache, s in caches.items()]
+        )
+    lines += render_family(
+        "idempotency_cache_entries",
+        "gauge",
+        "Results held in the idempotency LRU",
+        (),
+        [((), caches["idempotency"]["size"])],
+    )
+
+    # Корзины LockWaitStats уже накопительные, +Inf — число захватов
+    lines += ["# HELP booking_lock_wait_seconds Category lock wait time", "# TYPE booking_lock_wait_seconds histogram"]
+    for bound, count in (*locks["wait_seconds_buckets"].items(), ("+Inf", locks["acquired"])):
+        lines.append(f'booking_lock_wait_seconds_bucket{{le="{bound}"}} {count}')
+    lines.append(f"booking_lock_wait_seconds_sum {locks['wait_seconds_total']}")
+    lines.append(f"booking_lock_wait_seconds_count {locks['acquired']}")
+    lines += render_family(
+        "booking_lock_timeouts_total", "counter", "Category lock timeouts", (), [((), locks["timeouts"])]
+    )
+    lines += render_family(
+        "booking_lock_retries_total", "counter", "Booking transaction retries", (), [((), locks["retries"])]
+    )
+    return lines
+
+
+registry.collector(collect_component_metrics)
+
+
+@app.before_request
+def start_request_timer():
+    request.started_at = time.perf_counter()
+
+
+def run_idempotent(db_name: str, scope: str, operation) -> dict:
+    # Ключ берется из заголовка Idempotency-Key или скрытого поля формы; без ключа запрос выполняется как обычно
+    key = request.headers.get("Idempotency-Key") or request.form.get("idempotency_key")
+    if not key:
+        return operation()
+    if len(key) > 255:
+        return {"error": "Idempotency key is too long", "status": 400}
+    return idempotency_store.run(db_name, scope, key, operation)
+
+
+@app.before_request
+def open_write_session():
+    # LSN записей этой сессии на филиалах хранится в cookie; записи отслеживаются только в изменяющих запросах
+    session = WriteSession.from_cookie(
+        request.cookies.get(WRITE_SESSION_COOKIE), db_manager.filial_names(), track_writes=request.method == "POST"
+    )
+    request.write_session_token = current_session.set(session)
+
+
+@app.after_request
+def record_request_duration(response):
+    started_at = getattr(request, "started_at", None)
+    if started_at is not None:
+        HTTP_REQUEST_DURATION.observe(
+            (request.endpoint or "unmatched", request.method, response.status_code), time.perf_counter() - started_at
+        )
+    return response
+
+
+@app.after_request
+def save_write_session(response):
+    session = current_session.get()
+    if session is not None and session.changed:
+        if session.pending:
+            response.set_cookie(
+                WRITE_SESSION_COOKIE,
+                session.to_cookie(),
+                max_age=Config.READ_YOUR_WRITES_TTL,
+                httponly=True,
+                samesite="Lax",
+            )
+        else:
+            response.delete_cookie(WRITE_SESSION_COOKIE)
+    return response
+
+
+@app.teardown_request
+def close_write_session(exc):
+    token = getattr(request, "write_session_token", None)
+    if token is not None:
+        current_session.reset(token)
+
+
+def json_response(payload, status: int = 200) -> Response:
+    # Данные сервисов уже приведены к JSON-типам, кодируем их сразу в байты ответа
+    return Response(dumps(payload), status=status, mimetype="application/json")
+
+
+def create_app() -> Flask:
+    # Вызывается в каждом процессе-воркере после fork: соединения и фоновые потоки не разделяются между процессами
+    db_manager.open()
+    change_listener.start()
+    return app
+
+
+def shutdown(timeout: float = Config.WEB_GRACEFUL_TIMEOUT) -> None:
+    change_listener.stop()
+    db_manager.close_all(timeout)
+    logger.info("Database connections closed")
 
 
 @app.route("/")
@@ -72,6 +235,7 @@ def booking_form(hotel_id):
         room_category_id=room_category_id,
         start_date=start_date,
         end_date=end_date,
+        idempotency_key=uuid.uuid4().hex,
     )
 
 
@@ -92,40 +256,17 @@ def create_booking_html():
             flash("Ошибка: не выбрана категория номера", "error")
             return redirect(url_for("booking_form", hotel_id=hotel_id))
 
-        city_name = booking_service._get_city_by_hotel(int(hotel_id))
+        city_name = hotel_router.get_city(hotel_id)
         if not city_name:
             flash("Отель не найден", "error")
             return redirect(url_for("booking_form", hotel_id=hotel_id))
 
-        if city_name in ["Москва", "Санкт-Петербург", "Казань"]:
-            db_mapping = {
-                "Москва": "filial1",
-                "Санкт-Петербург": "filial2",
-                "Казань": "filial3",
-            }
-            primary_db = db_mapping[city_name]
-        else:
-            primary_db = "central"
+        primary_db = hotel_router.get_db_name_by_city(city_name)
 
         if guest_id == "new":
             if not all([guest_name, guest_phone]):
                 flash("Для нового гостя необходимо указать имя и телефон", "error")
                 return redirect(url_for("booking_form", hotel_id=hotel_id))
-
-            guest_data = {
-                "full_name": guest_name,
-                "phone_number": guest_phone,
-                "email": guest_email,
-                "birth_date": "2000-01-01",
-            }
-
-            guest_result = guest_service.create_guest(guest_data, primary_db)
-            if "error" in guest_result:
-                flash(f"Ошибка создания гостя: {guest_result['error']}", "error")
-                return redirect(url_for("booking_form", hotel_id=hotel_id))
-
-            guest_id = guest_result["guest_id"]
-            logger.info(f"Создан новый гость с ID: {guest_id} в БД {primary_db}")
         else:
             try:
                 guest_id = int(guest_id)
@@ -133,16 +274,36 @@ def create_booking_html():
                 flash("Неверный ID гостя", "error")
                 return redirect(url_for("booking_form", hotel_id=hotel_id))
 
-        booking_data = {
-            "hotel_id": hotel_id,
-            "guest_id": guest_id,
-            "room_category_id": room_category_id,
-            "start_date": start_date,
-            "end_date": end_date,
-            "total_guests": int(total_guests),
-        }
+        def book():
+            payer_id = guest_id
+            if payer_id == "new":
+                guest_data = {
+                    "full_name": guest_name,
+                    "phone_number": guest_phone,
+                    "email": guest_email,
+                    "birth_date": "2000-01-01",
+                }
+
+                guest_result = guest_service.create_guest(guest_data, primary_db)
+                if "error" in guest_result:
+                    return {"error": f"не удалось создать гостя: {guest_result['error']}", "status": 400}
+
+                payer_id = guest_result["guest_id"]
+                logger.info(f"Создан новый гость с ID: {payer_id} в БД {primary_db}")
+
+            booking_data = {
+                "hotel_id": hotel_id,
+                "guest_id": payer_id,
+                "room_category_id": room_category_id,
+                "start_date": start_date,
+                "end_date": end_date,
+                "total_guests": int(total_guests),
+            }
 
-        result = booking_service.create_booking(booking_data)
+            return booking_service.create_booking(booking_data)
+
+        # Повтор запроса с тем же ключом (таймаут мобильного клиента) возвращает сохраненный результат
+        result = run_idempotent(primary_db, "book", book)
 
         if "error" in result:
             flash(f"Ошибка при бронировании: {result['error']}", "error")
@@ -165,7 +326,7 @@ def payment_form(reservation_id):
         if not reservation:
             return render_template("404.html", message="Бронирование не найдено"), 404
 
-        return render_template("payment.html", reservation=reservation)
+        return render_template("payment.html", reservation=reservation, idempotency_key=uuid.uuid4().hex)
     except Exception as e:
         logger.error(f"Error getting reservation: {e}")
         return render_template("error.html", error=str(e))
@@ -199,13 +360,16 @@ def process_payment_html():
             flash("Ошибка: некорректный метод оплаты", "error")
             return redirect(url_for("payment_form", reservation_id=reservation_id))
 
+        hotel_id = request.form.get("hotel_id", type=int)
         payment_data = {
             "reservation_id": int(reservation_id),
+            "hotel_id": hotel_id,
             "amount": amount_float,
             "method": method,
         }
 
-        result = payment_service.process_payment(payment_data)
+        db_name = hotel_router.get_db_name(hotel_id) if hotel_id else "central"
+        result = run_idempotent(db_name, "pay", lambda: payment_service.process_payment(payment_data))
 
         logger.info(f"Payment result for reservation {reservation_id}: {result}")
 
@@ -303,9 +467,21 @@ def reception_desk(hotel_id):
     if not hotel:
         return render_template("404.html"), 404
 
-    reservations = booking_service.get_reservations(hotel_id, "pending")
+    try:
+        filters = reservation_filters(request.args)
+    except ValueError:
+        flash("Некорректные параметры фильтра", "error")
+        filters = {}
+
+    page = booking_service.get_reservations(hotel_id, "pending", filters)
 
-    return render_template("reception.html", hotel=hotel, reservations=reservations)
+    return render_template(
+        "reception.html",
+        hotel=hotel,
+        reservations=page["reservations"],
+        next_cursor=page["next_cursor"],
+        filters=request.args.to_dict(),
+    )
 
 
 @app.route("/reception/register-guests", methods=["POST"])
@@ -314,16 +490,20 @@ def register_guests_html():
         reservation_id = request.form.get("reservation_id")
         room_id = request.form.get("room_id")
         guest_ids = request.form.getlist("guest_ids")
+        hotel_id = request.form.get("hotel_id", type=int)
 
-        result = booking_service.register_guests(int(reservation_id), int(room_id), [int(gid) for gid in guest_ids])
+        result = booking_service.register_guests(
+            int(reservation_id), int(room_id), [int(gid) for gid in guest_ids], hotel_id
+        )
 
         if "error" in result:
             flash(f"Ошибка: {result['error']}", "error")
         else:
             flash("Гости успешно зарегистрированы!", "success")
 
-        reservation_info = reception_service.get_payment_info_for_reservation(int(reservation_id))
-        hotel_id = reservation_info.get("hotel_id", 1) if reservation_info else 1
+        if hotel_id is None:
+            reservation_info = reception_service.get_payment_info_for_reservation(int(reservation_id))
+            hotel_id = reservation_info.get("hotel_id", 1) if reservation_info else 1
 
         return redirect(url_for("reception_desk", hotel_id=hotel_id))
 
@@ -346,8 +526,21 @@ def reception_dashboard():
 @app.route("/reception/<city_name>")
 def reception_city(city_name):
     try:
-        reservations_list = reception_service.get_city_reservations(city_name)
-        return render_template("reception_city.html", city_name=city_name, reservations=reservations_list)
+        try:
+            filters = reservation_filters(request.args)
+        except ValueError:
+            flash("Некорректные параметры фильтра", "error")
+            filters = {}
+
+        page = reception_service.get_city_reservations(city_name, filters)
+        return render_template(
+            "reception_city.html",
+            city_name=city_name,
+            hotels=hotel_service.get_all_hotels(city_name),
+            reservations=page["reservations"],
+            next_cursor=page["next_cursor"],
+            filters=request.args.to_dict(),
+        )
     except Exception as e:
         logger.error(f"Error loading reception city {city_name}: {e}")
         return render_template("error.html", error=str(e))
@@ -356,22 +549,47 @@ def reception_city(city_name):
 @app.route("/api/health", methods=["GET"])
 def health_check():
     try:
+        nodes = db_manager.node_status()
+        degraded = any(node["state"] != "closed" for node in nodes.values())
         return jsonify(
             {
-                "status": "healthy",
+                "status": "degraded" if degraded else "healthy",
                 "message": "API is running",
                 "timestamp": datetime.now().isoformat(),
+                "nodes": nodes,
+                "pools": db_manager.pool_stats(),
+                "booking_locks": booking_service.lock_stats.snapshot(),
             }
         ), 200
     except Exception as e:
         return jsonify({"status": "unhealthy", "error": str(e)}), 500
 
 
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    return Response(registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.route("/api/admin/slow-queries", methods=["GET"])
+def slow_queries():
+    limit = request.args.get("limit", type=int)
+    return json_response({"threshold_ms": Config.SLOW_QUERY_THRESHOLD_MS, "queries": slow_query_log.entries(limit)})
+
+
+@app.route("/api/replication/status", methods=["GET"])
+def replication_status():
+    try:
+        return json_response(replication_monitor.status())
+    except Exception as e:
+        logger.error(f"Error getting replication status: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
 @app.route("/api/hotels", methods=["GET"])
 def get_hotels_api():
     city = request.args.get("city")
     hotels = hotel_service.get_all_hotels(city)
-    return jsonify(hotels)
+    return json_response(hotels)
 
 
 @app.route("/api/check-availability", methods=["GET"])
@@ -392,6 +610,71 @@ def check_availability_api():
     return jsonify(result)
 
 
+@app.route("/api/availability/batch", methods=["POST"])
+def check_availability_batch_api():
+    payload = request.get_json(silent=True) or {}
+    items = payload.get("items")
+
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "Expected a non-empty items list"}), 400
+    if len(items) > Config.AVAILABILITY_BATCH_MAX_ITEMS:
+        return jsonify({"error": f"Too many items, maximum is {Config.AVAILABILITY_BATCH_MAX_ITEMS}"}), 400
+
+    results = availability_service.check_availability_batch(items)
+    return json_response({"results": results})
+
+
+@app.route("/api/bookings", methods=["POST"])
+def create_booking_api():
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return jsonify({"error": "Expected a JSON object"}), 400
+
+    result = booking_service.create_group_booking(payload)
+    if "error" in result:
+        return jsonify(result), result.get("status", 400)
+
+    return jsonify(result), 201
+
+
+@app.route("/api/hotels/<int:hotel_id>/check-in", methods=["POST"])
+def check_in_api(hotel_id):
+    payload = request.get_json(silent=True) or {}
+    items = payload.get("items")
+
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "Expected a non-empty items list"}), 400
+    if len(items) > Config.CHECK_IN_BATCH_MAX_ITEMS:
+        return jsonify({"error": f"Too many items, maximum is {Config.CHECK_IN_BATCH_MAX_ITEMS}"}), 400
+
+    result = booking_service.check_in(hotel_id, items)
+    if "error" in result:
+        return jsonify(result), result.get("status", 400)
+
+    return jsonify(result)
+
+
+@app.route("/api/hotels/<int:hotel_id>/calendar", methods=["GET"])
+def get_availability_calendar_api(hotel_id):
+    # Период [from, to): to — дата выезда после последней ночи
+    start_date = request.args.get("from") or date.today().isoformat()
+    end_date = request.args.get("to")
+
+    if not end_date:
+        try:
+            start = datetime.strptime(start_date, "%Y-%m-%d").date()
+        except ValueError:
+            return jsonify({"error": "Invalid date format. Use YYYY-MM-DD"}), 400
+        end_date = (start + timedelta(days=Config.AVAILABILITY_CALENDAR_DEFAULT_DAYS)).isoformat()
+
+    result = availability_service.get_availability_calendar(hotel_id, start_date, end_date)
+
+    if "error" in result:
+        return jsonify(result), result.get("status", 400)
+
+    return json_response(result)
+
+
 @app.route("/hotels/<int:hotel_id>/rooms", methods=["GET"])
 def get_hotel_rooms(hotel_id):
     try:
@@ -407,7 +690,7 @@ def get_hotel_rooms(hotel_id):
                 category["available_rooms_count"] = category.get("room_count", 0)
                 category["price_per_night_with_coeff"] = category.get("price_per_night", 0)
 
-        return jsonify(categories)
+        return json_response(categories)
     except Exception as e:
         logger.error(f"Error getting hotel rooms: {e}")
         return jsonify({"error": str(e)}), 500
@@ -424,7 +707,7 @@ def get_available_rooms_api(hotel_id):
 
     rooms = availability_service.find_available_rooms(hotel_id, int(room_category_id), start_date, end_date)
 
-    return jsonify(rooms)
+    return json_response(rooms)
 
 
 @app.errorhandler(404)
@@ -437,12 +720,48 @@ def internal_server_error(e):
     return render_template("error.html", error=str(e)), 500
 
 
+@app.route("/api/reservations/export", methods=["GET"])
+def export_reservations_api():
+    city_name = request.args.get("city") or None
+    export_format = request.args.get("format", "ndjson")
+
+    if export_format not in ("ndjson", "csv"):
+        return jsonify({"error": "Unsupported format, use ndjson or csv"}), 400
+
+    try:
+        start = datetime.strptime(request.args["from"], "%Y-%m-%d").date() if request.args.get("from") else None
+        end = datetime.strptime(request.args["to"], "%Y-%m-%d").date() if request.args.get("to") else None
+    except ValueError:
+        return jsonify({"error": "Invalid date format. Use YYYY-MM-DD"}), 400
+
+    # Статус ответа уходит до первой строки, поэтому недоступность узлов проверяем заранее
+    db_names = reception_service.get_export_nodes(city_name)
+    unavailable = [db_name for db_name in db_names if not db_manager.is_available(db_name)]
+    if unavailable:
+        return jsonify({"error": f"Nodes unavailable: {', '.join(unavailable)}"}), 503
+
+    rows = reception_service.export_reservations(db_names, city_name, start, end)
+    if export_format == "csv":
+        chunks = csv_chunks(rows, reception_service.EXPORT_COLUMNS, Config.EXPORT_CHUNK_SIZE)
+        mimetype = "text/csv"
+    else:
+        chunks = ndjson_chunks(rows, Config.EXPORT_CHUNK_SIZE)
+        mimetype = "application/x-ndjson"
+
+    headers = {"Content-Disposition": f"attachment; filename=reservations.{export_format}"}
+    if "gzip" in request.headers.get("Accept-Encoding", ""):
+        chunks = gzip_chunks(chunks)
+        headers["Content-Encoding"] = "gzip"
+
+    return Response(chunks, mimetype=mimetype, headers=headers)
+
+
 @app.route("/api/reservations/<int:reservation_id>", methods=["GET"])
 def get_reservation_api(reservation_id):
     try:
         reservation = reception_service.get_payment_info_for_reservation(reservation_id)
         if reservation:
-            return jsonify(reservation)
+            return json_response(reservation)
         return jsonify({"error": "Reservation not found"}), 404
     except Exception as e:
         logger.error(f"Error getting reservation: {e}")
@@ -471,4 +790,4 @@ def reservation_details(reservation_id):
 
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=True)
+    create_app().run(host="0.0.0.0", port=5000, debug=True)
@@ -0,0 +1,199 @@
+import logging
+from datetime import date, datetime, timedelta
+
+from quart import Quart, Response, jsonify, request
+from quart_cors import cors
+
+from async_database import AsyncDatabaseManager
+from config import Config
+from database import db_manager
+from notifications import ChangeListener
+from pagination import reservation_filters
+from reference_cache import ReferenceDataCache
+from routing import HotelRouter
+from serialization import dumps
+from services.async_availability_service import AsyncAvailabilityService
+from services.async_hotel_service import AsyncHotelService
+from services.async_reception_service import AsyncReceptionService
+
+# Асинхронный вариант JSON API: запросы к узлам выполняются через asyncpg без блокировки потока
+app = cors(Quart(__name__))
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+async_db_manager = AsyncDatabaseManager()
+
+# Справочники и карта отелей общие с синхронным приложением и перечитываются в фоне по уведомлениям
+change_listener = ChangeListener()
+hotel_router = HotelRouter(db_manager)
+hotel_router.attach(change_listener)
+reference_cache = ReferenceDataCache(db_manager)
+reference_cache.attach(change_listener)
+
+availability_service = AsyncAvailabilityService(async_db_manager, hotel_router, reference_cache)
+hotel_service = AsyncHotelService(async_db_manager, hotel_router, reference_cache)
+reception_service = AsyncReceptionService(async_db_manager, hotel_router)
+
+
+def json_response(payload, status: int = 200) -> Response:
+    return Response(dumps(payload), status=status, mimetype="application/json")
+
+
+@app.before_serving
+async def startup():
+    await async_db_manager.open()
+    change_listener.start()
+
+
+@app.after_serving
+async def shutdown():
+    change_listener.stop()
+    await async_db_manager.close()
+    db_manager.close_all(Config.WEB_GRACEFUL_TIMEOUT)
+    logger.info("Database connections closed")
+
+
+@app.route("/api/health", methods=["GET"])
+async def health_check():
+    try:
+        nodes = async_db_manager.node_status()
+        degraded = any(node["state"] != "closed" for node in nodes.values())
+        return jsonify(
+            {
+                "status": "degraded" if degraded else "healthy",
+                "message": "API is running",
+                "timestamp": datetime.now().isoformat(),
+                "nodes": nodes,
+                "pools": async_db_manager.pool_stats(),
+            }
+        ), 200
+    except Exception as e:
+        return jsonify({"status": "unhealthy", "error": str(e)}), 500
+
+
+@app.route("/api/hotels", methods=["GET"])
+async def get_hotels_api():
+    city = request.args.get("city")
+    hotels = await hotel_service.get_all_hotels(city)
+    return json_response(hotels)
+
+
+@app.route("/api/hotels/<int:hotel_id>/rooms", methods=["GET"])
+async def get_hotel_rooms_api(hotel_id):
+    start_date = request.args.get("start_date")
+    end_date = request.args.get("end_date")
+
+    if start_date and end_date:
+        categories = await availability_service.get_available_room_categories(hotel_id, start_date, end_date)
+    else:
+        categories = await hotel_service.get_hotel_room_categories_with_counts(hotel_id)
+
+        for category in categories:
+            category["available_rooms_count"] = category.get("room_count", 0)
+            category["price_per_night_with_coeff"] = category.get("price_per_night", 0)
+
+    return json_response(categories)
+
+
+@app.route("/api/hotels/<int:hotel_id>/amenities", methods=["GET"])
+async def get_hotel_amenities_api(hotel_id):
+    amenities = await hotel_service.get_hotel_amenities(hotel_id)
+    return json_response(amenities)
+
+
+@app.route("/api/check-availability", methods=["GET"])
+async def check_availability_api():
+    hotel_id = request.args.get("hotel_id")
+    room_category_id = request.args.get("room_category_id")
+    start_date = request.args.get("start_date")
+    end_date = request.args.get("end_date")
+
+    if not all([hotel_id, room_category_id, start_date, end_date]):
+        return jsonify({"error": "Missing required parameters"}), 400
+
+    result = await availability_service.check_room_availability(
+        int(hotel_id), int(room_category_id), start_date, end_date
+    )
+
+    if "error" in result:
+        return jsonify(result), result.get("status", 400)
+
+    return jsonify(result)
+
+
+@app.route("/api/availability/batch", methods=["POST"])
+async def check_availability_batch_api():
+    payload = await request.get_json(silent=True) or {}
+    items = payload.get("items")
+
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "Expected a non-empty items list"}), 400
+    if len(items) > Config.AVAILABILITY_BATCH_MAX_ITEMS:
+        return jsonify({"error": f"Too many items, maximum is {Config.AVAILABILITY_BATCH_MAX_ITEMS}"}), 400
+
+    results = await availability_service.check_availability_batch(items)
+    return json_response({"results": results})
+
+
+@app.route("/api/hotels/<int:hotel_id>/calendar", methods=["GET"])
+async def get_availability_calendar_api(hotel_id):
+    start_date = request.args.get("from") or date.today().isoformat()
+    end_date = request.args.get("to")
+
+    if not end_date:
+        try:
+            start = datetime.strptime(start_date, "%Y-%m-%d").date()
+        except ValueError:
+            return jsonify({"error": "Invalid date format. Use YYYY-MM-DD"}), 400
+        end_date = (start + timedelta(days=Config.AVAILABILITY_CALENDAR_DEFAULT_DAYS)).isoformat()
+
+    result = await availability_service.get_availability_calendar(hotel_id, start_date, end_date)
+
+    if "error" in result:
+        return jsonify(result), result.get("status", 400)
+
+    return json_response(result)
+
+
+@app.route("/api/available-rooms/<int:hotel_id>")
+async def get_available_rooms_api(hotel_id):
+    room_category_id = request.args.get("room_category_id")
+    start_date = request.args.get("start_date")
+    end_date = request.args.get("end_date")
+
+    if not all([room_category_id, start_date, end_date]):
+        return jsonify({"error": "Missing parameters"}), 400
+
+    rooms = await availability_service.find_available_rooms(hotel_id, int(room_category_id), start_date, end_date)
+
+    return json_response(rooms)
+
+
+@app.route("/api/reception/cities", methods=["GET"])
+async def get_reception_cities_api():
+    cities = await reception_service.get_cities_with_reservations_count()
+    return json_response(cities)
+
+
+@app.route("/api/reception/<city_name>/reservations", methods=["GET"])
+async def get_city_reservations_api(city_name):
+    try:
+        filters = reservation_filters(request.args)
+    except ValueError:
+        return jsonify({"error": "Invalid filter parameters"}), 400
+
+    page = await reception_service.get_city_reservations(city_name, filters)
+    return json_response(page)
+
+
+@app.route("/api/reservations/<int:reservation_id>/details", methods=["GET"])
+async def get_reservation_details_api(reservation_id):
+    reservation = await reception_service.get_reservation_details_with_payment(reservation_id)
+    if not reservation:
+        return jsonify({"error": "Reservation not found"}), 404
+    return json_response(reservation)
+
+
+if __name__ == "__main__":
+    app.run(host="0.0.0.0", port=5001)
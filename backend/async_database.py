@@ -0,0 +1,165 @@
+import asyncio
+import json
+import logging
+from contextlib import asynccontextmanager
+
+import asyncpg
+
+from config import Config
+from database import CircuitBreaker, NodeUnavailableError, PoolTimeoutError
+from serialization import RowSerializer
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncDatabaseManager:
+    """Асинхронные пулы соединений asyncpg ко всем узлам распределенной БД"""
+
+    def __init__(self):
+        self.pools = {}
+        self.breakers = {
+            name: CircuitBreaker(
+                name,
+                Config.DB_BREAKER_THRESHOLD,
+                Config.DB_BREAKER_BASE_DELAY,
+                Config.DB_BREAKER_MAX_DELAY,
+                Config.DB_BREAKER_PROBE_TIMEOUT,
+            )
+            for name in Config.DATABASES
+        }
+        self._locks = {name: asyncio.Lock() for name in Config.DATABASES}
+
+    async def open(self) -> None:
+        await asyncio.gather(*(self._get_pool(name) for name in Config.DATABASES), return_exceptions=True)
+
+    async def close(self) -> None:
+        pools, self.pools = self.pools, {}
+        await asyncio.gather(*(pool.close() for pool in pools.values()), return_exceptions=True)
+
+    @staticmethod
+    async def _init_connection(conn) -> None:
+        # jsonb приходит строкой по умолчанию, декодируем как psycopg2
+        await conn.set_type_codec("jsonb", encoder=json.dumps, decoder=json.loads, schema="pg_catalog")
+        await conn.set_type_codec("json", encoder=json.dumps, decoder=json.loads, schema="pg_catalog")
+
+    async def _get_pool(self, db_name: str):
+        pool = self.pools.get(db_name)
+        if pool is not None:
+            return pool
+
+        breaker = self.breakers.get(db_name)
+        if breaker is None or not breaker.allow():
+            raise NodeUnavailableError(f"Database {db_name} not available")
+
+        async with self._locks[db_name]:
+            pool = self.pools.get(db_name)
+            if pool is not None:
+                return pool
+
+            min_size, max_size = Config.DB_POOL_SIZES[db_name]
+            try:
+                pool = await asyncpg.create_pool(
+                    Config.DATABASES[db_name],
+                    min_size=min(min_size, max_size),
+                    max_size=max(max_size, 1),
+                    timeout=Config.DB_CONNECT_TIMEOUT,
+                    max_inactive_connection_lifetime=Config.DB_POOL_CHECK_IDLE_AFTER * 10,
+                    init=self._init_connection,
+                )
+            except (TimeoutError, OSError, asyncpg.PostgresError) as e:
+                logger.error(f"Failed to connect to {db_name}: {e}")
+                breaker.record_failure(e)
+                raise NodeUnavailableError(f"Database {db_name} not available") from e
+
+            breaker.record_success()
+            self.pools[db_name] = pool
+            logger.info(f"Connected to {db_name} database (async)")
+            return pool
+
+    @asynccontextmanager
+    async def acquire(self, db_name: str = "central"):
+        pool = await self._get_pool(db_name)
+        breaker = self.breakers[db_name]
+
+        try:
+            conn = await pool.acquire(timeout=Config.DB_POOL_TIMEOUT)
+        except TimeoutError as e:
+            raise PoolTimeoutError(f"Timed out waiting for a {db_name} connection") from e
+        except (OSError, asyncpg.PostgresConnectionError) as e:
+            breaker.record_failure(e)
+            raise NodeUnavailableError(f"Database {db_name} not available") from e
+
+        try:
+            yield conn
+            breaker.record_success()
+        except (OSError, asyncpg.PostgresConnectionError, asyncpg.InterfaceError) as e:
+            breaker.record_failure(e)
+            logger.error(f"Database error in {db_name}: {e}")
+            raise
+        except Exception as e:
+            # Узел ответил (ошибка SQL или приложения): пробная попытка считается успешной
+            breaker.record_success()
+            logger.error(f"Database error in {db_name}: {e}")
+            raise
+        finally:
+            await pool.release(conn)
+
+    async def fetch(self, db_name: str, query: str, *args) -> list:
+        async with self.acquire(db_name) as conn:
+            return await conn.fetch(query, *args)
+
+    async def fetchrow(self, db_name: str, query: str, *args):
+        async with self.acquire(db_name) as conn:
+            return await conn.fetchrow(query, *args)
+
+    async def fetch_serialized(self, db_name: str, query: str, *args, time_format: str = "%H:%M:%S") -> list[dict]:
+        async with self.acquire(db_name) as conn:
+            statement = await conn.prepare(query)
+            rows = await statement.fetch(*args)
+            return RowSerializer.for_statement(statement, time_format).rows(rows)
+
+    async def fetchrow_serialized(self, db_name: str, query: str, *args, time_format: str = "%H:%M:%S") -> dict | None:
+        async with self.acquire(db_name) as conn:
+            statement = await conn.prepare(query)
+            row = await statement.fetchrow(*args)
+            return RowSerializer.for_statement(statement, time_format).row(row) if row is not None else None
+
+    def is_available(self, db_name: str) -> bool:
+        breaker = self.breakers.get(db_name)
+        return breaker is not None and not breaker.is_open()
+
+    def node_status(self) -> dict:
+        return {name: breaker.snapshot() for name, breaker in self.breakers.items()}
+
+    def pool_stats(self) -> dict:
+        return {
+            name: {
+                "size": pool.get_size(),
+                "idle": pool.get_idle_size(),
+                "min_size": pool.get_min_size(),
+                "max_size": pool.get_max_size(),
+            }
+            for name, pool in self.pools.items()
+        }
+
+
+async def resolve_db_name(router, hotel_id) -> str:
+    # Карта отелей в памяти; перечитывание при промахе синхронное, поэтому уводим его в поток
+    city_name = router.get_cached_city(hotel_id)
+    if city_name is None:
+        city_name = await asyncio.to_thread(router.get_city, hotel_id)
+    return router.get_db_name_by_city(city_name)
+
+
+async def ensure_reference(reference_cache, *tables: str) -> None:
+    # После этого синхронные геттеры кэша отвечают из памяти, не блокируя цикл событий
+    stale = [table for table in tables if not reference_cache.is_fresh(table)]
+    if stale:
+        await asyncio.gather(*(asyncio.to_thread(reference_cache.load, table) for table in stale))
+
+
+def numbered(query: str, *names: str) -> str:
+    # Именованные параметры psycopg2 -> позиционные $n asyncpg в порядке names
+    for index, name in enumerate(names, 1):
+        query = query.replace(f"%({name})s", f"${index}")
+    return query
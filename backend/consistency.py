@@ -0,0 +1,47 @@
+from contextvars import ContextVar
+
+
+def parse_lsn(lsn: str) -> int:
+    high, _, low = lsn.partition("/")
+    return (int(high, 16) << 32) + int(low, 16)
+
+
+def format_lsn(value: int) -> str:
+    return f"{value >> 32:X}/{value & 0xFFFFFFFF:X}"
+
+
+class WriteSession:
+    """LSN последних записей сессии на филиалах, еще не подтвержденные на центральном узле"""
+
+    def __init__(self, pending: dict[str, int] | None = None, track_writes: bool = False):
+        self.pending = pending or {}
+        self.track_writes = track_writes
+        self.changed = False
+
+    @classmethod
+    def from_cookie(cls, value: str | None, known_nodes, track_writes: bool = False) -> "WriteSession":
+        # Формат: filial1:0/16B3748,filial2:0/1A00000; неизвестные узлы и испорченные значения пропускаются
+        pending = {}
+        for item in (value or "").split(","):
+            db_name, _, lsn = item.partition(":")
+            if db_name in known_nodes:
+                try:
+                    pending[db_name] = parse_lsn(lsn)
+                except ValueError:
+                    continue
+        return cls(pending, track_writes)
+
+    def to_cookie(self) -> str:
+        return ",".join(f"{db_name}:{format_lsn(lsn)}" for db_name, lsn in sorted(self.pending.items()))
+
+    def record_write(self, db_name: str, lsn: int) -> None:
+        if lsn > self.pending.get(db_name, 0):
+            self.pending[db_name] = lsn
+            self.changed = True
+
+    def confirm(self, db_name: str) -> None:
+        if self.pending.pop(db_name, None) is not None:
+            self.changed = True
+
+
+current_session: ContextVar[WriteSession | None] = ContextVar("current_session", default=None)
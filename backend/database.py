@@ -1,65 +1,578 @@
+import contextlib
+import heapq
 import logging
+import os
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
 from contextlib import contextmanager
+from itertools import islice
 
 import psycopg2
+from psycopg2 import errors, extensions, sql
 from psycopg2.extras import RealDictCursor
 
 from config import Config
+from consistency import current_session, parse_lsn
+from metrics import DB_QUERY_DURATION, DB_QUERY_ERRORS
+from slow_queries import slow_query_log
 
 logger = logging.getLogger(__name__)
 
 
+class PoolTimeoutError(Exception):
+    pass
+
+
+class NodeUnavailableError(Exception):
+    pass
+
+
+# Кадры, которые пропускаются при поиске вызывающего метода
+_INTERNAL_FILES = frozenset((__file__, contextlib.__file__))
+
+
+def _caller() -> str:
+    frame = sys._getframe(1)
+    while frame is not None and frame.f_code.co_filename in _INTERNAL_FILES:
+        frame = frame.f_back
+    return frame.f_code.co_qualname if frame is not None else "unknown"
+
+
+class TimedCursor(RealDictCursor):
+    """Курсор, замеряющий время каждого запроса по узлу и вызывающему методу; медленные попадают в журнал"""
+
+    node = None
+    caller = None
+
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        except Exception:
+            DB_QUERY_ERRORS.inc((self.node, self.caller))
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            DB_QUERY_DURATION.observe((self.node, self.caller), elapsed)
+            if elapsed >= slow_query_log.threshold > 0:
+                # Сбой журнала не должен подменять ошибку запроса или ронять успешный запрос
+                try:
+                    slow_query_log.record(self, query, vars, elapsed)
+                except Exception as e:
+                    logger.warning(f"Failed to record slow query on {self.node}: {e}")
+
+
+class CircuitBreaker:
+    """Автоматический выключатель узла с экспоненциальной задержкой переподключения"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, threshold: int, base_delay: float, max_delay: float, probe_timeout: float):
+        self.name = name
+        self.threshold = max(threshold, 1)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.probe_timeout = probe_timeout
+
+        self._lock = threading.Lock()
+        self.state = self.CLOSED
+        self.failures = 0
+        self.open_until = 0.0
+        self.last_error = None
+
+    def allow(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+        with self._lock:
+            if self.state != self.CLOSED and time.monotonic() >= self.open_until:
+                # Пропускаем одну пробную попытку, остальные запросы получают отказ сразу. Если исход пробы
+                # не записан за probe_timeout (попытка потеряна), пропускается следующая
+                self.state = self.HALF_OPEN
+                self.open_until = time.monotonic() + self.probe_timeout
+                return True
+            return self.state == self.CLOSED
+
+    def is_open(self) -> bool:
+        # True, пока allow() отказывает: узел выключен или уже проверяется пробной попыткой
+        return self.state != self.CLOSED and time.monotonic() < self.open_until
+
+    def record_success(self) -> None:
+        if self.state == self.CLOSED and not self.failures:
+            return
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info(f"Database {self.name} is available again")
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self, error: Exception) -> None:
+        with self._lock:
+            self.failures += 1
+            self.last_error = str(error).strip()
+            if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+                exponent = max(self.failures - self.threshold, 0)
+                delay = min(self.base_delay * 2**exponent, self.max_delay)
+                self.state = self.OPEN
+                self.open_until = time.monotonic() + delay
+                logger.warning(f"Database {self.name} marked unavailable for {delay:.1f}s: {self.last_error}")
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "state": self.state,
+                "failures": self.failures,
+                "retry_in": round(max(self.open_until - time.monotonic(), 0.0), 3) if self.state == self.OPEN else 0.0,
+                "last_error": self.last_error,
+            }
+
+
+class ConnectionPool:
+    """Потокобезопасный пул соединений к одному узлу"""
+
+    def __init__(self, name: str, url: str, min_size: int, max_size: int, timeout: float):
+        self.name = name
+        self.url = url
+        self.min_size = min_size
+        self.max_size = max(max_size, 1)
+        self.timeout = timeout
+        self.breaker = CircuitBreaker(
+            name,
+            Config.DB_BREAKER_THRESHOLD,
+            Config.DB_BREAKER_BASE_DELAY,
+            Config.DB_BREAKER_MAX_DELAY,
+            Config.DB_BREAKER_PROBE_TIMEOUT,
+        )
+
+        self._cond = threading.Condition()
+        self._idle = deque()
+        self._in_use = 0
+        self._waits = 0
+        self._timeouts = 0
+        self._wait_time_total = 0.0
+        self._wait_time_max = 0.0
+
+        for _ in range(min(self.min_size, self.max_size)):
+            try:
+                self._idle.append((self._open(), time.monotonic()))
+            except NodeUnavailableError:
+                break
+        else:
+            logger.info(f"Connected to {name} database")
+
+    def _open(self):
+        try:
+            conn = psycopg2.connect(self.url, cursor_factory=TimedCursor, connect_timeout=Config.DB_CONNECT_TIMEOUT)
+        except psycopg2.Error as e:
+            logger.error(f"Failed to connect to {self.name}: {e}")
+            self.breaker.record_failure(e)
+            raise NodeUnavailableError(f"Database {self.name} not available") from e
+        self.breaker.record_success()
+        return conn
+
+    def _is_alive(self, conn, idle_since: float) -> bool:
+        if conn.closed:
+            return False
+        if time.monotonic() - idle_since < Config.DB_POOL_CHECK_IDLE_AFTER:
+            return True
+        try:
+            # Служебная проверка соединения не учитывается в метриках запросов
+            with conn.cursor(cursor_factory=extensions.cursor) as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self):
+        if not self.breaker.allow():
+            raise NodeUnavailableError(f"Database {self.name} not available")
+
+        started = time.monotonic()
+        deadline = started + self.timeout
+        waited = False
+        conn = None
+
+        with self._cond:
+            while True:
+                if self._idle:
+                    conn, idle_since = self._idle.pop()
+                    break
+                if self._in_use < self.max_size:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    error = PoolTimeoutError(f"Timed out waiting for a {self.name} connection")
+                    if self.breaker.state == CircuitBreaker.HALF_OPEN:
+                        # Пробная попытка не дождалась соединения: узел снова выключается до следующей пробы
+                        self.breaker.record_failure(error)
+                    raise error
+                waited = True
+                self._cond.wait(remaining)
+
+            self._in_use += 1
+            if waited:
+                wait_time = time.monotonic() - started
+                self._waits += 1
+                self._wait_time_total += wait_time
+                self._wait_time_max = max(self._wait_time_max, wait_time)
+
+        try:
+            if conn is not None and not self._is_alive(conn, idle_since):
+                self._close(conn)
+                conn = None
+            if conn is None:
+                conn = self._open()
+        except Exception:
+            self._release()
+            raise
+
+        return conn
+
+    def putconn(self, conn, discard: bool = False) -> None:
+        reusable = (
+            not discard and not conn.closed and conn.get_transaction_status() == extensions.TRANSACTION_STATUS_IDLE
+        )
+        if reusable:
+            with self._cond:
+                self._idle.append((conn, time.monotonic()))
+        else:
+            self._close(conn)
+        self._release()
+
+    def _release(self) -> None:
+        with self._cond:
+            self._in_use -= 1
+            self._cond.notify_all()
+
+    @staticmethod
+    def _close(conn) -> None:
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def drain(self, timeout: float) -> bool:
+        with self._cond:
+            return self._cond.wait_for(lambda: self._in_use == 0, timeout)
+
+    def closeall(self) -> None:
+        with self._cond:
+            idle = list(self._idle)
+            self._idle.clear()
+        for conn, _ in idle:
+            self._close(conn)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "waits": self._waits,
+                "timeouts": self._timeouts,
+                "wait_time_total": round(self._wait_time_total, 6),
+                "wait_time_max": round(self._wait_time_max, 6),
+            }
+
+
 class DatabaseManager:
     """Менеджер для работы с распределенной БД"""
 
     def __init__(self):
-        self.connections = {}
-        self._connect_all()
-
-    def _connect_all(self):
-        databases = {
-            "central": Config.CENTRAL_DB_URL,
-            "filial1": Config.FILIAL1_DB_URL,
-            "filial2": Config.FILIAL2_DB_URL,
-            "filial3": Config.FILIAL3_DB_URL,
-        }
+        # Соединения открываются лениво в том процессе, который их использует: после fork воркер создает свои
+        self.pools = {}
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._applied = {}
+        self._applied_at = 0.0
+        self._applied_lock = threading.Lock()
 
-        for name, url in databases.items():
-            try:
-                conn = psycopg2.connect(url, cursor_factory=RealDictCursor)
-                self.connections[name] = conn
-                logger.info(f"Connected to {name} database")
-            except Exception as e:
-                logger.error(f"Failed to connect to {name}: {e}")
-                self.connections[name] = None
+    def open(self) -> None:
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # Унаследованные от родителя сокеты не закрываем: close() завершил бы сессию родительского процесса
+            pools = {}
+            for name, url in Config.DATABASES.items():
+                min_size, max_size = Config.DB_POOL_SIZES[name]
+                pools[name] = ConnectionPool(name, url, min_size, max_size, Config.DB_POOL_TIMEOUT)
+            self.pools = pools
+            self._executor = ThreadPoolExecutor(max_workers=Config.DB_SCATTER_WORKERS, thread_name_prefix="scatter")
+            self._pid = os.getpid()
+
+    def pool_stats(self) -> dict:
+        self.open()
+        return {name: pool.stats() for name, pool in self.pools.items()}
 
-    def get_db_by_city(self, city_name):
-        db_name = Config.CITY_TO_DB.get(city_name, "central")
-        return self.connections.get(db_name)
+    def is_available(self, db_name: str) -> bool:
+        self.open()
+        pool = self.pools.get(db_name)
+        return pool is not None and not pool.breaker.is_open()
 
-    def get_central_db(self):
-        return self.connections.get("central")
+    def node_status(self) -> dict:
+        self.open()
+        return {name: pool.breaker.snapshot() for name, pool in self.pools.items()}
+
+    def filial_names(self) -> list[str]:
+        return [name for name in Config.DATABASES if name != "central"]
+
+    def close_all(self, timeout: float = 0.0) -> None:
+        if self._pid != os.getpid():
+            return
+        with self._lock:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            deadline = time.monotonic() + timeout
+            for name, pool in self.pools.items():
+                if not pool.drain(max(deadline - time.monotonic(), 0.0)):
+                    logger.warning(f"Closing {name} pool with {pool.stats()['in_use']} connections still in use")
+                pool.closeall()
+            self.pools = {}
+            self._executor = None
+            self._pid = None
 
     @contextmanager
-    def get_cursor(self, db_name="central"):
-        conn = self.connections.get(db_name)
-        if not conn or conn.closed:
-            self._connect_all()
-            conn = self.connections.get(db_name)
+    def get_cursor(self, db_name="central", name: str | None = None, caller: str | None = None):
+        self.open()
+        pool = self.pools.get(db_name)
+        if pool is None:
+            raise NodeUnavailableError(f"Database {db_name} not available")
 
-        if not conn:
-            raise Exception(f"Database {db_name} not available")
+        conn = pool.getconn()
 
-        cursor = conn.cursor()
+        cursor = None
+        discard = False
         try:
+            # Именованный курсор — серверный: строки забираются порциями по itersize, а не целиком
+            cursor = conn.cursor(name=name) if name else conn.cursor()
+            cursor.node = db_name
+            cursor.caller = caller or _caller()
             yield cursor
-            conn.commit()
+            self._commit(conn, db_name)
+            pool.breaker.record_success()
+        except GeneratorExit:
+            # Потребитель бросил чтение на середине (например, клиент закрыл потоковый ответ)
+            try:
+                conn.rollback()
+                pool.breaker.record_success()
+            except psycopg2.Error as e:
+                discard = True
+                pool.breaker.record_failure(e)
+            raise
         except Exception as e:
-            conn.rollback()
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                discard = True
+            # Ошибка SQL или приложения при живом соединении — узел ответил; недоступен он только при разрыве
+            if conn.closed:
+                discard = True
+                pool.breaker.record_failure(e)
+            else:
+                pool.breaker.record_success()
             logger.error(f"Database error in {db_name}: {e}")
             raise
         finally:
-            cursor.close()
+            if cursor is not None and not cursor.closed:
+                try:
+                    cursor.close()
+                except psycopg2.Error:
+                    # Серверный курсор уже закрыт вместе с транзакцией
+                    pass
+            pool.putconn(conn, discard=discard)
+
+    def _commit(self, conn, db_name: str) -> None:
+        session = current_session.get()
+        if session is None or not session.track_writes or db_name == "central":
+            conn.commit()
+            return
+
+        # Запоминаем позицию WAL после записывающей транзакции: по ней решается, видит ли центральный узел запись
+        check = conn.cursor(cursor_factory=extensions.cursor)
+        try:
+            check.execute("SELECT txid_current_if_assigned() IS NOT NULL")
+            wrote = check.fetchone()[0]
+            conn.commit()
+            if wrote:
+                check.execute("SELECT pg_current_wal_lsn()::text")
+                session.record_write(db_name, parse_lsn(check.fetchone()[0]))
+                conn.rollback()
+        finally:
+            check.close()
+
+    def applied_lsns(self) -> dict[str, int]:
+        # Позиции филиалов, до которых центральный узел применил все их подписки; кэшируется на короткое время
+        now = time.monotonic()
+        if now - self._applied_at < Config.REPLICATION_LSN_REFRESH:
+            return self._applied
+
+        with self._applied_lock:
+            if now - self._applied_at < Config.REPLICATION_LSN_REFRESH:
+                return self._applied
+            applied = {}
+            try:
+                with self.get_cursor("central") as cursor:
+                    cursor.execute(
+                        # Подписки центрального узла создаются setup_subscriptions.sh в корне репозитория:
+                        # sub_<филиал>_<таблицы> и sub_guests_from_<филиал>. Учитываются только ведущие
+                        # apply-процессы: у параллельных (PG16, leader_pid) позиция не заполняется
+                        r"""
+                        SELECT
+                            f.name,
+                            CASE WHEN COUNT(s.subid) > 0 AND bool_and(s.latest_end_lsn IS NOT NULL)
+                                THEN MIN(s.latest_end_lsn)::text
+                            END AS lsn
+                        FROM unnest(%s::text[]) AS f(name)
+                        LEFT JOIN pg_stat_subscription s
+                            ON s.relid IS NULL AND s.leader_pid IS NULL
+                            AND (s.subname LIKE 'sub\_' || f.name || '\_%%' OR s.subname = 'sub_guests_from_' || f.name)
+                        GROUP BY f.name
+                    """,
+                        (self.filial_names(),),
+                    )
+                    applied = {row["name"]: parse_lsn(row["lsn"]) for row in cursor.fetchall() if row["lsn"]}
+            except Exception as e:
+                logger.warning(f"Failed to read applied LSN on central: {e}")
+            self._applied = applied
+            self._applied_at = time.monotonic()
+            return applied
+
+    def read_nodes(self) -> list[str]:
+        # Узлы для чтения после записи: филиалы с еще не доехавшими до центра записями сессии, затем центральный
+        session = current_session.get()
+        if session is None or not session.pending:
+            return ["central"]
+
+        applied = self.applied_lsns()
+        nodes = []
+        for db_name, lsn in list(session.pending.items()):
+            if applied.get(db_name, -1) >= lsn:
+                session.confirm(db_name)
+            else:
+                nodes.append(db_name)
+        return nodes + ["central"]
+
+    def scatter_gather(
+        self,
+        query: str,
+        params=None,
+        nodes: list[str] | None = None,
+        order_by: list[str] | None = None,
+        descending: bool = False,
+        limit: int | None = None,
+        timeout: float | None = None,
+    ) -> dict:
+        self.open()
+        nodes = nodes or self.filial_names()
+        timeout = timeout or Config.DB_SCATTER_TIMEOUT
+
+        statement = sql.SQL(query)
+        if order_by:
+            # Сортировку и лимит выполняет каждый узел, здесь остается только слияние отсортированных потоков
+            direction = sql.SQL(" DESC" if descending else "")
+            statement = sql.SQL("SELECT * FROM ({}) AS scatter ORDER BY {}").format(
+                statement, sql.SQL(", ").join(sql.Identifier(column) + direction for column in order_by)
+            )
+        if limit is not None:
+            statement = sql.SQL("{} LIMIT {}").format(statement, sql.Literal(limit))
+
+        caller = _caller()
+        futures = {
+            name: self._executor.submit(self._run_on_node, name, statement, params, timeout, caller) for name in nodes
+        }
+        status, results = self._wait_nodes(futures, timeout)
+
+        streams = []
+        columns = None
+        for name, node in status.items():
+            if name not in results:
+                node["rows"] = 0
+                continue
+            rows, elapsed, node_columns = results[name]
+            node.update(rows=len(rows), elapsed=round(elapsed, 6))
+            streams.append(rows)
+            columns = columns or node_columns
+
+        if order_by:
+
+            def key(row):
+                # NULL в конце при ASC и в начале при DESC, как в PostgreSQL
+                return tuple((row[column] is None, row[column]) for column in order_by)
+
+            merged = heapq.merge(*streams, key=key, reverse=descending)
+        else:
+            merged = (row for rows in streams for row in rows)
+
+        return {
+            "rows": list(islice(merged, limit)),
+            "columns": columns or [],
+            "nodes": status,
+            "partial": any(node["status"] != "ok" for node in status.values()),
+        }
+
+    def run_on_nodes(
+        self, operation, nodes: list[str] | None = None, timeout: float | None = None
+    ) -> tuple[dict, dict]:
+        # operation(cursor, db_name) выполняется параллельно на каждом узле в своей транзакции
+        self.open()
+        nodes = list(self.pools) if nodes is None else nodes
+        timeout = timeout or Config.DB_SCATTER_TIMEOUT
+
+        caller = _caller()
+        futures = {name: self._executor.submit(self._call_on_node, name, operation, timeout, caller) for name in nodes}
+        status, results = self._wait_nodes(futures, timeout)
+        for name, node in status.items():
+            if name in results:
+                results[name], elapsed = results[name]
+                node["elapsed"] = round(elapsed, 6)
+        return status, results
+
+    def _wait_nodes(self, futures: dict, timeout: float) -> tuple[dict, dict]:
+        wait(futures.values(), timeout=timeout + 1)
+
+        status = {}
+        results = {}
+        for name, future in futures.items():
+            if not future.done():
+                future.cancel()
+                status[name] = {"status": "timeout", "error": f"No response within {timeout}s"}
+                continue
+            try:
+                results[name] = future.result()
+            except (NodeUnavailableError, PoolTimeoutError) as e:
+                status[name] = {"status": "unavailable", "error": str(e)}
+            except errors.QueryCanceled as e:
+                status[name] = {"status": "timeout", "error": str(e).strip()}
+            except Exception as e:
+                status[name] = {"status": "error", "error": str(e).strip()}
+            else:
+                status[name] = {"status": "ok"}
+        return status, results
+
+    def _call_on_node(self, db_name: str, operation, timeout: float, caller: str):
+        started = time.monotonic()
+        with self.get_cursor(db_name, caller=caller) as cursor:
+            cursor.execute("SET LOCAL statement_timeout = %s", (int(timeout * 1000),))
+            result = operation(cursor, db_name)
+        return result, time.monotonic() - started
+
+    def _run_on_node(self, db_name: str, statement, params, timeout: float, caller: str) -> tuple[list, float, list]:
+        started = time.monotonic()
+        with self.get_cursor(db_name, caller=caller) as cursor:
+            cursor.execute("SET LOCAL statement_timeout = %s", (int(timeout * 1000),))
+            cursor.execute(statement, params)
+            rows = cursor.fetchall()
+            columns = [(column.name, column.type_code) for column in cursor.description]
+        return rows, time.monotonic() - started, columns
 
 
 db_manager = DatabaseManager()
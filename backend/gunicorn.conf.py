@@ -0,0 +1,37 @@
+from config import Config
+
+# Приложение создается в каждом воркере после fork, поэтому preload отключен
+wsgi_app = "app:create_app()"
+preload_app = False
+
+bind = Config.WEB_BIND
+workers = Config.WEB_WORKERS
+threads = Config.WEB_THREADS
+timeout = Config.WEB_TIMEOUT
+graceful_timeout = Config.WEB_GRACEFUL_TIMEOUT
+
+
+def connection_budget() -> dict[str, int]:
+    # На воркер: пул узла, соединения выборочного EXPLAIN и LISTEN на центральном узле
+    return {
+        name: Config.WEB_WORKERS * (max_size + Config.SLOW_QUERY_EXPLAIN_WORKERS + (name == "central"))
+        for name, (_, max_size) in Config.DB_POOL_SIZES.items()
+    }
+
+
+def on_starting(server):
+    budget = connection_budget()
+    server.log.info(f"Database connections per node with {Config.WEB_WORKERS} worker(s): {budget}")
+    exceeded = {name: count for name, count in budget.items() if count > Config.DB_CONNECTION_LIMIT}
+    if exceeded:
+        # RuntimeError завершает gunicorn с сообщением об ошибке до запуска воркеров
+        raise RuntimeError(
+            f"Connection budget exceeds DB_CONNECTION_LIMIT={Config.DB_CONNECTION_LIMIT} on {exceeded}: "
+            "lower WEB_WORKERS or DB_POOL_MAX"
+        )
+
+
+def worker_exit(server, worker):
+    from app import shutdown
+
+    shutdown(Config.WEB_GRACEFUL_TIMEOUT)
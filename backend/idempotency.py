@@ -0,0 +1,184 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from psycopg2.extras import Json
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+IN_PROGRESS = {"error": "A request with this idempotency key is already in progress", "status": 409}
+NOT_SAVED = {
+    "error": "The request was processed, but its result was not saved; retry with the same idempotency key",
+    "status": 503,
+}
+
+
+class IdempotencyStore:
+    """Результаты запросов по ключу идемпотентности: таблица idempotency_keys на узле и LRU в процессе"""
+
+    def __init__(self, db_manager):
+        self.db = db_manager
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_expire = {}
+        self._unsaved = {}
+        self.hits = 0
+        self.misses = 0
+
+    def run(self, db_name: str, scope: str, key: str, operation) -> dict:
+        cache_key = (db_name, scope, key)
+        with self._lock:
+            unsaved = self._unsaved.get(cache_key)
+        if unsaved is not None:
+            # Повтор после сбоя сохранения: операция не выполняется снова, ответ дописывается в таблицу
+            self._save(cache_key, unsaved)
+            return unsaved
+
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return cached
+
+        claimed, stored = self._claim(db_name, scope, key)
+        if not claimed:
+            if stored is None:
+                return IN_PROGRESS
+            self._cache_put(cache_key, stored)
+            return stored
+
+        try:
+            result = operation()
+        except Exception:
+            self._release(db_name, scope, key)
+            raise
+
+        # Временные сбои (5xx) не фиксируем: повтор с тем же ключом должен выполниться заново
+        if result.get("status", 200) >= 500:
+            self._release(db_name, scope, key)
+            return result
+
+        # Операция уже зафиксирована: при сбое сохранения ключ не освобождается, иначе повтор выполнил бы ее дважды
+        if not self._save(cache_key, result):
+            return NOT_SAVED
+        self._maybe_expire(db_name)
+        return result
+
+    def _save(self, cache_key: tuple, result: dict) -> bool:
+        db_name, scope, key = cache_key
+        try:
+            self._complete(db_name, scope, key, result)
+        except Exception as e:
+            logger.error(f"Failed to save idempotent response {scope}/{key} in {db_name}: {e}")
+            with self._lock:
+                self._unsaved[cache_key] = result
+            return False
+
+        with self._lock:
+            self._unsaved.pop(cache_key, None)
+        self._cache_put(cache_key, result)
+        return True
+
+    def _claim(self, db_name: str, scope: str, key: str) -> tuple[bool, dict | None]:
+        # Захват ключа одним запросом; незавершенный захват старше таймаута (упавший процесс) перехватывается
+        with self.db.get_cursor(db_name) as cursor:
+            cursor.execute(
+                """
+                WITH claimed AS (
+                    INSERT INTO idempotency_keys (scope, key)
+                    VALUES (%(scope)s, %(key)s)
+                    ON CONFLICT (scope, key) DO UPDATE SET created_at = NOW()
+                    WHERE idempotency_keys.response IS NULL
+                    AND idempotency_keys.created_at < NOW() - make_interval(secs => %(claim_timeout)s)
+                    RETURNING 1
+                )
+                SELECT
+                    EXISTS (SELECT 1 FROM claimed) AS claimed,
+                    (SELECT response FROM idempotency_keys WHERE scope = %(scope)s AND key = %(key)s) AS response
+            """,
+                {"scope": scope, "key": key, "claim_timeout": Config.IDEMPOTENCY_CLAIM_TIMEOUT},
+            )
+            row = cursor.fetchone()
+            return row["claimed"], row["response"]
+
+    def _complete(self, db_name: str, scope: str, key: str, result: dict) -> None:
+        with self.db.get_cursor(db_name) as cursor:
+            cursor.execute(
+                "UPDATE idempotency_keys SET response = %s WHERE scope = %s AND key = %s",
+                (Json(result), scope, key),
+            )
+
+    def _release(self, db_name: str, scope: str, key: str) -> None:
+        try:
+            with self.db.get_cursor(db_name) as cursor:
+                cursor.execute(
+                    "DELETE FROM idempotency_keys WHERE scope = %s AND key = %s AND response IS NULL",
+                    (scope, key),
+                )
+        except Exception as e:
+            logger.warning(f"Failed to release idempotency key {scope}/{key} in {db_name}: {e}")
+
+    def _cache_get(self, cache_key: tuple) -> dict | None:
+        with self._lock:
+            result = self._cache.get(cache_key)
+            if result is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._cache.move_to_end(cache_key)
+            return result
+
+    def _cache_put(self, cache_key: tuple, result: dict) -> None:
+        with self._lock:
+            self._cache[cache_key] = result
+            self._cache.move_to_end(cache_key)
+            while len(self._cache) > Config.IDEMPOTENCY_CACHE_SIZE:
+                self._cache.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._cache),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            }
+
+    def _maybe_expire(self, db_name: str) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_expire.get(db_name, 0.0) < Config.IDEMPOTENCY_EXPIRE_INTERVAL:
+                return
+            self._last_expire[db_name] = now
+
+        threading.Thread(target=self.expire, args=(db_name,), name=f"idempotency-expire-{db_name}", daemon=True).start()
+
+    def expire(self, db_name: str) -> int:
+        # Удаление порциями в отдельных транзакциях, чтобы не держать долгие блокировки
+        removed = 0
+        try:
+            while True:
+                with self.db.get_cursor(db_name) as cursor:
+                    cursor.execute(
+                        """
+                        DELETE FROM idempotency_keys
+                        WHERE ctid = ANY(ARRAY(
+                            SELECT ctid FROM idempotency_keys
+                            WHERE created_at < NOW() - make_interval(secs => %s)
+                            LIMIT %s
+                        ))
+                    """,
+                        (Config.IDEMPOTENCY_KEY_TTL, Config.IDEMPOTENCY_EXPIRE_BATCH),
+                    )
+                    deleted = cursor.rowcount
+                removed += deleted
+                if deleted < Config.IDEMPOTENCY_EXPIRE_BATCH:
+                    break
+        except Exception as e:
+            logger.warning(f"Failed to expire idempotency keys in {db_name}: {e}")
+
+        if removed:
+            logger.info(f"Expired {removed} idempotency key(s) in {db_name}")
+        return removed
@@ -0,0 +1,88 @@
+import logging
+import random
+import threading
+import time
+
+from psycopg2 import errors
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Ошибки, после которых транзакцию бронирования можно безопасно повторить целиком
+RETRYABLE_ERRORS = (errors.LockNotAvailable, errors.DeadlockDetected, errors.SerializationFailure)
+
+
+class LockWaitStats:
+    """Статистика ожидания блокировок категорий номеров"""
+
+    BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.acquired = 0
+        self.timeouts = 0
+        self.retries = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.buckets = [0] * len(self.BUCKETS)
+
+    def record_wait(self, elapsed: float) -> None:
+        with self._lock:
+            self.acquired += 1
+            self.wait_total += elapsed
+            self.wait_max = max(self.wait_max, elapsed)
+            for index, bound in enumerate(self.BUCKETS):
+                if elapsed <= bound:
+                    self.buckets[index] += 1
+
+    def record_timeout(self) -> None:
+        with self._lock:
+            self.timeouts += 1
+
+    def record_retry(self) -> None:
+        with self._lock:
+            self.retries += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "acquired": self.acquired,
+                "timeouts": self.timeouts,
+                "retries": self.retries,
+                "wait_seconds_total": round(self.wait_total, 6),
+                "wait_seconds_max": round(self.wait_max, 6),
+                "wait_seconds_avg": round(self.wait_total / self.acquired, 6) if self.acquired else 0.0,
+                "wait_seconds_buckets": dict(zip(self.BUCKETS, self.buckets, strict=True)),
+            }
+
+
+def lock_categories(cursor, hotel_id: int, category_ids, stats: LockWaitStats) -> None:
+    # Транзакционные advisory-блокировки по (отель, категория): брони разных категорий и отелей не мешают
+    # друг другу. Порядок захвата фиксирован, чтобы групповые брони не взаимоблокировались
+    cursor.execute("SET LOCAL lock_timeout = %s", (f"{Config.BOOKING_LOCK_TIMEOUT_MS}ms",))
+
+    started = time.perf_counter()
+    try:
+        for category_id in sorted(set(category_ids)):
+            cursor.execute("SELECT pg_advisory_xact_lock(%s, %s)", (hotel_id, category_id))
+    except errors.LockNotAvailable:
+        stats.record_timeout()
+        raise
+    stats.record_wait(time.perf_counter() - started)
+
+
+def run_with_retry(operation, stats: LockWaitStats, description: str):
+    # Повтор всей транзакции с ограниченной экспоненциальной задержкой и случайным разбросом
+    attempt = 0
+    while True:
+        try:
+            return operation()
+        except RETRYABLE_ERRORS as e:
+            attempt += 1
+            if attempt > Config.BOOKING_LOCK_RETRIES:
+                raise
+            stats.record_retry()
+            delay = min(Config.BOOKING_RETRY_BASE_DELAY * 2 ** (attempt - 1), Config.BOOKING_RETRY_MAX_DELAY)
+            logger.warning(f"Retrying {description} after {type(e).__name__} (attempt {attempt})")
+            time.sleep(random.uniform(delay / 2, delay))
@@ -0,0 +1,197 @@
+import logging
+import threading
+import weakref
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+
+# Границы корзин гистограмм времени (секунды)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values, strict=True)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value) -> str:
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _ThreadShard:
+    """Часть значений метрики, принадлежащая одному потоку; живет, пока жив поток"""
+
+    __slots__ = ("values", "__weakref__")
+
+    def __init__(self):
+        self.values = {}
+
+
+class _Sharded(ABC):
+    """Значения метрики хранятся отдельно для каждого потока: запись без блокировок, сложение при выгрузке.
+    Части завершившихся потоков вливаются в общую базовую часть, поэтому их число не растет"""
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...]):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._local = threading.local()
+        self._base = {}
+        self._shards = {}
+        self._shards_lock = threading.Lock()
+
+    def _shard(self) -> dict:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            # Блокировка берется один раз на поток — при создании его части. Объект части хранится только
+            # в threading.local: после завершения потока он удаляется, и finalize переносит значения в базу
+            shard = self._local.shard = _ThreadShard()
+            with self._shards_lock:
+                self._shards[id(shard.values)] = shard.values
+            weakref.finalize(shard, self._retire, shard.values).atexit = False
+        return shard.values
+
+    def _retire(self, values: dict) -> None:
+        with self._shards_lock:
+            self._shards.pop(id(values), None)
+            for labels, value in values.items():
+                self._base[labels] = self._combine(self._base.get(labels), value)
+
+    @staticmethod
+    @abstractmethod
+    def _combine(total, value):
+        # Сложение значения серии с накопленным итогом (None — серии еще нет)
+        ...
+
+    def _totals(self) -> dict:
+        with self._shards_lock:
+            # Копии частей: поток-владелец может добавить серию во время выгрузки
+            shards = [dict(self._base), *(dict(values) for values in self._shards.values())]
+        totals = {}
+        for shard in shards:
+            for labels, value in shard.items():
+                totals[labels] = self._combine(totals.get(labels), value)
+        return totals
+
+
+class Counter(_Sharded):
+    def inc(self, labels: tuple = (), amount: float = 1) -> None:
+        shard = self._shard()
+        shard[labels] = shard.get(labels, 0) + amount
+
+    @staticmethod
+    def _combine(total, value):
+        return value if total is None else total + value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self._totals().items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, labels)} {_format_value(value)}")
+        return lines
+
+
+class Histogram(_Sharded):
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...], buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, labels: tuple, value: float) -> None:
+        shard = self._shard()
+        series = shard.get(labels)
+        if series is None:
+            # Счетчики корзин без накопления (последняя — +Inf), затем сумма значений
+            series = shard[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    @staticmethod
+    def _combine(total, value):
+        # Всегда новый список: серии живых потоков продолжают изменяться
+        if total is None:
+            return list(value)
+        return [left + right for left, right in zip(total, value, strict=True)]
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, series in sorted(self._totals().items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), series[:-1], strict=True):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, labels, le)} {cumulative}")
+            label_text = _format_labels(self.labels, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+
+def render_family(name: str, kind: str, documentation: str, labels: tuple[str, ...], samples) -> list[str]:
+    # Метрики, значения которых берутся из готовой статистики компонентов в момент выгрузки
+    lines = [f"# HELP {name} {documentation}", f"# TYPE {name} {kind}"]
+    for values, value in samples:
+        lines.append(f"{name}{_format_labels(labels, values)} {_format_value(value)}")
+    return lines
+
+
+class MetricsRegistry:
+    """Метрики процесса в текстовом формате Prometheus"""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name: str, documentation: str, labels: tuple[str, ...] = ()) -> Counter:
+        metric = Counter(name, documentation, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str, labels: tuple[str, ...] = (), buckets=LATENCY_BUCKETS):
+        metric = Histogram(name, documentation, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def collector(self, collect) -> None:
+        # collect() возвращает строки в формате Prometheus, обычно через render_family
+        self._collectors.append(collect)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collect in self._collectors:
+            lines.extend(collect())
+        return "\n".join(lines) + "\n"
+
+
+class ErrorCountingHandler(logging.Handler):
+    """Считает записи уровня ERROR: сервисы перехватывают исключения и возвращают {"error": ...}, логируя их"""
+
+    def __init__(self, counter: Counter):
+        super().__init__(logging.ERROR)
+        self.counter = counter
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.counter.inc((record.name, record.funcName))
+
+
+registry = MetricsRegistry()
+
+HTTP_REQUEST_DURATION = registry.histogram(
+    "http_request_duration_seconds", "HTTP request latency", ("endpoint", "method", "status")
+)
+DB_QUERY_DURATION = registry.histogram(
+    "db_query_duration_seconds", "Statement execution time by node and calling method", ("node", "caller")
+)
+DB_QUERY_ERRORS = registry.counter(
+    "db_query_errors_total", "Failed statements by node and calling method", ("node", "caller")
+)
+LOGGED_ERRORS = registry.counter(
+    "app_logged_errors_total", "Errors logged (and usually swallowed)", ("logger", "function")
+)
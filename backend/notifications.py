@@ -0,0 +1,81 @@
+import logging
+import select
+import threading
+from collections import defaultdict
+from collections.abc import Callable
+
+import psycopg2
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class ChangeListener:
+    """Фоновый LISTEN на центральном узле: сообщает подписчикам об изменении справочных таблиц"""
+
+    CHANNEL = "reference_data_changed"
+
+    def __init__(self, url: str = Config.CENTRAL_DB_URL, poll_interval: float = 5.0):
+        self.url = url
+        self.poll_interval = poll_interval
+        self._subscribers = defaultdict(list)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def subscribe(self, tables: list[str], callback: Callable[[set[str]], None]) -> None:
+        for table in tables:
+            self._subscribers[table].append(callback)
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="change-listener", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _dispatch(self, tables: set[str]) -> None:
+        by_callback = {}
+        for table in tables:
+            for callback in self._subscribers.get(table, []):
+                by_callback.setdefault(callback, set()).add(table)
+
+        for callback, changed in by_callback.items():
+            try:
+                callback(changed)
+            except Exception as e:
+                logger.error(f"Error handling change of {', '.join(sorted(changed))}: {e}")
+
+    def _run(self) -> None:
+        delay = Config.DB_BREAKER_BASE_DELAY
+        while not self._stop.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(self.url, connect_timeout=Config.DB_CONNECT_TIMEOUT)
+                conn.autocommit = True
+                with conn.cursor() as cursor:
+                    cursor.execute(f"LISTEN {self.CHANNEL}")
+                logger.info(f"Listening for {self.CHANNEL} notifications")
+                delay = Config.DB_BREAKER_BASE_DELAY
+
+                # Уведомления, пришедшие до LISTEN, потеряны — перечитываем всё
+                self._dispatch(set(self._subscribers))
+
+                while not self._stop.is_set():
+                    if select.select([conn], [], [], self.poll_interval) == ([], [], []):
+                        continue
+                    conn.poll()
+                    changed = {notify.payload for notify in conn.notifies}
+                    conn.notifies.clear()
+                    if changed:
+                        self._dispatch(changed)
+            except Exception as e:
+                logger.warning(f"Change listener disconnected: {e}")
+                self._stop.wait(delay)
+                delay = min(delay * 2, Config.DB_BREAKER_MAX_DELAY)
+            finally:
+                if conn is not None:
+                    conn.close()
@@ -0,0 +1,40 @@
+from datetime import datetime
+
+
+def encode_cursor(row: dict) -> str:
+    # Ключ страницы — (create_date, id) последнего бронирования; create_date уже в ISO-формате
+    return f"{row['create_date']}_{row['id']}"
+
+
+def decode_cursor(token: str | None) -> tuple[datetime | None, int | None]:
+    if not token:
+        return None, None
+    create_date, _, reservation_id = token.rpartition("_")
+    return datetime.fromisoformat(create_date), int(reservation_id)
+
+
+def keyset_page(rows: list[dict], limit: int) -> dict:
+    # Запрашивается limit + 1 бронирование: строки лишнего (последнего) говорят о наличии следующей страницы
+    ids = list(dict.fromkeys(row["id"] for row in rows))
+    if len(ids) <= limit:
+        return {"reservations": rows, "next_cursor": None}
+
+    extra_id = ids[limit]
+    rows = [row for row in rows if row["id"] != extra_id]
+    return {"reservations": rows, "next_cursor": encode_cursor(rows[-1])}
+
+
+def reservation_filters(args) -> dict:
+    def parse_date(name):
+        value = args.get(name)
+        return datetime.strptime(value, "%Y-%m-%d").date() if value else None
+
+    after_date, after_id = decode_cursor(args.get("after"))
+    return {
+        "hotel_id": int(args["hotel_id"]) if args.get("hotel_id") else None,
+        "status": args.get("status") or None,
+        "arrival_from": parse_date("arrival_from"),
+        "arrival_to": parse_date("arrival_to"),
+        "after_date": after_date,
+        "after_id": after_id,
+    }
@@ -0,0 +1,111 @@
+import logging
+import threading
+import time
+
+from config import Config
+from serialization import serialize_rows
+
+logger = logging.getLogger(__name__)
+
+
+class ReferenceDataCache:
+    """Кэш справочников центрального узла: категории номеров, коэффициенты отелей, карты лояльности"""
+
+    QUERIES = {
+        "categories_room": """
+            SELECT id, category_name, guests_capacity, price_per_night, description
+            FROM categories_room
+        """,
+        "hotels": "SELECT id, location_coeff_room FROM hotels",
+        "loyalty_cards": """
+            SELECT id, program_name, req_bonus_amount, discount
+            FROM loyalty_cards
+            ORDER BY req_bonus_amount
+        """,
+    }
+
+    def __init__(self, db_manager, ttl: float = Config.REFERENCE_CACHE_TTL):
+        self.db = db_manager
+        self.ttl = ttl
+        self._entries = {}
+        self._versions = dict.fromkeys(self.QUERIES, 0)
+        self._locks = {table: threading.Lock() for table in self.QUERIES}
+        self.hits = 0
+        self.misses = 0
+
+    def attach(self, listener) -> None:
+        listener.subscribe(list(self.QUERIES), self.invalidate)
+
+    def invalidate(self, tables=None) -> None:
+        for table in tables or list(self.QUERIES):
+            if table not in self._versions:
+                continue
+            self._versions[table] += 1
+            entry = self._entries.get(table)
+            if entry is not None:
+                # Данные оставляем как резерв на случай недоступности центрального узла
+                self._entries[table] = (float("-inf"), entry[1])
+        logger.info(f"Reference data invalidated: {', '.join(sorted(tables or self.QUERIES))}")
+
+    def is_fresh(self, table: str) -> bool:
+        entry = self._entries.get(table)
+        return entry is not None and time.monotonic() - entry[0] < self.ttl
+
+    def load(self, table: str) -> dict[int, dict]:
+        return self._get(table)
+
+    def _get(self, table: str) -> dict[int, dict]:
+        entry = self._entries.get(table)
+        if entry is not None and time.monotonic() - entry[0] < self.ttl:
+            self.hits += 1
+            return entry[1]
+
+        with self._locks[table]:
+            entry = self._entries.get(table)
+            if entry is not None and time.monotonic() - entry[0] < self.ttl:
+                self.hits += 1
+                return entry[1]
+
+            self.misses += 1
+            version = self._versions[table]
+            try:
+                with self.db.get_cursor("central") as cursor:
+                    cursor.execute(self.QUERIES[table])
+                    rows = {row["id"]: row for row in serialize_rows(cursor, cursor.fetchall())}
+            except Exception as e:
+                if entry is None:
+                    raise
+                # Центральный узел недоступен — отдаем устаревшие данные до следующей попытки
+                logger.warning(f"Serving stale {table} after reload failure: {e}")
+                return entry[1]
+
+            # Если во время загрузки пришла инвалидация, результат сразу считается устаревшим
+            loaded_at = time.monotonic() if version == self._versions[table] else float("-inf")
+            self._entries[table] = (loaded_at, rows)
+            return rows
+
+    def get_room_categories(self) -> dict[int, dict]:
+        return self._get("categories_room")
+
+    def get_room_category(self, category_id) -> dict | None:
+        return self._get("categories_room").get(int(category_id))
+
+    def get_location_coeff(self, hotel_id) -> float:
+        hotel = self._get("hotels").get(int(hotel_id))
+        return float(hotel["location_coeff_room"] or 1.0) if hotel else 1.0
+
+    def get_loyalty_card(self, card_id) -> dict | None:
+        return self._get("loyalty_cards").get(int(card_id))
+
+    def get_loyalty_card_for_points(self, bonus_points: int) -> dict | None:
+        # Карты упорядочены по req_bonus_amount, берем старшую из доступных
+        eligible = [card for card in self._get("loyalty_cards").values() if card["req_bonus_amount"] <= bonus_points]
+        return eligible[-1] if eligible else None
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
@@ -0,0 +1,127 @@
+import threading
+import time
+from datetime import datetime
+
+from config import Config
+
+SUBSCRIPTIONS_QUERY = """
+    SELECT
+        s.subname AS name,
+        s.subenabled AS enabled,
+        st.pid IS NOT NULL AS running,
+        st.received_lsn::text AS received_lsn,
+        st.latest_end_lsn::text AS latest_end_lsn,
+        EXTRACT(EPOCH FROM NOW() - st.last_msg_receipt_time)::float8 AS last_message_age_seconds,
+        COALESCE(ss.apply_error_count, 0) AS apply_errors,
+        COALESCE(ss.sync_error_count, 0) AS sync_errors
+    FROM pg_subscription s
+    JOIN pg_database d ON d.oid = s.subdbid AND d.datname = current_database()
+    -- Только ведущий apply-процесс: синхронизация таблиц (relid) и параллельные apply-процессы PG16 (leader_pid)
+    -- дали бы по несколько строк на подписку
+    LEFT JOIN pg_stat_subscription st ON st.subid = s.oid AND st.relid IS NULL AND st.leader_pid IS NULL
+    LEFT JOIN pg_stat_subscription_stats ss ON ss.subid = s.oid
+    ORDER BY s.subname
+"""
+
+SENDERS_QUERY = """
+    SELECT
+        application_name AS name,
+        state,
+        pg_wal_lsn_diff(pg_current_wal_lsn(), replay_lsn)::bigint AS lag_bytes,
+        EXTRACT(EPOCH FROM replay_lag)::float8 AS lag_seconds
+    FROM pg_stat_replication
+"""
+
+SLOTS_QUERY = """
+    SELECT
+        slot_name AS name,
+        active,
+        wal_status,
+        pg_wal_lsn_diff(pg_current_wal_lsn(), restart_lsn)::bigint AS retained_wal_bytes,
+        pg_wal_lsn_diff(pg_current_wal_lsn(), confirmed_flush_lsn)::bigint AS lag_bytes
+    FROM pg_replication_slots
+    WHERE slot_type = 'logical' AND database = current_database()
+    ORDER BY slot_name
+"""
+
+
+def _node_state(cursor, db_name: str) -> dict:
+    state = {}
+    for key, query in (("subscriptions", SUBSCRIPTIONS_QUERY), ("senders", SENDERS_QUERY), ("slots", SLOTS_QUERY)):
+        cursor.execute(query)
+        state[key] = cursor.fetchall()
+    return state
+
+
+class ReplicationMonitor:
+    """Состояние логической репликации на всех узлах: подписки, отправители WAL и слоты"""
+
+    def __init__(self, db_manager):
+        self.db = db_manager
+        self._lock = threading.Lock()
+        self._status = None
+        self._updated_at = 0.0
+
+    def status(self) -> dict:
+        # Одновременные запросы ждут одного опроса узлов, результат переиспользуется REPLICATION_STATUS_TTL секунд
+        with self._lock:
+            if self._status is None or time.monotonic() - self._updated_at >= Config.REPLICATION_STATUS_TTL:
+                self._status = self._collect()
+                self._updated_at = time.monotonic()
+            return self._status
+
+    def _collect(self) -> dict:
+        nodes, states = self.db.run_on_nodes(_node_state, timeout=Config.REPLICATION_STATUS_TIMEOUT)
+
+        # Имя слота и application_name отправителя на узле-издателе совпадают с именем подписки
+        senders = {row["name"]: row for state in states.values() for row in state["senders"]}
+        slots = {}
+        for node, state in states.items():
+            for row in state["slots"]:
+                slots[row["name"]] = {"node": node, **row}
+
+        subscriptions = []
+        for node, state in states.items():
+            for row in state["subscriptions"]:
+                sender = senders.get(row["name"], {})
+                slot = slots.get(row["name"], {})
+                subscriptions.append(
+                    {
+                        "node": node,
+                        **row,
+                        "publisher": slot.get("node"),
+                        "sender_state": sender.get("state"),
+                        # Байты — по подтвержденной позиции слота: считаются и при остановленном подписчике
+                        "lag_bytes": slot.get("lag_bytes", sender.get("lag_bytes")),
+                        "lag_seconds": sender.get("lag_seconds"),
+                    }
+                )
+
+        slot_rows = list(slots.values())
+        lag_bytes = [item["lag_bytes"] for item in subscriptions if item["lag_bytes"] is not None]
+        lag_seconds = [item["lag_seconds"] for item in subscriptions if item["lag_seconds"] is not None]
+        summary = {
+            "subscriptions": len(subscriptions),
+            "running": sum(item["running"] for item in subscriptions),
+            "apply_errors": sum(item["apply_errors"] for item in subscriptions),
+            "sync_errors": sum(item["sync_errors"] for item in subscriptions),
+            "max_lag_bytes": max(lag_bytes, default=0),
+            "max_lag_seconds": max(lag_seconds, default=0.0),
+            "retained_wal_bytes": sum(slot["retained_wal_bytes"] or 0 for slot in slot_rows),
+            "inactive_slots": sum(not slot["active"] for slot in slot_rows),
+        }
+        degraded = (
+            any(node["status"] != "ok" for node in nodes.values())
+            or summary["running"] < summary["subscriptions"]
+            or summary["inactive_slots"] > 0
+            or any(slot["wal_status"] == "lost" for slot in slot_rows)
+        )
+
+        return {
+            "status": "degraded" if degraded else "ok",
+            "checked_at": datetime.now().isoformat(),
+            "nodes": nodes,
+            "summary": summary,
+            "subscriptions": subscriptions,
+            "slots": slot_rows,
+        }
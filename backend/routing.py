@@ -0,0 +1,77 @@
+import logging
+import threading
+import time
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class HotelRouter:
+    """Карта отель -> город -> узел БД, загружаемая с центрального узла"""
+
+    TABLES = ["hotels", "cities"]
+
+    def __init__(self, db_manager, miss_reload_interval: float = 5.0):
+        self.db = db_manager
+        self.miss_reload_interval = miss_reload_interval
+        self._cities = {}
+        self._loaded = False
+        self._last_reload = 0.0
+        self._lock = threading.Lock()
+
+    def attach(self, listener) -> None:
+        listener.subscribe(self.TABLES, lambda tables: self.reload())
+
+    def reload(self) -> bool:
+        with self._lock:
+            self._last_reload = time.monotonic()
+            try:
+                with self.db.get_cursor("central") as cursor:
+                    cursor.execute("""
+                        SELECT h.id, c.city_name
+                        FROM hotels h
+                        JOIN cities c ON h.city_id = c.id
+                    """)
+                    rows = cursor.fetchall()
+            except Exception as e:
+                logger.error(f"Error loading hotel routing map: {e}")
+                return False
+
+            self._cities = {row["id"]: row["city_name"] for row in rows}
+            self._loaded = True
+            logger.info(f"Hotel routing map loaded: {len(self._cities)} hotels")
+            return True
+
+    def get_city(self, hotel_id) -> str | None:
+        hotel_id = int(hotel_id)
+        city_name = self._cities.get(hotel_id)
+        if city_name is None and self._should_reload():
+            self.reload()
+            city_name = self._cities.get(hotel_id)
+        return city_name
+
+    def get_cached_city(self, hotel_id) -> str | None:
+        return self._cities.get(int(hotel_id))
+
+    def get_db_name(self, hotel_id) -> str:
+        return self.get_db_name_by_city(self.get_city(hotel_id))
+
+    def get_reservation_hotel_id(self, reservation_id: int) -> int | None:
+        # Для запросов без hotel_id: отель брони по центральной копии
+        # (или по филиалу, если запись этой сессии еще не реплицирована)
+        for db_name in self.db.read_nodes():
+            with self.db.get_cursor(db_name) as cursor:
+                cursor.execute("SELECT hotel_id FROM reservations WHERE id = %s", (reservation_id,))
+                reservation = cursor.fetchone()
+                if reservation:
+                    return reservation["hotel_id"]
+        return None
+
+    @staticmethod
+    def get_db_name_by_city(city_name: str | None) -> str:
+        return Config.CITY_TO_DB.get(city_name, "central")
+
+    def _should_reload(self) -> bool:
+        # Неизвестный отель мог появиться до прихода уведомления, но перечитываем не чаще интервала
+        return not self._loaded or time.monotonic() - self._last_reload >= self.miss_reload_interval
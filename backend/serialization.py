@@ -0,0 +1,171 @@
+import csv
+import io
+import json
+import zlib
+from collections.abc import Iterable, Iterator
+
+# OID типов PostgreSQL, значения которых нужно приводить к JSON
+DATE_OID = 1082
+TIME_OID = 1083
+TIMETZ_OID = 1266
+TIMESTAMP_OID = 1114
+TIMESTAMPTZ_OID = 1184
+INTERVAL_OID = 1186
+NUMERIC_OID = 1700
+BYTEA_OID = 17
+DATERANGE_OID = 3912
+TSRANGE_OID = 3908
+TSTZRANGE_OID = 3910
+NUMRANGE_OID = 3906
+
+ARRAY_ELEMENT_OIDS = {
+    1182: DATE_OID,
+    1183: TIME_OID,
+    1115: TIMESTAMP_OID,
+    1185: TIMESTAMPTZ_OID,
+    1231: NUMERIC_OID,
+    1001: BYTEA_OID,
+}
+
+
+def _isoformat(value):
+    return value.isoformat()
+
+
+def _bytes(value):
+    return bytes(value).decode("utf-8")
+
+
+def _scalar_converter(type_oid: int, time_format: str):
+    if type_oid in (DATE_OID, TIMESTAMP_OID, TIMESTAMPTZ_OID):
+        return _isoformat
+    if type_oid in (TIME_OID, TIMETZ_OID):
+        return lambda value: value.strftime(time_format)
+    if type_oid == NUMERIC_OID:
+        return float
+    if type_oid == BYTEA_OID:
+        return _bytes
+    if type_oid == INTERVAL_OID:
+        return str
+    return None
+
+
+def _range_converter(bound):
+    def convert(value):
+        return {
+            "lower": bound(value.lower) if value.lower is not None else None,
+            "upper": bound(value.upper) if value.upper is not None else None,
+        }
+
+    return convert
+
+
+def _array_converter(element):
+    def convert(value):
+        return [element(item) if item is not None else None for item in value]
+
+    return convert
+
+
+def column_converter(type_oid: int, time_format: str = "%H:%M:%S"):
+    converter = _scalar_converter(type_oid, time_format)
+    if converter is not None:
+        return converter
+    if type_oid in (DATERANGE_OID, TSRANGE_OID, TSTZRANGE_OID):
+        return _range_converter(_isoformat)
+    if type_oid == NUMRANGE_OID:
+        return _range_converter(float)
+    if type_oid in ARRAY_ELEMENT_OIDS:
+        return _array_converter(_scalar_converter(ARRAY_ELEMENT_OIDS[type_oid], time_format))
+    return None
+
+
+class RowSerializer:
+    """Преобразование строк результата в JSON-совместимые словари по типам колонок"""
+
+    def __init__(self, columns: list[tuple[str, int]], time_format: str = "%H:%M:%S"):
+        # Конвертеры строятся один раз на результат и только для колонок, которым они нужны.
+        # При совпадении имен в словаре строки остается последняя колонка, поэтому берем ее тип
+        converters = {}
+        for name, type_oid in columns:
+            converters[name] = column_converter(type_oid, time_format)
+        self.converters = [(name, converter) for name, converter in converters.items() if converter is not None]
+
+    @classmethod
+    def for_cursor(cls, cursor, time_format: str = "%H:%M:%S") -> "RowSerializer":
+        return cls([(column.name, column.type_code) for column in cursor.description], time_format)
+
+    @classmethod
+    def for_statement(cls, statement, time_format: str = "%H:%M:%S") -> "RowSerializer":
+        return cls([(attribute.name, attribute.type.oid) for attribute in statement.get_attributes()], time_format)
+
+    def row(self, row) -> dict:
+        # Строки RealDictCursor уже являются словарями — преобразуем на месте без копирования
+        result = row if isinstance(row, dict) else dict(row)
+        for name, converter in self.converters:
+            value = result[name]
+            if value is not None:
+                result[name] = converter(value)
+        return result
+
+    def rows(self, rows) -> list[dict]:
+        return [self.row(row) for row in rows]
+
+
+def serialize_rows(cursor, rows, time_format: str = "%H:%M:%S") -> list[dict]:
+    return RowSerializer.for_cursor(cursor, time_format).rows(rows)
+
+
+def serialize_row(cursor, row, time_format: str = "%H:%M:%S") -> dict | None:
+    if row is None:
+        return None
+    return RowSerializer.for_cursor(cursor, time_format).row(row)
+
+
+def dumps(payload) -> bytes:
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _chunked(lines: Iterable[bytes], chunk_size: int) -> Iterator[bytes]:
+    buffer = bytearray()
+    for line in lines:
+        buffer += line
+        if len(buffer) >= chunk_size:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+
+def ndjson_chunks(rows: Iterable[dict], chunk_size: int = 65536) -> Iterator[bytes]:
+    return _chunked((dumps(row) + b"\n" for row in rows), chunk_size)
+
+
+def csv_chunks(rows: Iterable[dict], columns: list[str], chunk_size: int = 65536) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction="ignore")
+
+    def lines():
+        writer.writeheader()
+        yield _drain(buffer)
+        for row in rows:
+            writer.writerow(row)
+            yield _drain(buffer)
+
+    return _chunked(lines(), chunk_size)
+
+
+def _drain(buffer: io.StringIO) -> bytes:
+    data = buffer.getvalue().encode("utf-8")
+    buffer.seek(0)
+    buffer.truncate()
+    return data
+
+
+def gzip_chunks(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,292 @@
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import datetime
+from typing import Any
+
+from async_database import ensure_reference, numbered, resolve_db_name
+from config import Config
+from services import availability_queries as queries
+
+logger = logging.getLogger(__name__)
+
+CHECK_AVAILABILITY = numbered(queries.CHECK_AVAILABILITY, "hotel_id", "category_id", "start_date", "end_date")
+AVAILABLE_CATEGORIES = numbered(queries.AVAILABLE_CATEGORIES, "hotel_id", "start_date", "end_date")
+AVAILABILITY_BATCH = numbered(
+    queries.AVAILABILITY_BATCH, "idx", "hotel_id", "category_id", "start_date", "end_date", "hotel_ids"
+)
+AVAILABILITY_CALENDAR = numbered(queries.AVAILABILITY_CALENDAR, "hotel_id", "start_date", "end_date")
+AVAILABLE_ROOMS = numbered(queries.AVAILABLE_ROOMS, "hotel_id", "category_id", "start_date", "end_date", "limit")
+
+
+class AsyncAvailabilityService:
+    def __init__(self, db_manager, router, reference_cache):
+        self.db = db_manager
+        self.router = router
+        self.reference_cache = reference_cache
+
+    async def check_room_availability(
+        self, hotel_id: int, room_category_id: int, start_date: str, end_date: str
+    ) -> dict[str, Any]:
+        try:
+            start = datetime.strptime(start_date, "%Y-%m-%d").date()
+            end = datetime.strptime(end_date, "%Y-%m-%d").date()
+
+            if start >= end:
+                return {"error": "End date must be after start date", "status": 400}
+
+            db_name = await resolve_db_name(self.router, hotel_id)
+
+            availability = await self.db.fetchrow(
+                db_name,
+                CHECK_AVAILABILITY,
+                hotel_id,
+                room_category_id,
+                start,
+                end,
+            )
+
+            room_info = availability["room_info"]
+            location_coeff = float(availability["location_coeff_room"] or 1.0)
+
+            nights = (end - start).days
+            price_per_night = float(room_info["price_per_night"]) if room_info else 0
+            total_price = price_per_night * location_coeff * nights
+
+            return {
+                "available": availability["available_rooms_count"] > 0,
+                "available_rooms_count": availability["available_rooms_count"],
+                "total_rooms": availability["total_rooms"],
+                "reserved_rooms": availability["reserved_rooms"],
+                "total_price": round(total_price, 2),
+                "price_per_night": round(price_per_night * location_coeff, 2),
+                "nights": nights,
+                "room_info": room_info or {},
+                "available_rooms": availability["available_rooms"],
+            }
+
+        except ValueError as e:
+            logger.error(f"Invalid date format: {e}")
+            return {"error": "Invalid date format. Use YYYY-MM-DD", "status": 400}
+        except Exception as e:
+            logger.error(f"Error checking availability: {e}")
+            return {"error": str(e), "status": 500}
+
+    async def get_available_room_categories(self, hotel_id: int, start_date: str, end_date: str) -> list[dict]:
+        try:
+            start = datetime.strptime(start_date, "%Y-%m-%d").date()
+            end = datetime.strptime(end_date, "%Y-%m-%d").date()
+
+            if start >= end:
+                return []
+
+            db_name = await resolve_db_name(self.router, hotel_id)
+
+            # Счетчики номеров на филиале и справочник категорий загружаются одновременно
+            available_categories, _ = await asyncio.gather(
+                self.db.fetch(
+                    db_name,
+                    AVAILABLE_CATEGORIES,
+                    hotel_id,
+                    start,
+                    end,
+                ),
+                ensure_reference(self.reference_cache, "categories_room", "hotels"),
+            )
+
+            available_counts = {cat["categories_room_id"]: cat["available_rooms_count"] for cat in available_categories}
+
+            room_categories = self.reference_cache.get_room_categories()
+            categories = sorted(
+                (room_categories[category_id] for category_id in available_counts if category_id in room_categories),
+                key=lambda category: category["price_per_night"],
+            )
+            location_coeff = self.reference_cache.get_location_coeff(hotel_id)
+
+            nights = (end - start).days
+            result = []
+
+            for category in categories:
+                category_dict = dict(category)
+
+                category_dict["location_coeff_room"] = location_coeff
+                category_dict["available_rooms_count"] = available_counts.get(category["id"], 0)
+
+                price_per_night = float(category["price_per_night"])
+
+                category_dict["price_for_period"] = round(price_per_night * location_coeff * nights, 2)
+                category_dict["price_per_night_with_coeff"] = round(price_per_night * location_coeff, 2)
+
+                result.append(category_dict)
+
+            return result
+
+        except ValueError as e:
+            logger.error(f"Invalid date format: {e}")
+            return []
+        except Exception as e:
+            logger.error(f"Error getting available categories: {e}")
+            return []
+
+    async def check_availability_batch(self, items: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        results = [None] * len(items)
+        groups = defaultdict(list)
+
+        for idx, item in enumerate(items):
+            try:
+                hotel_id = int(item["hotel_id"])
+                room_category_id = int(item["room_category_id"])
+                start = datetime.strptime(item["start_date"], "%Y-%m-%d").date()
+                end = datetime.strptime(item["end_date"], "%Y-%m-%d").date()
+            except (KeyError, TypeError, ValueError):
+                results[idx] = {"error": "Expected hotel_id, room_category_id, start_date and end_date (YYYY-MM-DD)"}
+                continue
+
+            if start >= end:
+                results[idx] = {"error": "End date must be after start date"}
+                continue
+
+            groups[await resolve_db_name(self.router, hotel_id)].append((idx, hotel_id, room_category_id, start, end))
+
+        group_list = list(groups.items())
+        # Последний результат — загрузка справочников, без которой цены не посчитать ни для одной группы
+        *outcomes, reference_error = await asyncio.gather(
+            *(self._check_availability_group(db_name, group) for db_name, group in group_list),
+            ensure_reference(self.reference_cache, "categories_room", "hotels"),
+            return_exceptions=True,
+        )
+
+        for (db_name, group), counts in zip(group_list, outcomes, strict=True):
+            error = counts if isinstance(counts, Exception) else reference_error
+            if error is not None:
+                logger.error(f"Error checking batch availability in {db_name}: {error}")
+                for idx, *_ in group:
+                    results[idx] = {"error": "Availability is temporarily unavailable for this hotel"}
+                continue
+
+            for idx, hotel_id, room_category_id, start, end in group:
+                total_rooms, available_rooms_count = counts[idx]
+                category = self.reference_cache.get_room_category(room_category_id)
+                price_per_night = float(category["price_per_night"]) if category else 0
+                price_per_night *= self.reference_cache.get_location_coeff(hotel_id)
+
+                results[idx] = {
+                    "hotel_id": hotel_id,
+                    "room_category_id": room_category_id,
+                    "start_date": start.isoformat(),
+                    "end_date": end.isoformat(),
+                    "available": available_rooms_count > 0,
+                    "available_rooms_count": available_rooms_count,
+                    "total_rooms": total_rooms,
+                    "price_per_night": round(price_per_night, 2),
+                    "total_price": round(price_per_night * (end - start).days, 2),
+                }
+
+        return results
+
+    async def _check_availability_group(self, db_name: str, group: list[tuple]) -> dict[int, tuple[int, int]]:
+        idxs, hotel_ids, category_ids, starts, ends = (list(column) for column in zip(*group, strict=True))
+
+        rows = await self.db.fetch(
+            db_name,
+            AVAILABILITY_BATCH,
+            idxs,
+            hotel_ids,
+            category_ids,
+            starts,
+            ends,
+            sorted(set(hotel_ids)),
+        )
+
+        return {row["idx"]: (row["total_rooms"], row["available_rooms_count"]) for row in rows}
+
+    async def get_availability_calendar(self, hotel_id: int, start_date: str, end_date: str) -> dict[str, Any]:
+        try:
+            start = datetime.strptime(start_date, "%Y-%m-%d").date()
+            end = datetime.strptime(end_date, "%Y-%m-%d").date()
+
+            if start >= end:
+                return {"error": "End date must be after start date", "status": 400}
+            if (end - start).days > Config.AVAILABILITY_CALENDAR_MAX_DAYS:
+                return {
+                    "error": f"Calendar range is limited to {Config.AVAILABILITY_CALENDAR_MAX_DAYS} days",
+                    "status": 400,
+                }
+
+            db_name = await resolve_db_name(self.router, hotel_id)
+
+            rows, _ = await asyncio.gather(
+                self.db.fetch(
+                    db_name,
+                    AVAILABILITY_CALENDAR,
+                    hotel_id,
+                    start,
+                    end,
+                ),
+                ensure_reference(self.reference_cache, "categories_room", "hotels"),
+            )
+
+            room_categories = self.reference_cache.get_room_categories()
+            location_coeff = self.reference_cache.get_location_coeff(hotel_id)
+
+            categories = {"id": [], "name": [], "total_rooms": [], "price_per_night": []}
+            available = []
+
+            for row in rows:
+                category = room_categories.get(row["categories_room_id"], {})
+                categories["id"].append(row["categories_room_id"])
+                categories["name"].append(category.get("category_name"))
+                categories["total_rooms"].append(row["total_rooms"])
+                categories["price_per_night"].append(
+                    round(float(category.get("price_per_night") or 0) * location_coeff, 2)
+                )
+                available.append(list(row["available"]))
+
+            return {
+                "hotel_id": hotel_id,
+                "from": start.isoformat(),
+                "to": end.isoformat(),
+                "days": (end - start).days,
+                "categories": categories,
+                "available": available,
+            }
+
+        except ValueError as e:
+            logger.error(f"Invalid date format: {e}")
+            return {"error": "Invalid date format. Use YYYY-MM-DD", "status": 400}
+        except Exception as e:
+            logger.error(f"Error building availability calendar: {e}")
+            return {"error": str(e), "status": 500}
+
+    async def find_available_rooms(
+        self,
+        hotel_id: int,
+        room_category_id: int,
+        start_date: str,
+        end_date: str,
+        limit: int = 5,
+    ) -> list[dict]:
+        try:
+            start = datetime.strptime(start_date, "%Y-%m-%d").date()
+            end = datetime.strptime(end_date, "%Y-%m-%d").date()
+
+            if start >= end:
+                return []
+
+            db_name = await resolve_db_name(self.router, hotel_id)
+
+            rooms = await self.db.fetch_serialized(
+                db_name,
+                AVAILABLE_ROOMS,
+                hotel_id,
+                room_category_id,
+                start,
+                end,
+                limit,
+            )
+
+            return rooms
+
+        except Exception as e:
+            logger.error(f"Error finding available rooms: {e}")
+            return []
@@ -0,0 +1,169 @@
+import asyncio
+import logging
+
+from async_database import ensure_reference, resolve_db_name
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncHotelService:
+    def __init__(self, db_manager, router, reference_cache):
+        self.db = db_manager
+        self.router = router
+        self.reference_cache = reference_cache
+
+    async def get_all_hotels(self, city: str | None = None) -> list[dict]:
+        try:
+            hotels = await self.db.fetch_serialized(
+                "central",
+                """
+                SELECT h.id, h.name, c.city_name, h.address,
+                       h.phone_number, h.email, ch.star_rating,
+                       h.check_in_time, h.check_out_time,
+                       h.location_coeff_room, h.description
+                FROM hotels h
+                JOIN cities c ON h.city_id = c.id
+                JOIN categories_hotel ch ON h.star_rating_id = ch.id
+                WHERE $1::text IS NULL OR c.city_name = $1
+                ORDER BY c.city_name, h.name
+            """,
+                city,
+                time_format="%H:%M",
+            )
+
+            return hotels
+
+        except Exception as e:
+            logger.error(f"Error getting hotels: {e}")
+            return []
+
+    async def get_hotel_details(self, hotel_id: int) -> dict | None:
+        try:
+            hotel = await self.db.fetchrow_serialized(
+                "central",
+                """
+                SELECT h.*, c.city_name, ch.star_rating, ch.rating_coeff
+                FROM hotels h
+                JOIN cities c ON h.city_id = c.id
+                JOIN categories_hotel ch ON h.star_rating_id = ch.id
+                WHERE h.id = $1
+            """,
+                hotel_id,
+                time_format="%H:%M",
+            )
+
+            return hotel
+
+        except Exception as e:
+            logger.error(f"Error getting hotel details: {e}")
+            return None
+
+    async def get_hotel_rooms(self, hotel_id: int) -> list[dict]:
+        try:
+            db_name = await resolve_db_name(self.router, hotel_id)
+
+            rooms = await self.db.fetch_serialized(
+                db_name,
+                """
+                SELECT r.*, cr.category_name, cr.guests_capacity,
+                       cr.price_per_night, cr.description as room_description
+                FROM rooms r
+                JOIN categories_room cr ON r.categories_room_id = cr.id
+                WHERE r.hotel_id = $1
+                ORDER BY r.room_number
+            """,
+                hotel_id,
+            )
+
+            return rooms
+
+        except Exception as e:
+            logger.error(f"Error getting hotel rooms: {e}")
+            return []
+
+    async def get_hotel_amenities(self, hotel_id: int) -> list[dict]:
+        try:
+            db_name = await resolve_db_name(self.router, hotel_id)
+
+            amenities = await self.db.fetch_serialized(
+                db_name,
+                """
+                SELECT a.*, ta.name as amenity_name
+                FROM amenities a
+                JOIN types_amenities ta ON a.types_amenities_id = ta.id
+                WHERE a.hotel_id = $1
+                ORDER BY ta.name
+            """,
+                hotel_id,
+            )
+
+            return amenities
+
+        except Exception as e:
+            logger.error(f"Error getting hotel amenities: {e}")
+            return []
+
+    async def get_hotel_room_categories_with_counts(self, hotel_id: int) -> list[dict]:
+        try:
+            db_name = await resolve_db_name(self.router, hotel_id)
+
+            # Количество номеров берем с филиала, описание категорий — из кэша справочников, параллельно
+            counts, _ = await asyncio.gather(
+                self.db.fetch(
+                    db_name,
+                    """
+                    SELECT r.categories_room_id, COUNT(*) as total_rooms_count
+                    FROM rooms r
+                    WHERE r.hotel_id = $1
+                    GROUP BY r.categories_room_id
+                """,
+                    hotel_id,
+                ),
+                ensure_reference(self.reference_cache, "categories_room", "hotels"),
+            )
+
+            room_categories = self.reference_cache.get_room_categories()
+            location_coeff = self.reference_cache.get_location_coeff(hotel_id)
+
+            rooms = []
+            for row in counts:
+                category = room_categories.get(row["categories_room_id"])
+                if category is None:
+                    continue
+
+                rooms.append(
+                    {
+                        "categories_room_id": category["id"],
+                        "category_name": category["category_name"],
+                        "guests_capacity": category["guests_capacity"],
+                        "description": category["description"],
+                        "location_coeff_room": location_coeff,
+                        "total_rooms_count": row["total_rooms_count"],
+                        "room_count": row["total_rooms_count"],
+                        "price_per_night": round(category["price_per_night"] * location_coeff, 2),
+                    }
+                )
+
+            return sorted(rooms, key=lambda room: room["price_per_night"])
+
+        except Exception as e:
+            logger.error(f"Error getting room categories with counts: {e}")
+            return []
+
+    async def get_cities_with_hotels_count(self) -> list[dict]:
+        try:
+            cities = await self.db.fetch(
+                "central",
+                """
+                SELECT c.city_name, COUNT(h.id) as hotels_count
+                FROM cities c
+                LEFT JOIN hotels h ON c.id = h.city_id
+                GROUP BY c.id, c.city_name
+                ORDER BY c.city_name
+            """,
+            )
+
+            return [{"city_name": city["city_name"], "hotels_count": city["hotels_count"]} for city in cities]
+        except Exception as e:
+            logger.error(f"Error getting cities with hotels count: {e}")
+            return []
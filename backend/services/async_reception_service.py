@@ -0,0 +1,148 @@
+import asyncio
+import logging
+
+from config import Config
+from pagination import keyset_page
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncReceptionService:
+    def __init__(self, db_manager, router):
+        self.db = db_manager
+        self.router = router
+
+    async def get_cities_with_reservations_count(self) -> list[dict]:
+        try:
+            filials = [name for name in self.db.breakers if name != "central"]
+            results = await asyncio.gather(
+                *(
+                    self.db.fetch(
+                        db_name,
+                        """
+                        SELECT c.city_name, COUNT(r.id) as reservations_count
+                        FROM cities c
+                        LEFT JOIN hotels h ON c.id = h.city_id
+                        LEFT JOIN reservations r ON r.hotel_id = h.id AND r.status IN ('pending', 'confirmed')
+                        GROUP BY c.id, c.city_name
+                    """,
+                    )
+                    for db_name in filials
+                ),
+                return_exceptions=True,
+            )
+
+            counts = {}
+            for db_name, rows in zip(filials, results, strict=True):
+                if isinstance(rows, Exception):
+                    logger.warning(f"Reservation counts are partial, {db_name} failed: {rows}")
+                    continue
+                for city in rows:
+                    counts[city["city_name"]] = counts.get(city["city_name"], 0) + city["reservations_count"]
+
+            return [
+                {"city_name": city_name, "reservations_count": reservations_count}
+                for city_name, reservations_count in sorted(counts.items())
+            ]
+        except Exception as e:
+            logger.error(f"Error getting cities with reservations count: {e}")
+            return []
+
+    async def get_city_reservations(
+        self, city_name: str, filters: dict | None = None, limit: int | None = None
+    ) -> dict:
+        filters = filters or {}
+        limit = limit or Config.RECEPTION_PAGE_SIZE
+        try:
+            db_name = self.router.get_db_name_by_city(city_name)
+
+            if not self.db.is_available(db_name):
+                logger.warning(f"{db_name} is unavailable, reading reservations for {city_name} from central")
+                db_name = "central"
+
+            status = filters.get("status")
+            reservations = await self.db.fetch_serialized(
+                db_name,
+                """
+                WITH page AS (
+                    SELECT r.id, r.hotel_id, r.create_date, r.start_date, r.end_date,
+                           r.status, r.total_price, r.payments_status, r.payer_id
+                    FROM reservations r
+                    WHERE r.hotel_id IN (
+                        SELECT h.id FROM hotels h
+                        JOIN cities c ON h.city_id = c.id
+                        WHERE c.city_name = $1
+                    )
+                    AND r.status = ANY($2::text[])
+                    AND ($3::int IS NULL OR r.hotel_id = $3)
+                    AND ($4::date IS NULL OR r.start_date >= $4)
+                    AND ($5::date IS NULL OR r.start_date <= $5)
+                    AND ($6::timestamp IS NULL OR (r.create_date, r.id) < ($6, $7::int))
+                    ORDER BY r.create_date DESC, r.id DESC
+                    LIMIT $8
+                )
+                SELECT r.id, r.hotel_id, r.create_date, r.start_date, r.end_date,
+                       r.status, r.total_price, r.payments_status, r.payer_id,
+                       g.first_name, g.last_name, g.phone_number, g.email,
+                       h.name as hotel_name,
+                       dr.requested_room_category, dr.total_guest_number, dr.room_id,
+                       cr.category_name,
+                       COUNT(rrg.guest_id) as registered_guests_count
+                FROM page r
+                JOIN guests g ON r.payer_id = g.id
+                JOIN hotels h ON r.hotel_id = h.id
+                LEFT JOIN details_reservations dr ON dr.reservation_id = r.id
+                LEFT JOIN categories_room cr ON dr.requested_room_category = cr.id
+                LEFT JOIN room_reservation_guests rrg ON rrg.room_reservation_id = dr.id
+                GROUP BY r.id, r.hotel_id, r.create_date, r.start_date, r.end_date,
+                         r.status, r.total_price, r.payments_status, r.payer_id,
+                         g.first_name, g.last_name, g.phone_number, g.email,
+                         h.name, dr.requested_room_category, dr.total_guest_number,
+                         dr.room_id, cr.category_name
+                ORDER BY r.create_date DESC, r.id DESC
+            """,
+                city_name,
+                [status] if status else ["pending", "confirmed"],
+                filters.get("hotel_id"),
+                filters.get("arrival_from"),
+                filters.get("arrival_to"),
+                filters.get("after_date"),
+                filters.get("after_id"),
+                limit + 1,
+            )
+
+            return keyset_page(reservations, limit)
+
+        except Exception as e:
+            logger.error(f"Error getting city reservations for {city_name}: {e}")
+            return {"reservations": [], "next_cursor": None}
+
+    async def get_reservation_details_with_payment(self, reservation_id: int) -> dict | None:
+        try:
+            reservation = await self.db.fetchrow_serialized(
+                "central",
+                """
+                SELECT r.*, g.first_name, g.last_name, g.phone_number, g.email,
+                       g.document, g.loyalty_card_id, g.bonus_points,
+                       h.name as hotel_name, h.city_id, c.city_name,
+                       dr.requested_room_category, dr.total_guest_number, dr.room_id,
+                       cr.category_name,
+                       rm.room_number, rm.floor, rm.view,
+                       (r.end_date - r.start_date) as nights
+                FROM reservations r
+                JOIN guests g ON r.payer_id = g.id
+                JOIN hotels h ON r.hotel_id = h.id
+                JOIN cities c ON h.city_id = c.id
+                LEFT JOIN details_reservations dr ON dr.reservation_id = r.id
+                LEFT JOIN categories_room cr ON dr.requested_room_category = cr.id
+                LEFT JOIN rooms rm ON dr.room_id = rm.id
+                WHERE r.id = $1
+            """,
+                reservation_id,
+            )
+
+            return reservation
+
+        except Exception as e:
+            logger.error(f"Error getting reservation details: {e}")
+            return None
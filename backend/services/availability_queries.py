@@ -0,0 +1,103 @@
+# Запросы доступности, общие для синхронного и асинхронного сервисов. Параметры именованные (psycopg2);
+# асинхронный сервис переводит их в позиционные $n через async_database.numbered
+
+CHECK_AVAILABILITY = """
+    SELECT * FROM check_room_availability(%(hotel_id)s, %(category_id)s, %(start_date)s, %(end_date)s)
+"""
+
+AVAILABLE_CATEGORIES = """
+    WITH room_counts AS (
+        SELECT
+            r.categories_room_id,
+            COUNT(*) as total_rooms
+        FROM rooms r
+        WHERE r.hotel_id = %(hotel_id)s
+        GROUP BY r.categories_room_id
+    ),
+    reserved_counts AS (
+        SELECT
+            ri.category_id,
+            MAX(ri.held) as reserved_rooms
+        FROM room_inventory ri
+        WHERE ri.hotel_id = %(hotel_id)s
+        AND ri.day >= %(start_date)s AND ri.day < %(end_date)s
+        GROUP BY ri.category_id
+    )
+    SELECT
+        rc.categories_room_id,
+        rc.total_rooms,
+        COALESCE(rsc.reserved_rooms, 0) as reserved_rooms,
+        (rc.total_rooms - COALESCE(rsc.reserved_rooms, 0)) as available_rooms_count
+    FROM room_counts rc
+    LEFT JOIN reserved_counts rsc ON rc.categories_room_id = rsc.category_id
+    WHERE (rc.total_rooms - COALESCE(rsc.reserved_rooms, 0)) > 0
+"""
+
+AVAILABILITY_BATCH = """
+    WITH req AS (
+        SELECT *
+        FROM unnest(%(idx)s::int[], %(hotel_id)s::int[], %(category_id)s::int[], %(start_date)s::date[],
+                    %(end_date)s::date[])
+            AS t(idx, hotel_id, category_id, start_date, end_date)
+    ),
+    room_counts AS (
+        SELECT r.hotel_id, r.categories_room_id, COUNT(*) as total_rooms
+        FROM rooms r
+        WHERE r.hotel_id = ANY(%(hotel_ids)s::int[])
+        GROUP BY r.hotel_id, r.categories_room_id
+    )
+    SELECT
+        req.idx,
+        COALESCE(rc.total_rooms, 0) as total_rooms,
+        GREATEST(COALESCE(rc.total_rooms, 0) - COALESCE(held.reserved_rooms, 0), 0) as available_rooms_count
+    FROM req
+    LEFT JOIN room_counts rc
+        ON rc.hotel_id = req.hotel_id AND rc.categories_room_id = req.category_id
+    LEFT JOIN LATERAL (
+        SELECT MAX(ri.held) as reserved_rooms
+        FROM room_inventory ri
+        WHERE ri.hotel_id = req.hotel_id
+        AND ri.category_id = req.category_id
+        AND ri.day >= req.start_date AND ri.day < req.end_date
+    ) held ON true
+"""
+
+# Матрица категория x день: по одной строке на категорию с массивом свободных номеров по дням
+AVAILABILITY_CALENDAR = """
+    WITH room_counts AS (
+        SELECT
+            r.categories_room_id,
+            COUNT(*) as total_rooms
+        FROM rooms r
+        WHERE r.hotel_id = %(hotel_id)s
+        GROUP BY r.categories_room_id
+    )
+    SELECT
+        rc.categories_room_id,
+        rc.total_rooms,
+        array_agg(GREATEST(rc.total_rooms - COALESCE(ri.held, 0), 0) ORDER BY d.day) as available
+    FROM room_counts rc
+    CROSS JOIN generate_series(%(start_date)s::date, %(end_date)s::date - 1, interval '1 day') AS d(day)
+    LEFT JOIN room_inventory ri
+        ON ri.hotel_id = %(hotel_id)s
+        AND ri.category_id = rc.categories_room_id
+        AND ri.day = d.day::date
+    GROUP BY rc.categories_room_id, rc.total_rooms
+    ORDER BY rc.categories_room_id
+"""
+
+AVAILABLE_ROOMS = """
+    SELECT r.*, cr.category_name, cr.guests_capacity, cr.price_per_night
+    FROM rooms r
+    JOIN categories_room cr ON r.categories_room_id = cr.id
+    WHERE r.hotel_id = %(hotel_id)s
+    AND r.categories_room_id = %(category_id)s
+    AND NOT EXISTS (
+        SELECT 1
+        FROM details_reservations dr
+        WHERE dr.room_id = r.id
+        AND dr.room_stay && daterange(%(start_date)s, %(end_date)s, '[)')
+    )
+    ORDER BY r.room_number
+    LIMIT %(limit)s
+"""
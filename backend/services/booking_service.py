@@ -1,31 +1,54 @@
 import logging
-from datetime import date, datetime, time
-from decimal import Decimal
+from collections import Counter
+from datetime import date, datetime
 from typing import Any
 
+from psycopg2 import errors
+from psycopg2.extras import execute_values
+
+from config import Config
+from locking import RETRYABLE_ERRORS, LockWaitStats, lock_categories, run_with_retry
+from pagination import keyset_page
+from serialization import serialize_row, serialize_rows
+
 logger = logging.getLogger(__name__)
 
 
+def _parse_stay(start_date, end_date) -> tuple[date, date] | None:
+    try:
+        return (
+            datetime.strptime(start_date, "%Y-%m-%d").date(),
+            datetime.strptime(end_date, "%Y-%m-%d").date(),
+        )
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_id(value) -> int | None:
+    # Идентификатор из JSON: целое число или строка из цифр; bool, дробные и прочее не доходят до SQL
+    if isinstance(value, bool | float):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _invalid_stay(stay: tuple[date, date] | None) -> dict[str, Any] | None:
+    # Проверка до захвата блокировок: пустой или обратный период не должен доходить до ограничений БД
+    if stay is None:
+        return {"error": "Invalid date format. Use YYYY-MM-DD", "status": 400}
+    if stay[0] >= stay[1]:
+        return {"error": "End date must be after start date", "status": 400}
+    return None
+
+
 class BookingService:
-    def __init__(self, db_manager):
+    def __init__(self, db_manager, router, reference_cache):
         self.db = db_manager
-
-    def _convert_to_serializable(self, obj):
-        if isinstance(obj, dict):
-            return {k: self._convert_to_serializable(v) for k, v in obj.items()}
-        elif isinstance(obj, list):
-            return [self._convert_to_serializable(item) for item in obj]
-        elif isinstance(obj, (datetime, date)):
-            return obj.isoformat()
-        elif isinstance(obj, time):
-            return obj.strftime("%H:%M:%S")
-        elif isinstance(obj, Decimal):
-            return float(obj)
-        elif isinstance(obj, bytes):
-            return obj.decode("utf-8")
-        elif hasattr(obj, "__dict__"):
-            return self._convert_to_serializable(dict(obj))
-        return obj
+        self.router = router
+        self.reference_cache = reference_cache
+        self.lock_stats = LockWaitStats()
 
     def create_booking(self, booking_data: dict[str, Any]) -> dict[str, Any]:
         try:
@@ -53,453 +76,521 @@ class BookingService:
                     "status": 400,
                 }
 
-            city_name = self._get_city_by_hotel(hotel_id)
+            hotel_id, guest_id = _parse_id(hotel_id), _parse_id(guest_id)
+            if hotel_id is None or guest_id is None:
+                return {"error": "hotel_id and guest_id must be integers", "status": 400}
+
+            stay = _parse_stay(start_date, end_date)
+            error = _invalid_stay(stay)
+            if error:
+                return error
+            start, end = stay
+
+            city_name = self.router.get_city(hotel_id)
             if not city_name:
                 return {"error": "Hotel not found", "status": 404}
 
-            with self.db.get_cursor("central") as cursor:
-                cursor.execute(
-                    """
-                    SELECT id FROM categories_room WHERE id = %s
-                """,
-                    (room_category_id,),
-                )
+            if not self.reference_cache.get_room_category(room_category_id):
+                return {"error": "Room category not found", "status": 404}
 
-                if not cursor.fetchone():
-                    return {"error": "Room category not found", "status": 404}
+            total_guests = booking_data.get("total_guests", 1)
+            total_price = self._calculate_total_price(hotel_id, room_category_id, start, end, total_guests)
 
-            availability_check = self._check_room_availability_for_booking(
-                hotel_id, room_category_id, start_date, end_date
-            )
+            rooms = [
+                {
+                    "room_category_id": room_category_id,
+                    "guests": [guest_id, *booking_data.get("additional_guests", [])],
+                    "total_guests": total_guests,
+                }
+            ]
 
-            if not availability_check["available"]:
+            result = self._create_reservation(city_name, hotel_id, start, end, guest_id, rooms, total_price)
+            if result.get("shortages"):
+                shortage = result["shortages"][0]
                 return {
-                    "error": f"No available rooms of this category for the selected dates. Available: {availability_check['available_count']}, Required: 1",
+                    "error": "No available rooms of this category for the selected dates. "
+                    f"Available: {shortage['available']}, Required: {shortage['requested']}",
                     "status": 409,
                 }
+            if "error" in result:
+                return result
 
-            total_price = self._calculate_total_price(
-                hotel_id,
-                room_category_id,
-                start_date,
-                end_date,
-                booking_data.get("total_guests", 1),
-            )
-
-            if city_name in ["Москва", "Санкт-Петербург", "Казань"]:
-                db_mapping = {
-                    "Москва": "filial1",
-                    "Санкт-Петербург": "filial2",
-                    "Казань": "filial3",
-                }
-                primary_db = db_mapping[city_name]
-            else:
-                primary_db = "central"
-
-            with self.db.get_cursor(primary_db) as cursor:
-                cursor.execute(
-                    """
-                    INSERT INTO reservations (
-                        hotel_id, create_date, status, total_price,
-                        payments_status, payer_id, start_date, end_date
-                    ) VALUES (
-                        %s, NOW(), 'pending', %s, 'unpaid', %s, %s, %s
-                    ) RETURNING id
-                """,
-                    (hotel_id, total_price, guest_id, start_date, end_date),
-                )
-
-                result = cursor.fetchone()
-                if not result:
-                    return {"error": "Failed to create reservation", "status": 500}
-
-                reservation_id = result["id"]
-
-                cursor.execute(
-                    """
-                    INSERT INTO details_reservations (
-                        reservation_id, guest_id, requested_room_category, total_guest_number
-                    ) VALUES (%s, %s, %s, %s) RETURNING id
-                """,
-                    (
-                        reservation_id,
-                        guest_id,
-                        room_category_id,
-                        booking_data.get("total_guests", 1),
-                    ),
-                )
-
-                detail_result = cursor.fetchone()
-                if not detail_result:
-                    return {
-                        "error": "Failed to create reservation details",
-                        "status": 500,
-                    }
+            return {
+                "success": True,
+                "reservation_id": result["reservation_id"],
+                "total_price": total_price,
+                "message": "Booking created successfully",
+            }
 
-                detail_id = detail_result["id"]
+        except Exception as e:
+            logger.error(f"Error creating booking: {e}")
+            return {"error": str(e), "status": 500}
 
-                cursor.execute(
-                    """
-                    INSERT INTO room_reservation_guests (room_reservation_id, guest_id)
-                    VALUES (%s, %s)
-                """,
-                    (detail_id, guest_id),
+    def create_group_booking(self, booking_data: dict[str, Any]) -> dict[str, Any]:
+        try:
+            hotel_id = booking_data.get("hotel_id")
+            payer_id = booking_data.get("guest_id")
+            start_date = booking_data.get("start_date")
+            end_date = booking_data.get("end_date")
+            requested_rooms = booking_data.get("rooms")
+
+            missing_fields = [
+                field
+                for field, value in (
+                    ("hotel_id", hotel_id),
+                    ("guest_id", payer_id),
+                    ("start_date", start_date),
+                    ("end_date", end_date),
+                    ("rooms", requested_rooms),
                 )
+                if not value
+            ]
+            if missing_fields:
+                return {"error": f"Missing required fields: {', '.join(missing_fields)}", "status": 400}
+
+            hotel_id, payer_id = _parse_id(hotel_id), _parse_id(payer_id)
+            if hotel_id is None or payer_id is None:
+                return {"error": "hotel_id and guest_id must be integers", "status": 400}
+
+            if not isinstance(requested_rooms, list):
+                return {"error": "rooms must be a list", "status": 400}
+            if len(requested_rooms) > Config.BOOKING_MAX_ROOMS:
+                return {"error": f"Too many rooms, maximum is {Config.BOOKING_MAX_ROOMS}", "status": 400}
+
+            stay = _parse_stay(start_date, end_date)
+            error = _invalid_stay(stay)
+            if error:
+                return error
+            start, end = stay
+
+            city_name = self.router.get_city(hotel_id)
+            if not city_name:
+                return {"error": "Hotel not found", "status": 404}
 
-                for additional_guest_id in booking_data.get("additional_guests", []):
-                    cursor.execute(
-                        """
-                        INSERT INTO room_reservation_guests (room_reservation_id, guest_id)
-                        VALUES (%s, %s)
-                    """,
-                        (detail_id, additional_guest_id),
-                    )
-
-            logger.info(f"Booking {reservation_id} created successfully in {primary_db}")
+            # Каждый номер: категория и список гостей; первый гость — основной, по умолчанию плательщик
+            rooms = []
+            total_price = 0.0
+            for index, room in enumerate(requested_rooms):
+                room_category_id = room.get("room_category_id") if isinstance(room, dict) else None
+                if not self.reference_cache.get_room_category(room_category_id):
+                    return {"error": f"Room category not found for rooms[{index}]", "status": 404}
+
+                guests = [int(guest) for guest in room.get("guests") or [payer_id]]
+                if len(set(guests)) != len(guests):
+                    return {"error": f"Duplicate guests in rooms[{index}]", "status": 400}
+
+                total_guests = max(int(room.get("total_guests") or len(guests)), len(guests))
+                rooms.append({"room_category_id": room_category_id, "guests": guests, "total_guests": total_guests})
+                total_price += self._calculate_total_price(hotel_id, room_category_id, start, end, total_guests)
+
+            total_price = round(total_price, 2)
+            result = self._create_reservation(city_name, hotel_id, start, end, payer_id, rooms, total_price)
+            if result.get("shortages"):
+                return {
+                    "error": "Not enough available rooms for the selected dates",
+                    "shortages": result["shortages"],
+                    "status": 409,
+                }
+            if "error" in result:
+                return result
 
             return {
                 "success": True,
-                "reservation_id": reservation_id,
+                "reservation_id": result["reservation_id"],
                 "total_price": total_price,
+                "rooms": len(rooms),
+                "guests": sum(len(room["guests"]) for room in rooms),
                 "message": "Booking created successfully",
             }
 
+        except (TypeError, ValueError) as e:
+            return {"error": f"Invalid booking payload: {e}", "status": 400}
         except Exception as e:
-            logger.error(f"Error creating booking: {e}")
+            logger.error(f"Error creating group booking: {e}")
             return {"error": str(e), "status": 500}
 
-    def get_reservations(self, hotel_id: int, status: str = "pending") -> list[dict]:
+    def _create_reservation(
+        self,
+        city_name: str,
+        hotel_id: int,
+        start_date: date,
+        end_date: date,
+        payer_id: int,
+        rooms: list[dict],
+        total_price: float,
+    ) -> dict[str, Any]:
+        primary_db = self.router.get_db_name_by_city(city_name)
+
         try:
-            city_name = self._get_city_by_hotel(hotel_id)
+            reservation_id, shortages = run_with_retry(
+                lambda: self._insert_reservation(
+                    primary_db, hotel_id, start_date, end_date, payer_id, rooms, total_price
+                ),
+                self.lock_stats,
+                f"booking for hotel {hotel_id}",
+            )
+        except RETRYABLE_ERRORS as e:
+            logger.error(f"Booking for hotel {hotel_id} gave up after retries: {e}")
+            return {"error": "Booking service is busy, please try again", "status": 503}
+        except errors.ForeignKeyViolation as e:
+            return {"error": f"Unknown guest or category: {e.diag.message_detail}", "status": 400}
 
-            if city_name in ["Москва", "Санкт-Петербург", "Казань"]:
-                db_mapping = {
-                    "Москва": "filial1",
-                    "Санкт-Петербург": "filial2",
-                    "Казань": "filial3",
+        if reservation_id is None:
+            return {"shortages": shortages}
+
+        logger.info(f"Booking {reservation_id} with {len(rooms)} room(s) created successfully in {primary_db}")
+        return {"reservation_id": reservation_id}
+
+    def _insert_reservation(
+        self,
+        db_name: str,
+        hotel_id: int,
+        start_date: date,
+        end_date: date,
+        payer_id: int,
+        rooms: list[dict],
+        total_price: float,
+    ) -> tuple[int | None, list[dict]]:
+        requested = Counter(room["room_category_id"] for room in rooms)
+
+        # Проверка остатка и вставка в одной транзакции под блокировками категорий: параллельная бронь
+        # тех же категорий ждет коммита и видит уже учтенные в room_inventory номера
+        with self.db.get_cursor(db_name) as cursor:
+            lock_categories(cursor, hotel_id, requested, self.lock_stats)
+
+            # Остаток по всем запрошенным категориям одним запросом
+            cursor.execute(
+                """
+                SELECT req.category_id, req.requested, a.available_rooms_count
+                FROM unnest(%s::int[], %s::int[]) AS req(category_id, requested)
+                CROSS JOIN LATERAL check_room_availability(%s, req.category_id, %s, %s, 0) a
+            """,
+                (list(requested), list(requested.values()), hotel_id, start_date, end_date),
+            )
+            shortages = [
+                {
+                    "room_category_id": row["category_id"],
+                    "requested": row["requested"],
+                    "available": row["available_rooms_count"],
                 }
-                db_name = db_mapping.get(city_name, "central")
-            else:
+                for row in cursor.fetchall()
+                if row["available_rooms_count"] < row["requested"]
+            ]
+            if shortages:
+                return None, shortages
+
+            cursor.execute(
+                """
+                INSERT INTO reservations (
+                    hotel_id, create_date, status, total_price,
+                    payments_status, payer_id, start_date, end_date
+                ) VALUES (
+                    %s, NOW(), 'pending', %s, 'unpaid', %s, %s, %s
+                ) RETURNING id
+            """,
+                (hotel_id, total_price, payer_id, start_date, end_date),
+            )
+            reservation_id = cursor.fetchone()["id"]
+
+            # Детали и гости вставляются многострочными INSERT; id деталей возвращаются в порядке VALUES
+            detail_rows = execute_values(
+                cursor,
+                """
+                INSERT INTO details_reservations (
+                    reservation_id, guest_id, requested_room_category, total_guest_number
+                ) VALUES %s RETURNING id
+            """,
+                [(reservation_id, room["guests"][0], room["room_category_id"], room["total_guests"]) for room in rooms],
+                page_size=len(rooms),
+                fetch=True,
+            )
+
+            guest_rows = [
+                (detail["id"], guest_id)
+                for detail, room in zip(detail_rows, rooms, strict=True)
+                for guest_id in room["guests"]
+            ]
+            execute_values(
+                cursor,
+                "INSERT INTO room_reservation_guests (room_reservation_id, guest_id) VALUES %s",
+                guest_rows,
+                page_size=len(guest_rows),
+            )
+
+            return reservation_id, []
+
+    def get_reservations(
+        self, hotel_id: int, status: str = "pending", filters: dict | None = None, limit: int | None = None
+    ) -> dict:
+        filters = filters or {}
+        limit = limit or Config.RECEPTION_PAGE_SIZE
+        try:
+            db_name = self.router.get_db_name(hotel_id)
+
+            if not self.db.is_available(db_name):
+                logger.warning(f"{db_name} is unavailable, reading reservations for hotel {hotel_id} from central")
                 db_name = "central"
 
+            params = {
+                "hotel_id": hotel_id,
+                "status": filters.get("status") or status,
+                "arrival_from": filters.get("arrival_from"),
+                "arrival_to": filters.get("arrival_to"),
+                "after_date": filters.get("after_date"),
+                "after_id": filters.get("after_id"),
+                "limit": limit + 1,
+            }
+
             with self.db.get_cursor(db_name) as cursor:
                 cursor.execute(
                     """
+                    WITH page AS (
+                        SELECT r.*
+                        FROM reservations r
+                        WHERE r.hotel_id = %(hotel_id)s AND r.status = %(status)s
+                        AND (%(arrival_from)s::date IS NULL OR r.start_date >= %(arrival_from)s)
+                        AND (%(arrival_to)s::date IS NULL OR r.start_date <= %(arrival_to)s)
+                        AND (%(after_date)s::timestamp IS NULL
+                             OR (r.create_date, r.id) < (%(after_date)s, %(after_id)s))
+                        ORDER BY r.create_date DESC, r.id DESC
+                        LIMIT %(limit)s
+                    )
                     SELECT r.*, g.first_name, g.last_name, g.phone_number,
                            h.name as hotel_name,
-                           COUNT(drg.guest_id) as total_guests
-                    FROM reservations r
+                           (
+                               SELECT COUNT(drg.guest_id)
+                               FROM details_reservations dr
+                               JOIN room_reservation_guests drg ON drg.room_reservation_id = dr.id
+                               WHERE dr.reservation_id = r.id
+                           ) as total_guests
+                    FROM page r
                     JOIN guests g ON r.payer_id = g.id
                     JOIN hotels h ON r.hotel_id = h.id
-                    LEFT JOIN details_reservations dr ON dr.reservation_id = r.id
-                    LEFT JOIN room_reservation_guests drg ON drg.room_reservation_id = dr.id
-                    WHERE r.hotel_id = %s AND r.status = %s
-                    GROUP BY r.id, g.first_name, g.last_name, g.phone_number, h.name
-                    ORDER BY r.create_date DESC
+                    ORDER BY r.create_date DESC, r.id DESC
                 """,
-                    (hotel_id, status),
+                    params,
                 )
 
-                reservations = cursor.fetchall()
-                result = []
-                for res in reservations:
-                    res_dict = dict(res)
-                    res_dict = self._convert_to_serializable(res_dict)
-                    result.append(res_dict)
-
-                return result
+                return keyset_page(serialize_rows(cursor, cursor.fetchall()), limit)
 
         except Exception as e:
             logger.error(f"Error getting reservations: {e}")
-            return []
+            return {"reservations": [], "next_cursor": None}
 
     def get_reservation_details(self, reservation_id: int) -> dict[str, Any]:
         try:
-            with self.db.get_cursor("central") as cursor:
-                cursor.execute(
-                    """
-                    SELECT r.*, g.first_name, g.last_name, g.phone_number, g.email,
-                        g.document, g.loyalty_card_id, g.bonus_points,
-                        h.name as hotel_name, h.city_id, c.city_name,
-                        dr.requested_room_category, dr.total_guest_number, dr.room_id,
-                        cr.category_name,
-                        rm.room_number, rm.floor, rm.view,
-                        (r.end_date - r.start_date) as nights
-                    FROM reservations r
-                    JOIN guests g ON r.payer_id = g.id
-                    JOIN hotels h ON r.hotel_id = h.id
-                    JOIN cities c ON h.city_id = c.id
-                    LEFT JOIN details_reservations dr ON dr.reservation_id = r.id
-                    LEFT JOIN categories_room cr ON dr.requested_room_category = cr.id
-                    LEFT JOIN rooms rm ON dr.room_id = rm.id
-                    WHERE r.id = %s
-                """,
-                    (reservation_id,),
-                )
+            for db_name in self.db.read_nodes():
+                with self.db.get_cursor(db_name) as cursor:
+                    cursor.execute(
+                        """
+                        SELECT r.*, g.first_name, g.last_name, g.phone_number, g.email,
+                            g.document, g.loyalty_card_id, g.bonus_points,
+                            h.name as hotel_name, h.city_id, c.city_name,
+                            dr.requested_room_category, dr.total_guest_number, dr.room_id,
+                            cr.category_name,
+                            rm.room_number, rm.floor, rm.view,
+                            (r.end_date - r.start_date) as nights
+                        FROM reservations r
+                        JOIN guests g ON r.payer_id = g.id
+                        JOIN hotels h ON r.hotel_id = h.id
+                        JOIN cities c ON h.city_id = c.id
+                        LEFT JOIN details_reservations dr ON dr.reservation_id = r.id
+                        LEFT JOIN categories_room cr ON dr.requested_room_category = cr.id
+                        LEFT JOIN rooms rm ON dr.room_id = rm.id
+                        WHERE r.id = %s
+                    """,
+                        (reservation_id,),
+                    )
 
-                reservation = cursor.fetchone()
-                if reservation:
-                    res_dict = dict(reservation)
-                    return self._convert_to_serializable(res_dict)
-                return {}
+                    row = cursor.fetchone()
+                    if row is not None:
+                        return serialize_row(cursor, row)
+            return {}
 
         except Exception as e:
             logger.error(f"Error getting reservation details: {e}")
             return {}
 
-    def register_guests(self, reservation_id: int, room_id: int, guest_ids: list[int]) -> dict[str, Any]:
+    def register_guests(
+        self, reservation_id: int, room_id: int, guest_ids: list[int], hotel_id: int | None = None
+    ) -> dict[str, Any]:
         try:
-            with self.db.get_cursor("central") as cursor:
-                cursor.execute(
-                    """
-                    SELECT r.id, r.hotel_id, r.payer_id, r.start_date, r.end_date
-                    FROM reservations r
-                    WHERE r.id = %s
-                """,
-                    (reservation_id,),
-                )
-                reservation = cursor.fetchone()
-
-                if not reservation:
+            if hotel_id is None:
+                hotel_id = self.router.get_reservation_hotel_id(reservation_id)
+                if hotel_id is None:
                     return {"error": "Reservation not found", "status": 404}
 
-                hotel_id = reservation["hotel_id"]
-                payer_guest_id = reservation["payer_id"]
-                start_date = reservation["start_date"]
-                end_date = reservation["end_date"]
-
-            city_name = self._get_city_by_hotel(hotel_id)
-            if city_name in ["Москва", "Санкт-Петербург", "Казань"]:
-                db_mapping = {
-                    "Москва": "filial1",
-                    "Санкт-Петербург": "filial2",
-                    "Казань": "filial3",
-                }
-                db_name = db_mapping[city_name]
-            else:
-                db_name = "central"
-
-            with self.db.get_cursor(db_name) as cursor:
-                cursor.execute(
-                    "SELECT id FROM rooms WHERE id = %s AND hotel_id = %s",
-                    (room_id, hotel_id),
-                )
-                room = cursor.fetchone()
-
-                if not room:
-                    return {"error": "Room not found in this hotel", "status": 400}
-
-                cursor.execute(
-                    """
-                    SELECT res.id, res.start_date, res.end_date
-                    FROM reservations res
-                    JOIN details_reservations dr ON dr.reservation_id = res.id
-                    WHERE dr.room_id = %s
-                    AND res.status IN ('confirmed', 'pending')
-                    AND res.id != %s
-                    AND NOT (res.end_date <= %s OR res.start_date >= %s)
-                """,
-                    (room_id, reservation_id, start_date, end_date),
-                )
-
-                conflicting_reservation = cursor.fetchone()
-                if conflicting_reservation:
-                    return {
-                        "error": f"Room is already occupied by another reservation (ID: {conflicting_reservation['id']}) for these dates",
-                        "status": 409,
-                    }
-
-                cursor.execute(
-                    """
-                    UPDATE details_reservations
-                    SET room_id = %s
-                    WHERE reservation_id = %s
-                """,
-                    (room_id, reservation_id),
-                )
-
-                cursor.execute(
-                    """
-                    SELECT id FROM details_reservations WHERE reservation_id = %s
-                """,
-                    (reservation_id,),
-                )
-
-                detail = cursor.fetchone()
-                if not detail:
-                    return {"error": "Booking details not found", "status": 400}
-
-                detail_id = detail["id"]
-
-                cursor.execute(
-                    """
-                    INSERT INTO room_reservation_guests (room_reservation_id, guest_id)
-                    VALUES (%s, %s)
-                    ON CONFLICT (room_reservation_id, guest_id) DO NOTHING
-                """,
-                    (detail_id, payer_guest_id),
-                )
-
-                for guest_id in guest_ids:
-                    if guest_id != payer_guest_id:
-                        cursor.execute("SELECT id FROM guests WHERE id = %s", (guest_id,))
-                        if cursor.fetchone():
-                            cursor.execute(
-                                """
-                                INSERT INTO room_reservation_guests (room_reservation_id, guest_id)
-                                VALUES (%s, %s)
-                                ON CONFLICT (room_reservation_id, guest_id) DO NOTHING
-                            """,
-                                (detail_id, guest_id),
-                            )
+            result = self.check_in(
+                hotel_id, [{"reservation_id": reservation_id, "room_id": room_id, "guest_ids": guest_ids}]
+            )
+            if "error" in result:
+                return result
 
-                cursor.execute(
-                    """
-                    UPDATE reservations
-                    SET status = 'confirmed'
-                    WHERE id = %s
-                """,
-                    (reservation_id,),
-                )
+            item = result["results"][0]
+            if "error" in item:
+                return {"error": item["error"], "status": item["status"]}
 
-            logger.info(f"Guests registered for reservation {reservation_id} in {db_name}, assigned room {room_id}")
             return {"success": True, "message": "Guests registered successfully"}
 
         except Exception as e:
             logger.error(f"Error registering guests: {e}")
             return {"error": str(e), "status": 500}
 
-    def _get_city_by_hotel(self, hotel_id: int) -> str | None:
+    def check_in(self, hotel_id: int, items: list[dict]) -> dict[str, Any]:
         try:
-            with self.db.get_cursor("central") as cursor:
-                cursor.execute(
-                    """
-                    SELECT c.city_name
-                    FROM hotels h
-                    JOIN cities c ON h.city_id = c.id
-                    WHERE h.id = %s
-                """,
-                    (hotel_id,),
-                )
+            check_ins = [
+                {
+                    "reservation_id": int(item["reservation_id"]),
+                    "room_id": int(item["room_id"]),
+                    "guest_ids": [int(guest_id) for guest_id in item.get("guest_ids") or []],
+                }
+                for item in items
+            ]
+        except (KeyError, TypeError, ValueError) as e:
+            return {"error": f"Invalid check-in item: {e}", "status": 400}
 
-                result = cursor.fetchone()
-                return result["city_name"] if result else None
+        if len({item["reservation_id"] for item in check_ins}) != len(check_ins):
+            return {"error": "Duplicate reservation_id in check-in list", "status": 400}
+
+        try:
+            db_name = self.router.get_db_name(hotel_id)
+
+            try:
+                with self.db.get_cursor(db_name) as cursor:
+                    registered = self._check_in_batch(cursor, hotel_id, check_ins)
+                conflicts = set()
+            except errors.ExclusionViolation:
+                # Хотя бы один номер уже занят: повторяем по одному, чтобы заселить остальных и указать конфликты
+                registered, conflicts = {}, set()
+                for item in check_ins:
+                    try:
+                        with self.db.get_cursor(db_name) as cursor:
+                            registered.update(self._check_in_batch(cursor, hotel_id, [item]))
+                    except errors.ExclusionViolation:
+                        conflicts.add(item["reservation_id"])
+
+            results = []
+            for item in check_ins:
+                reservation_id = item["reservation_id"]
+                if reservation_id in registered:
+                    results.append({"reservation_id": reservation_id, "room_id": item["room_id"], "success": True})
+                elif reservation_id in conflicts:
+                    results.append(
+                        {
+                            "reservation_id": reservation_id,
+                            "error": "Room is already occupied by another reservation for these dates",
+                            "status": 409,
+                        }
+                    )
+                else:
+                    results.append(
+                        {
+                            "reservation_id": reservation_id,
+                            "error": "Active reservation or room not found in this hotel",
+                            "status": 404,
+                        }
+                    )
+
+            logger.info(
+                f"Checked in {len(registered)} of {len(check_ins)} reservation(s) for hotel {hotel_id} in {db_name}"
+            )
+            return {"registered": len(registered), "results": results}
 
         except Exception as e:
-            logger.error(f"Error getting city by hotel: {e}")
-            return None
+            logger.error(f"Error checking in guests for hotel {hotel_id}: {e}")
+            return {"error": str(e), "status": 500}
+
+    def _check_in_batch(self, cursor, hotel_id: int, check_ins: list[dict]) -> dict[int, int]:
+        # Назначение номеров и подтверждение всех броней одним UPDATE: номер берется в первую
+        # незаселенную деталь брони, пересечения по номеру отсекает ограничение-исключение по room_stay
+        cursor.execute(
+            """
+            WITH req AS (
+                SELECT * FROM unnest(%s::int[], %s::int[]) AS req(reservation_id, room_id)
+            ),
+            target AS (
+                SELECT DISTINCT ON (dr.reservation_id) dr.id, req.reservation_id, req.room_id
+                FROM req
+                JOIN details_reservations dr ON dr.reservation_id = req.reservation_id
+                ORDER BY dr.reservation_id, dr.room_id IS NOT NULL, dr.id
+            ),
+            detail AS (
+                UPDATE details_reservations dr
+                SET room_id = t.room_id
+                FROM target t
+                JOIN reservations r ON r.id = t.reservation_id
+                JOIN rooms rm ON rm.id = t.room_id AND rm.hotel_id = r.hotel_id
+                WHERE dr.id = t.id
+                AND r.hotel_id = %s
+                AND r.status IN ('pending', 'confirmed')
+                RETURNING dr.id, dr.reservation_id, r.payer_id
+            ),
+            confirmed AS (
+                UPDATE reservations r
+                SET status = 'confirmed'
+                FROM detail
+                WHERE r.id = detail.reservation_id AND r.status <> 'confirmed'
+            )
+            SELECT id, reservation_id, payer_id FROM detail
+        """,
+            (
+                [item["reservation_id"] for item in check_ins],
+                [item["room_id"] for item in check_ins],
+                hotel_id,
+            ),
+        )
+        details = {row["reservation_id"]: row for row in cursor.fetchall()}
+        if not details:
+            return {}
+
+        # Плательщик заселяется всегда; несуществующие гости отбрасываются соединением с guests
+        detail_ids, guest_ids = [], []
+        for item in check_ins:
+            detail = details.get(item["reservation_id"])
+            if detail is None:
+                continue
+            for guest_id in dict.fromkeys([detail["payer_id"], *item["guest_ids"]]):
+                detail_ids.append(detail["id"])
+                guest_ids.append(guest_id)
+
+        cursor.execute(
+            """
+            INSERT INTO room_reservation_guests (room_reservation_id, guest_id)
+            SELECT ids.detail_id, g.id
+            FROM unnest(%s::bigint[], %s::int[]) AS ids(detail_id, guest_id)
+            JOIN guests g ON g.id = ids.guest_id
+            ON CONFLICT (room_reservation_id, guest_id) DO NOTHING
+        """,
+            (detail_ids, guest_ids),
+        )
+
+        return {reservation_id: detail["id"] for reservation_id, detail in details.items()}
 
     def _calculate_total_price(
         self,
         hotel_id: int,
         room_category_id: int,
-        start_date: str,
-        end_date: str,
+        start_date: date,
+        end_date: date,
         total_guests: int,
     ) -> float:
+        nights = (end_date - start_date).days
         try:
-            start = datetime.strptime(start_date, "%Y-%m-%d").date()
-            end = datetime.strptime(end_date, "%Y-%m-%d").date()
-            nights = (end - start).days
-
-            with self.db.get_cursor("central") as cursor:
-                cursor.execute(
-                    """
-                    SELECT cr.price_per_night, h.location_coeff_room
-                    FROM categories_room cr
-                    JOIN hotels h ON h.id = %s
-                    WHERE cr.id = %s
-                """,
-                    (hotel_id, room_category_id),
-                )
+            category = self.reference_cache.get_room_category(room_category_id)
+            if not category:
+                raise ValueError("Room category not found")
 
-                result = cursor.fetchone()
-                if not result:
-                    raise ValueError("Room category not found")
+            price_per_night = float(category["price_per_night"])
+            location_coeff = self.reference_cache.get_location_coeff(hotel_id)
 
-                price_per_night = float(result["price_per_night"])
-                location_coeff = float(result["location_coeff_room"] or 1.0)
-
-                total_price = price_per_night * location_coeff * nights
-
-                cursor.execute(
-                    """
-                    SELECT guests_capacity FROM categories_room WHERE id = %s
-                """,
-                    (room_category_id,),
-                )
+            total_price = price_per_night * location_coeff * nights
 
-                capacity_result = cursor.fetchone()
-                if capacity_result and total_guests > capacity_result["guests_capacity"]:
-                    extra_guests = total_guests - capacity_result["guests_capacity"]
-                    total_price += total_price * 0.2 * extra_guests
+            if total_guests > category["guests_capacity"]:
+                extra_guests = total_guests - category["guests_capacity"]
+                total_price += total_price * 0.2 * extra_guests
 
-                return round(total_price, 2)
+            return round(total_price, 2)
 
         except Exception as e:
             logger.error(f"Error calculating price: {e}")
             return 1000 * nights
-
-    def _check_room_availability_for_booking(
-        self, hotel_id: int, room_category_id: int, start_date: str, end_date: str
-    ) -> dict[str, Any]:
-        try:
-            city_name = self._get_city_by_hotel(hotel_id)
-
-            if city_name in ["Москва", "Санкт-Петербург", "Казань"]:
-                db_mapping = {
-                    "Москва": "filial1",
-                    "Санкт-Петербург": "filial2",
-                    "Казань": "filial3",
-                }
-                db_name = db_mapping.get(city_name, "central")
-            else:
-                db_name = "central"
-
-            with self.db.get_cursor(db_name) as cursor:
-                cursor.execute(
-                    """
-                    SELECT COUNT(*) as total_rooms
-                    FROM rooms r
-                    WHERE r.hotel_id = %s AND r.categories_room_id = %s
-                """,
-                    (hotel_id, room_category_id),
-                )
-
-                total_result = cursor.fetchone()
-                total_rooms = total_result["total_rooms"] if total_result else 0
-
-                cursor.execute(
-                    """
-                    SELECT COUNT(*) as reserved_rooms
-                    FROM reservations res
-                    JOIN details_reservations dr ON dr.reservation_id = res.id
-                    WHERE res.hotel_id = %s
-                    AND dr.requested_room_category = %s
-                    AND res.status IN ('confirmed', 'pending')
-                    AND NOT (res.end_date <= %s OR res.start_date >= %s)
-                """,
-                    (hotel_id, room_category_id, start_date, end_date),
-                )
-
-                reserved_result = cursor.fetchone()
-                reserved_rooms = reserved_result["reserved_rooms"] if reserved_result else 0
-
-                available_rooms_count = max(0, total_rooms - reserved_rooms)
-
-                return {
-                    "available": available_rooms_count > 0,
-                    "available_count": available_rooms_count,
-                    "total_rooms": total_rooms,
-                    "reserved_rooms": reserved_rooms,
-                }
-
-        except Exception as e:
-            logger.error(f"Error checking room availability for booking: {e}")
-            return {
-                "available": False,
-                "available_count": 0,
-                "total_rooms": 0,
-                "reserved_rooms": 0,
-                "error": str(e),
-            }
@@ -1,8 +1,8 @@
 import logging
-from datetime import date, datetime, time
-from decimal import Decimal
 from typing import Any
 
+from serialization import serialize_row
+
 logger = logging.getLogger(__name__)
 
 
@@ -10,23 +10,6 @@ class GuestService:
     def __init__(self, db_manager):
         self.db = db_manager
 
-    def _convert_to_serializable(self, obj):
-        if isinstance(obj, dict):
-            return {k: self._convert_to_serializable(v) for k, v in obj.items()}
-        elif isinstance(obj, list):
-            return [self._convert_to_serializable(item) for item in obj]
-        elif isinstance(obj, (datetime, date)):
-            return obj.isoformat()
-        elif isinstance(obj, time):
-            return obj.strftime("%H:%M:%S")
-        elif isinstance(obj, Decimal):
-            return float(obj)
-        elif isinstance(obj, bytes):
-            return obj.decode("utf-8")
-        elif hasattr(obj, "__dict__"):
-            return self._convert_to_serializable(dict(obj))
-        return obj
-
     def create_guest(self, guest_data: dict[str, Any], db_name: str = "central") -> dict[str, Any]:
         try:
             first_name = guest_data.get("first_name", "")
@@ -78,11 +61,7 @@ class GuestService:
                     (guest_id,),
                 )
 
-                guest = cursor.fetchone()
-                if guest:
-                    guest_dict = dict(guest)
-                    return self._convert_to_serializable(guest_dict)
-                return None
+                return serialize_row(cursor, cursor.fetchone())
 
         except Exception as e:
             logger.error(f"Error getting guest details: {e}")
@@ -1,31 +1,16 @@
 import logging
-from datetime import datetime, time
-from decimal import Decimal
 from typing import Any
 
+from serialization import serialize_row, serialize_rows
+
 logger = logging.getLogger(__name__)
 
 
 class HotelService:
-    def __init__(self, db_manager):
+    def __init__(self, db_manager, router, reference_cache):
         self.db = db_manager
-
-    def _convert_to_serializable(self, obj):
-        if isinstance(obj, dict):
-            return {k: self._convert_to_serializable(v) for k, v in obj.items()}
-        elif isinstance(obj, list):
-            return [self._convert_to_serializable(item) for item in obj]
-        elif isinstance(obj, (datetime, time)):
-            if isinstance(obj, time):
-                return obj.strftime("%H:%M")
-            return obj.isoformat()
-        elif isinstance(obj, Decimal):
-            return float(obj)
-        elif isinstance(obj, bytes):
-            return obj.decode("utf-8")
-        elif hasattr(obj, "__dict__"):
-            return self._convert_to_serializable(dict(obj))
-        return obj
+        self.router = router
+        self.reference_cache = reference_cache
 
     def get_all_hotels(self, city: str | None = None) -> list[dict]:
         try:
@@ -57,14 +42,7 @@ class HotelService:
                         ORDER BY c.city_name, h.name
                     """)
 
-                hotels = cursor.fetchall()
-                result = []
-                for hotel in hotels:
-                    hotel_dict = dict(hotel)
-                    hotel_dict = self._convert_to_serializable(hotel_dict)
-                    result.append(hotel_dict)
-
-                return result
+                return serialize_rows(cursor, cursor.fetchall(), time_format="%H:%M")
 
         except Exception as e:
             logger.error(f"Error getting hotels: {e}")
@@ -84,11 +62,7 @@ class HotelService:
                     (hotel_id,),
                 )
 
-                hotel = cursor.fetchone()
-                if hotel:
-                    hotel_dict = dict(hotel)
-                    return self._convert_to_serializable(hotel_dict)
-                return None
+                return serialize_row(cursor, cursor.fetchone(), time_format="%H:%M")
 
         except Exception as e:
             logger.error(f"Error getting hotel details: {e}")
@@ -121,6 +95,7 @@ class HotelService:
                 if cursor.rowcount == 0:
                     return {"error": "Hotel not found", "status": 404}
 
+            self.reference_cache.invalidate({"hotels"})
             logger.info(f"Hotel {hotel_id} updated successfully")
             return {"success": True, "message": "Hotel updated successfully"}
 
@@ -130,17 +105,7 @@ class HotelService:
 
     def get_hotel_rooms(self, hotel_id: int) -> list[dict]:
         try:
-            city_name = self._get_city_by_hotel(hotel_id)
-
-            if city_name in ["Москва", "Санкт-Петербург", "Казань"]:
-                db_mapping = {
-                    "Москва": "filial1",
-                    "Санкт-Петербург": "filial2",
-                    "Казань": "filial3",
-                }
-                db_name = db_mapping.get(city_name, "central")
-            else:
-                db_name = "central"
+            db_name = self.router.get_db_name(hotel_id)
 
             with self.db.get_cursor(db_name) as cursor:
                 cursor.execute(
@@ -155,14 +120,7 @@ class HotelService:
                     (hotel_id,),
                 )
 
-                rooms = cursor.fetchall()
-                result = []
-                for room in rooms:
-                    room_dict = dict(room)
-                    room_dict = self._convert_to_serializable(room_dict)
-                    result.append(room_dict)
-
-                return result
+                return serialize_rows(cursor, cursor.fetchall(), time_format="%H:%M")
 
         except Exception as e:
             logger.error(f"Error getting hotel rooms: {e}")
@@ -170,17 +128,7 @@ class HotelService:
 
     def get_hotel_amenities(self, hotel_id: int) -> list[dict]:
         try:
-            city_name = self._get_city_by_hotel(hotel_id)
-
-            if city_name in ["Москва", "Санкт-Петербург", "Казань"]:
-                db_mapping = {
-                    "Москва": "filial1",
-                    "Санкт-Петербург": "filial2",
-                    "Казань": "filial3",
-                }
-                db_name = db_mapping.get(city_name, "central")
-            else:
-                db_name = "central"
+            db_name = self.router.get_db_name(hotel_id)
 
             with self.db.get_cursor(db_name) as cursor:
                 cursor.execute(
@@ -194,39 +142,12 @@ class HotelService:
                     (hotel_id,),
                 )
 
-                amenities = cursor.fetchall()
-                result = []
-                for amenity in amenities:
-                    amenity_dict = dict(amenity)
-                    amenity_dict = self._convert_to_serializable(amenity_dict)
-                    result.append(amenity_dict)
-
-                return result
+                return serialize_rows(cursor, cursor.fetchall(), time_format="%H:%M")
 
         except Exception as e:
             logger.error(f"Error getting hotel amenities: {e}")
             return []
 
-    def _get_city_by_hotel(self, hotel_id: int) -> str | None:
-        try:
-            with self.db.get_cursor("central") as cursor:
-                cursor.execute(
-                    """
-                    SELECT c.city_name
-                    FROM hotels h
-                    JOIN cities c ON h.city_id = c.id
-                    WHERE h.id = %s
-                """,
-                    (hotel_id,),
-                )
-
-                result = cursor.fetchone()
-                return result["city_name"] if result else None
-
-        except Exception as e:
-            logger.error(f"Error getting city by hotel: {e}")
-            return None
-
     def get_hotel_room_categories_with_counts(self, hotel_id: int) -> list[dict]:
         try:
             with self.db.get_cursor("central") as cursor:
@@ -247,18 +168,12 @@ class HotelService:
                     (hotel_id, hotel_id),
                 )
 
-                rooms_data = cursor.fetchall()
-
-                rooms = []
-                for room in rooms_data:
-                    room_dict = dict(room)
-                    location_coeff = float(room["location_coeff_room"] or 1.0)
-                    price_per_night = float(room["price_per_night"])
+                rooms = serialize_rows(cursor, cursor.fetchall(), time_format="%H:%M")
 
-                    room_dict["price_per_night"] = round(price_per_night * location_coeff, 2)
-                    room_dict["room_count"] = room["total_rooms_count"]
-                    room_dict = self._convert_to_serializable(room_dict)
-                    rooms.append(room_dict)
+                for room in rooms:
+                    location_coeff = room["location_coeff_room"] or 1.0
+                    room["price_per_night"] = round(room["price_per_night"] * location_coeff, 2)
+                    room["room_count"] = room["total_rooms_count"]
 
                 return rooms
 
@@ -270,11 +185,7 @@ class HotelService:
         try:
             with self.db.get_cursor("central") as cursor:
                 cursor.execute("SELECT * FROM categories_room WHERE id = %s", (room_category_id,))
-                room_category = cursor.fetchone()
-                if room_category:
-                    room_category = dict(room_category)
-                    return self._convert_to_serializable(room_category)
-                return None
+                return serialize_row(cursor, cursor.fetchone(), time_format="%H:%M")
         except Exception as e:
             logger.error(f"Error getting room category details: {e}")
             return None
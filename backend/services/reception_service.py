@@ -1,72 +1,108 @@
 import logging
-from datetime import date, datetime, time
-from decimal import Decimal
+from collections.abc import Iterator
+from datetime import date
 from typing import Any
 
+from config import Config
+from pagination import keyset_page
+from serialization import RowSerializer, serialize_row, serialize_rows
+
 logger = logging.getLogger(__name__)
 
 
 class ReceptionService:
-    def __init__(self, db_manager):
+    EXPORT_COLUMNS = [
+        "id",
+        "hotel_id",
+        "hotel_name",
+        "city_name",
+        "create_date",
+        "start_date",
+        "end_date",
+        "status",
+        "total_price",
+        "payments_status",
+        "payer_id",
+        "first_name",
+        "last_name",
+        "phone_number",
+        "email",
+    ]
+
+    def __init__(self, db_manager, router):
         self.db = db_manager
-
-    def _convert_to_serializable(self, obj):
-        if isinstance(obj, dict):
-            return {k: self._convert_to_serializable(v) for k, v in obj.items()}
-        elif isinstance(obj, list):
-            return [self._convert_to_serializable(item) for item in obj]
-        elif isinstance(obj, (datetime, date)):
-            return obj.isoformat()
-        elif isinstance(obj, time):
-            return obj.strftime("%H:%M:%S")
-        elif isinstance(obj, Decimal):
-            return float(obj)
-        elif isinstance(obj, bytes):
-            return obj.decode("utf-8")
-        elif hasattr(obj, "__dict__"):
-            return self._convert_to_serializable(dict(obj))
-        return obj
+        self.router = router
 
     def get_cities_with_reservations_count(self) -> list[dict]:
         try:
-            with self.db.get_cursor("central") as cursor:
-                cursor.execute("""
-                    SELECT DISTINCT c.city_name, COUNT(r.id) as reservations_count
-                    FROM cities c
-                    LEFT JOIN hotels h ON c.id = h.city_id
-                    LEFT JOIN reservations r ON r.hotel_id = h.id AND r.status IN ('pending', 'confirmed')
-                    GROUP BY c.id, c.city_name
-                    ORDER BY c.city_name
-                """)
-
-                cities = cursor.fetchall()
-                cities_list = []
-                for city in cities:
-                    city_dict = {
-                        "city_name": city["city_name"],
-                        "reservations_count": city["reservations_count"],
-                    }
-                    cities_list.append(city_dict)
-
-                return cities_list
+            # Бронирования создаются на филиалах, считаем их там и суммируем по городам
+            result = self.db.scatter_gather("""
+                SELECT c.city_name, COUNT(r.id) as reservations_count
+                FROM cities c
+                LEFT JOIN hotels h ON c.id = h.city_id
+                LEFT JOIN reservations r ON r.hotel_id = h.id AND r.status IN ('pending', 'confirmed')
+                GROUP BY c.id, c.city_name
+            """)
+
+            if result["partial"]:
+                logger.warning(f"Reservation counts are partial: {result['nodes']}")
+
+            counts = {}
+            for city in result["rows"]:
+                counts[city["city_name"]] = counts.get(city["city_name"], 0) + city["reservations_count"]
+
+            return [
+                {"city_name": city_name, "reservations_count": reservations_count}
+                for city_name, reservations_count in sorted(counts.items())
+            ]
         except Exception as e:
             logger.error(f"Error getting cities with reservations count: {e}")
             return []
 
-    def get_city_reservations(self, city_name: str) -> list[dict]:
+    def get_city_reservations(self, city_name: str, filters: dict | None = None, limit: int | None = None) -> dict:
+        filters = filters or {}
+        limit = limit or Config.RECEPTION_PAGE_SIZE
         try:
-            if city_name in ["Москва", "Санкт-Петербург", "Казань"]:
-                db_mapping = {
-                    "Москва": "filial1",
-                    "Санкт-Петербург": "filial2",
-                    "Казань": "filial3",
-                }
-                db_name = db_mapping[city_name]
-            else:
+            db_name = self.router.get_db_name_by_city(city_name)
+
+            if not self.db.is_available(db_name):
+                logger.warning(f"{db_name} is unavailable, reading reservations for {city_name} from central")
                 db_name = "central"
 
+            status = filters.get("status")
+            params = {
+                "city": city_name,
+                "statuses": [status] if status else ["pending", "confirmed"],
+                "hotel_id": filters.get("hotel_id"),
+                "arrival_from": filters.get("arrival_from"),
+                "arrival_to": filters.get("arrival_to"),
+                "after_date": filters.get("after_date"),
+                "after_id": filters.get("after_id"),
+                "limit": limit + 1,
+            }
+
             with self.db.get_cursor(db_name) as cursor:
-                cursor.execute("""
+                # Сначала страница бронирований по индексу (create_date, id), затем соединения только для нее
+                cursor.execute(
+                    """
+                    WITH page AS (
+                        SELECT r.id, r.hotel_id, r.create_date, r.start_date, r.end_date,
+                               r.status, r.total_price, r.payments_status, r.payer_id
+                        FROM reservations r
+                        WHERE r.hotel_id IN (
+                            SELECT h.id FROM hotels h
+                            JOIN cities c ON h.city_id = c.id
+                            WHERE c.city_name = %(city)s
+                        )
+                        AND r.status = ANY(%(statuses)s)
+                        AND (%(hotel_id)s::int IS NULL OR r.hotel_id = %(hotel_id)s)
+                        AND (%(arrival_from)s::date IS NULL OR r.start_date >= %(arrival_from)s)
+                        AND (%(arrival_to)s::date IS NULL OR r.start_date <= %(arrival_to)s)
+                        AND (%(after_date)s::timestamp IS NULL
+                             OR (r.create_date, r.id) < (%(after_date)s, %(after_id)s))
+                        ORDER BY r.create_date DESC, r.id DESC
+                        LIMIT %(limit)s
+                    )
                     SELECT r.id, r.hotel_id, r.create_date, r.start_date, r.end_date,
                            r.status, r.total_price, r.payments_status, r.payer_id,
                            g.first_name, g.last_name, g.phone_number, g.email,
@@ -74,64 +110,58 @@ class ReceptionService:
                            dr.requested_room_category, dr.total_guest_number, dr.room_id,
                            cr.category_name,
                            COUNT(rrg.guest_id) as registered_guests_count
-                    FROM reservations r
+                    FROM page r
                     JOIN guests g ON r.payer_id = g.id
                     JOIN hotels h ON r.hotel_id = h.id
                     LEFT JOIN details_reservations dr ON dr.reservation_id = r.id
                     LEFT JOIN categories_room cr ON dr.requested_room_category = cr.id
                     LEFT JOIN room_reservation_guests rrg ON rrg.room_reservation_id = dr.id
-                    WHERE r.status IN ('pending', 'confirmed')
                     GROUP BY r.id, r.hotel_id, r.create_date, r.start_date, r.end_date,
                              r.status, r.total_price, r.payments_status, r.payer_id,
                              g.first_name, g.last_name, g.phone_number, g.email,
                              h.name, dr.requested_room_category, dr.total_guest_number,
                              dr.room_id, cr.category_name
-                    ORDER BY r.create_date DESC
-                """)
-
-                reservations = cursor.fetchall()
-
-                reservations_list = []
-                for res in reservations:
-                    res_dict = dict(res)
-                    res_dict = self._convert_to_serializable(res_dict)
-                    reservations_list.append(res_dict)
+                    ORDER BY r.create_date DESC, r.id DESC
+                """,
+                    params,
+                )
 
-                return reservations_list
+                return keyset_page(serialize_rows(cursor, cursor.fetchall()), limit)
 
         except Exception as e:
             logger.error(f"Error getting city reservations for {city_name}: {e}")
-            return []
+            return {"reservations": [], "next_cursor": None}
 
     def get_reservation_details_with_payment(self, reservation_id: int) -> dict | None:
         try:
-            with self.db.get_cursor("central") as cursor:
-                cursor.execute(
-                    """
-                    SELECT r.*, g.first_name, g.last_name, g.phone_number, g.email,
-                           g.document, g.loyalty_card_id, g.bonus_points,
-                           h.name as hotel_name, h.city_id, c.city_name,
-                           dr.requested_room_category, dr.total_guest_number, dr.room_id,
-                           cr.category_name,
-                           rm.room_number, rm.floor, rm.view,
-                           (r.end_date - r.start_date) as nights
-                    FROM reservations r
-                    JOIN guests g ON r.payer_id = g.id
-                    JOIN hotels h ON r.hotel_id = h.id
-                    JOIN cities c ON h.city_id = c.id
-                    LEFT JOIN details_reservations dr ON dr.reservation_id = r.id
-                    LEFT JOIN categories_room cr ON dr.requested_room_category = cr.id
-                    LEFT JOIN rooms rm ON dr.room_id = rm.id
-                    WHERE r.id = %s
-                """,
-                    (reservation_id,),
-                )
-
-                reservation = cursor.fetchone()
-                if reservation:
-                    res_dict = dict(reservation)
-                    return self._convert_to_serializable(res_dict)
-                return None
+            # Сначала филиалы с записями сессии, еще не примененными на центральном узле
+            for db_name in self.db.read_nodes():
+                with self.db.get_cursor(db_name) as cursor:
+                    cursor.execute(
+                        """
+                        SELECT r.*, g.first_name, g.last_name, g.phone_number, g.email,
+                               g.document, g.loyalty_card_id, g.bonus_points,
+                               h.name as hotel_name, h.city_id, c.city_name,
+                               dr.requested_room_category, dr.total_guest_number, dr.room_id,
+                               cr.category_name,
+                               rm.room_number, rm.floor, rm.view,
+                               (r.end_date - r.start_date) as nights
+                        FROM reservations r
+                        JOIN guests g ON r.payer_id = g.id
+                        JOIN hotels h ON r.hotel_id = h.id
+                        JOIN cities c ON h.city_id = c.id
+                        LEFT JOIN details_reservations dr ON dr.reservation_id = r.id
+                        LEFT JOIN categories_room cr ON dr.requested_room_category = cr.id
+                        LEFT JOIN rooms rm ON dr.room_id = rm.id
+                        WHERE r.id = %s
+                    """,
+                        (reservation_id,),
+                    )
+
+                    row = cursor.fetchone()
+                    if row is not None:
+                        return serialize_row(cursor, row)
+            return None
 
         except Exception as e:
             logger.error(f"Error getting reservation details: {e}")
@@ -139,23 +169,63 @@ class ReceptionService:
 
     def get_payment_info_for_reservation(self, reservation_id: int) -> dict[str, Any]:
         try:
-            with self.db.get_cursor("central") as cursor:
+            for db_name in self.db.read_nodes():
+                with self.db.get_cursor(db_name) as cursor:
+                    cursor.execute(
+                        """
+                        SELECT r.*, h.name as hotel_name, g.first_name, g.last_name
+                        FROM reservations r
+                        JOIN hotels h ON r.hotel_id = h.id
+                        JOIN guests g ON r.payer_id = g.id
+                        WHERE r.id = %s
+                    """,
+                        (reservation_id,),
+                    )
+
+                    row = cursor.fetchone()
+                    if row is not None:
+                        return serialize_row(cursor, row)
+            return {}
+
+        except Exception as e:
+            logger.error(f"Error getting payment info for reservation: {e}")
+            return {}
+
+    def get_export_nodes(self, city_name: str | None = None) -> list[str]:
+        if city_name:
+            return [self.router.get_db_name_by_city(city_name)]
+        return self.db.filial_names()
+
+    def export_reservations(
+        self,
+        db_names: list[str],
+        city_name: str | None = None,
+        start_date: date | None = None,
+        end_date: date | None = None,
+    ) -> Iterator[dict]:
+        # Серверный курсор на каждом узле: в памяти держится только текущая порция строк
+        for db_name in db_names:
+            with self.db.get_cursor(db_name, name="reservations_export") as cursor:
+                cursor.itersize = Config.EXPORT_ITERSIZE
                 cursor.execute(
                     """
-                    SELECT r.*, h.name as hotel_name, g.first_name, g.last_name
+                    SELECT r.id, r.hotel_id, h.name as hotel_name, c.city_name,
+                           r.create_date, r.start_date, r.end_date, r.status,
+                           r.total_price, r.payments_status, r.payer_id,
+                           g.first_name, g.last_name, g.phone_number, g.email
                     FROM reservations r
                     JOIN hotels h ON r.hotel_id = h.id
+                    JOIN cities c ON h.city_id = c.id
                     JOIN guests g ON r.payer_id = g.id
-                    WHERE r.id = %s
+                    WHERE (%(city)s::text IS NULL OR c.city_name = %(city)s)
+                    AND r.stay && daterange(%(start)s::date, %(end)s::date, '[)')
+                    ORDER BY r.id
                 """,
-                    (reservation_id,),
+                    {"city": city_name, "start": start_date, "end": end_date},
                 )
 
-                reservation = cursor.fetchone()
-                if reservation:
-                    return self._convert_to_serializable(dict(reservation))
-                return {}
-
-        except Exception as e:
-            logger.error(f"Error getting payment info for reservation: {e}")
-            return {}
+                serializer = None
+                for row in cursor:
+                    if serializer is None:
+                        serializer = RowSerializer.for_cursor(cursor)
+                    yield serializer.row(row)
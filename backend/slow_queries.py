@@ -0,0 +1,113 @@
+import logging
+import random
+import re
+import threading
+from collections import deque
+from datetime import datetime
+
+import psycopg2
+from psycopg2 import errors, extensions, sql
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+_COMMENT = re.compile(r"--[^\n]*")
+_PLACEHOLDER = re.compile(r"%\(\w+\)s|%s")
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_WHITESPACE = re.compile(r"\s+")
+
+# Операторы, для которых строится план; служебные (SET, CALL и т.п.) пропускаются
+_EXPLAINABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE")
+
+
+def normalize_sql(query: str) -> str:
+    query = _COMMENT.sub(" ", query)
+    query = _PLACEHOLDER.sub("?", query)
+    query = _STRING.sub("?", query)
+    query = _NUMBER.sub("?", query)
+    return _WHITESPACE.sub(" ", query).strip()
+
+
+class SlowQueryLog:
+    """Журнал медленных запросов с выборочным EXPLAIN (ANALYZE, BUFFERS) в кольцевом буфере"""
+
+    def __init__(self):
+        self.threshold = Config.SLOW_QUERY_THRESHOLD_MS / 1000
+        self._entries = deque(maxlen=Config.SLOW_QUERY_LOG_SIZE)
+        self._explaining = threading.Semaphore(Config.SLOW_QUERY_EXPLAIN_WORKERS)
+
+    def record(self, cursor, query, params, elapsed: float) -> None:
+        text = query.as_string(cursor) if isinstance(query, sql.Composable) else query
+        if isinstance(text, bytes):
+            text = text.decode("utf-8", "replace")
+
+        entry = {
+            "time": datetime.now().isoformat(),
+            "node": cursor.node,
+            "caller": cursor.caller,
+            "duration_ms": round(elapsed * 1000, 3),
+            "query": normalize_sql(text),
+            "plan": None,
+            "analyzed": False,
+        }
+        self._entries.append(entry)
+        logger.warning(
+            f"Slow query on {entry['node']} in {entry['caller']} ({entry['duration_ms']}ms): {entry['query']}"
+        )
+
+        # План строится в фоне для доли запросов и не более чем SLOW_QUERY_EXPLAIN_WORKERS одновременно
+        if random.random() >= Config.SLOW_QUERY_EXPLAIN_SAMPLE or not self._can_explain(entry["query"]):
+            return
+        if not self._explaining.acquire(blocking=False):
+            return
+        try:
+            # Полный текст с параметрами нужен для плана; нормализованный — только для журнала
+            statement = cursor.mogrify(query, params)
+            threading.Thread(
+                target=self._explain, args=(entry, statement), name="slow-query-explain", daemon=True
+            ).start()
+        except Exception as e:
+            self._explaining.release()
+            logger.warning(f"Failed to schedule EXPLAIN for slow query on {entry['node']}: {e}")
+
+    def entries(self, limit: int | None = None) -> list[dict]:
+        entries = list(reversed(self._entries))
+        return entries[:limit] if limit else entries
+
+    @staticmethod
+    def _can_explain(query: str) -> bool:
+        # Повторный захват advisory-блокировок ради плана недопустим
+        return query.upper().startswith(_EXPLAINABLE) and "pg_advisory" not in query
+
+    def _explain(self, entry: dict, statement: bytes) -> None:
+        # Отдельное соединение: пул и транзакция исходного запроса не затрагиваются.
+        # ANALYZE — только в READ ONLY транзакции; изменяющие запросы получают план без выполнения
+        conn = None
+        try:
+            conn = psycopg2.connect(
+                Config.DATABASES[entry["node"]],
+                connect_timeout=Config.DB_CONNECT_TIMEOUT,
+                options=f"-c statement_timeout={Config.SLOW_QUERY_EXPLAIN_TIMEOUT_MS}",
+            )
+            conn.set_session(readonly=True)
+            cursor = conn.cursor(cursor_factory=extensions.cursor)
+            try:
+                cursor.execute(b"EXPLAIN (ANALYZE, BUFFERS) " + statement)
+                entry["analyzed"] = True
+            except errors.ReadOnlySqlTransaction:
+                conn.rollback()
+                cursor.execute(b"EXPLAIN " + statement)
+                entry["analyzed"] = False
+            entry["plan"] = "\n".join(row[0] for row in cursor.fetchall())
+        except Exception as e:
+            entry["plan_error"] = str(e).strip()
+            logger.warning(f"Failed to explain slow query on {entry['node']}: {entry['plan_error']}")
+        finally:
+            if conn is not None:
+                conn.close()
+            self._explaining.release()
+
+
+slow_query_log = SlowQueryLog()
@@ -0,0 +1,92 @@
+import os
+import sys
+from datetime import datetime
+
+import psycopg2
+import pytest
+from psycopg2.extras import RealDictCursor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Тесты с БД выполняются на базе, созданной скриптами init/ (schema.sql, fill.sql, functions.sql),
+# каждый — в своей транзакции с откатом. Без TEST_DATABASE_URL они пропускаются
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+
+@pytest.fixture
+def conn():
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL is not set")
+    conn = psycopg2.connect(TEST_DATABASE_URL)
+    try:
+        yield conn
+    finally:
+        conn.rollback()
+        conn.close()
+
+
+@pytest.fixture
+def cursor(conn):
+    with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+        yield cursor
+
+
+@pytest.fixture
+def room(cursor):
+    # Справочники и отели есть в fill.sql; номер и гость создаются в транзакции теста
+    cursor.execute(
+        """
+        SELECT h.id AS hotel_id, cr.id AS category_id
+        FROM hotels h CROSS JOIN categories_room cr
+        ORDER BY h.id, cr.id
+        LIMIT 1
+    """
+    )
+    room = cursor.fetchone()
+    if room is None:
+        pytest.fail("Test database has no hotels or room categories: load init/schema.sql and init/fill.sql")
+
+    cursor.execute(
+        """
+        INSERT INTO rooms (hotel_id, categories_room_id, room_number, floor)
+        VALUES (%s, %s, 'TEST-1', 1)
+        RETURNING id
+    """,
+        (room["hotel_id"], room["category_id"]),
+    )
+    room["id"] = cursor.fetchone()["id"]
+    cursor.execute(
+        """
+        INSERT INTO guests (first_name, last_name, phone_number, birth_date)
+        VALUES ('Тест', 'Тестов', '+70000000000', '1990-01-01')
+        RETURNING id
+    """
+    )
+    room["guest_id"] = cursor.fetchone()["id"]
+    return room
+
+
+@pytest.fixture
+def reserve(cursor, room):
+    # Бронирование одного номера (или только категории при room_id=None) за пределами дат fill.sql
+    def reserve(start_date, end_date, status="confirmed", room_id=None):
+        cursor.execute(
+            """
+            INSERT INTO reservations (hotel_id, create_date, status, payments_status, payer_id, start_date, end_date)
+            VALUES (%s, %s, %s, 'unpaid', %s, %s, %s)
+            RETURNING id
+        """,
+            (room["hotel_id"], datetime.now(), status, room["guest_id"], start_date, end_date),
+        )
+        reservation_id = cursor.fetchone()["id"]
+        cursor.execute(
+            """
+            INSERT INTO details_reservations
+                (reservation_id, room_id, guest_id, requested_room_category, total_guest_number)
+            VALUES (%s, %s, %s, %s, 1)
+        """,
+            (reservation_id, room_id, room["guest_id"], room["category_id"]),
+        )
+        return reservation_id
+
+    return reserve
@@ -0,0 +1,51 @@
+import pytest
+
+from services.booking_service import BookingService
+
+# Проверки выполняются до обращения к маршрутизатору и БД
+service = BookingService(db_manager=None, router=None, reference_cache=None)
+
+GROUP = {
+    "hotel_id": 1,
+    "guest_id": 1,
+    "start_date": "2099-01-10",
+    "end_date": "2099-01-12",
+    "rooms": [{"room_category_id": 1}],
+}
+SINGLE = {"hotel_id": 1, "guest_id": 1, "room_category_id": 1, "start_date": "2099-01-10", "end_date": "2099-01-12"}
+
+
+@pytest.mark.parametrize("payer_id", ["abc", "1; DROP TABLE guests", [1], {"id": 1}, 1.5, True])
+def test_group_booking_rejects_non_integer_payer(payer_id):
+    result = service.create_group_booking({**GROUP, "guest_id": payer_id})
+
+    assert result == {"error": "hotel_id and guest_id must be integers", "status": 400}
+
+
+def test_group_booking_requires_payer():
+    result = service.create_group_booking({**GROUP, "guest_id": None})
+
+    assert result == {"error": "Missing required fields: guest_id", "status": 400}
+
+
+@pytest.mark.parametrize("field", ["hotel_id", "guest_id"])
+def test_booking_rejects_non_integer_ids(field):
+    result = service.create_booking({**SINGLE, field: "abc"})
+
+    assert result == {"error": "hotel_id and guest_id must be integers", "status": 400}
+
+
+@pytest.mark.parametrize(
+    "start_date, end_date, error",
+    [
+        ("2099-01-12", "2099-01-10", "End date must be after start date"),
+        ("2099-01-10", "2099-01-10", "End date must be after start date"),
+        ("10.01.2099", "2099-01-12", "Invalid date format. Use YYYY-MM-DD"),
+        (20990110, "2099-01-12", "Invalid date format. Use YYYY-MM-DD"),
+    ],
+)
+def test_invalid_stay_is_rejected_before_locking(start_date, end_date, error):
+    for create, payload in ((service.create_booking, SINGLE), (service.create_group_booking, GROUP)):
+        result = create({**payload, "start_date": start_date, "end_date": end_date})
+
+        assert result == {"error": error, "status": 400}
@@ -0,0 +1,124 @@
+import os
+import time
+
+import pytest
+from psycopg2 import errors
+
+from database import CircuitBreaker, ConnectionPool, DatabaseManager, NodeUnavailableError, PoolTimeoutError
+
+
+def tripped(breaker):
+    for _ in range(breaker.threshold):
+        breaker.record_failure(ConnectionError("connection refused"))
+    return breaker
+
+
+def new_breaker(base_delay=0.0, probe_timeout=30.0):
+    return CircuitBreaker("filial1", threshold=2, base_delay=base_delay, max_delay=1.0, probe_timeout=probe_timeout)
+
+
+def test_breaker_opens_after_threshold():
+    breaker = new_breaker(base_delay=10.0)
+    breaker.record_failure(ConnectionError("connection refused"))
+    assert breaker.allow()
+
+    breaker.record_failure(ConnectionError("connection refused"))
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.is_open()
+    assert not breaker.allow()
+
+
+def test_single_probe_is_admitted_after_delay():
+    breaker = tripped(new_breaker())
+
+    assert not breaker.is_open()
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.is_open()
+    assert not breaker.allow()
+
+
+def test_successful_probe_closes_breaker():
+    breaker = tripped(new_breaker())
+    breaker.allow()
+    breaker.record_success()
+
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.failures == 0
+    assert breaker.allow()
+
+
+def test_failed_probe_reopens_breaker():
+    breaker = tripped(new_breaker(base_delay=10.0))
+    breaker.open_until = 0.0
+    breaker.allow()
+    breaker.record_failure(ConnectionError("connection refused"))
+
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+
+def test_lost_probe_is_replaced_after_probe_timeout():
+    breaker = tripped(new_breaker(probe_timeout=0.05))
+    assert breaker.allow()
+    assert not breaker.allow()
+
+    time.sleep(0.06)
+
+    assert not breaker.is_open()
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+
+@pytest.fixture
+def manager(conn):
+    manager = DatabaseManager()
+    manager.pools = {"central": ConnectionPool("central", conn.dsn, 0, 1, 0.05)}
+    manager._pid = os.getpid()
+    yield manager
+    manager.pools["central"].closeall()
+
+
+def test_probe_with_sql_error_closes_breaker(manager):
+    breaker = tripped(manager.pools["central"].breaker)
+    breaker.open_until = 0.0
+
+    with pytest.raises(errors.UndefinedTable):
+        with manager.get_cursor("central") as cursor:
+            cursor.execute("SELECT * FROM missing_table")
+
+    assert breaker.state == CircuitBreaker.CLOSED
+    with manager.get_cursor("central") as cursor:
+        cursor.execute("SELECT 1 AS one")
+        assert cursor.fetchone() == {"one": 1}
+
+
+def test_probe_with_application_error_on_idle_connection_closes_breaker(manager):
+    pool = manager.pools["central"]
+    pool.putconn(pool.getconn())
+    breaker = tripped(pool.breaker)
+    breaker.open_until = 0.0
+
+    with pytest.raises(KeyError):
+        with manager.get_cursor("central") as cursor:
+            cursor.execute("SELECT 1 AS one")
+            cursor.fetchone()["missing"]
+
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_probe_timing_out_on_pool_reopens_breaker(manager):
+    pool = manager.pools["central"]
+    conn = pool.getconn()
+    try:
+        breaker = tripped(pool.breaker)
+        breaker.open_until = 0.0
+
+        with pytest.raises(PoolTimeoutError):
+            pool.getconn()
+
+        assert breaker.state == CircuitBreaker.OPEN
+        with pytest.raises(NodeUnavailableError):
+            pool.getconn()
+    finally:
+        pool.putconn(conn)
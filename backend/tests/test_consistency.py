@@ -0,0 +1,127 @@
+import time
+
+import pytest
+
+from config import Config
+from consistency import WriteSession, current_session, format_lsn, parse_lsn
+from database import DatabaseManager
+
+FILIALS = ("filial1", "filial2", "filial3")
+
+
+@pytest.mark.parametrize(
+    "lsn, value", [("0/0", 0), ("0/16B3748", 0x16B3748), ("1A/FF000028", (0x1A << 32) + 0xFF000028)]
+)
+def test_lsn_round_trip(lsn, value):
+    assert parse_lsn(lsn) == value
+    assert format_lsn(value) == lsn
+
+
+def test_lsn_order_follows_wal_position():
+    assert parse_lsn("1/0") > parse_lsn("0/FFFFFFFF")
+
+
+def test_cookie_round_trip():
+    session = WriteSession.from_cookie("filial2:0/1A00000,filial1:0/16B3748", FILIALS)
+
+    assert session.pending == {"filial1": 0x16B3748, "filial2": 0x1A00000}
+    assert session.to_cookie() == "filial1:0/16B3748,filial2:0/1A00000"
+    assert not session.changed
+
+
+@pytest.mark.parametrize("cookie", [None, "", "central:0/1", "filial9:0/1", "filial1:zz", "filial1", "filial1:"])
+def test_unknown_nodes_and_broken_values_are_ignored(cookie):
+    assert WriteSession.from_cookie(cookie, FILIALS).pending == {}
+
+
+def test_record_write_keeps_latest_lsn():
+    session = WriteSession({"filial1": 100})
+
+    session.record_write("filial1", 50)
+    assert not session.changed
+
+    session.record_write("filial1", 200)
+    session.record_write("filial2", 10)
+    assert session.pending == {"filial1": 200, "filial2": 10}
+    assert session.changed
+
+
+def test_confirm_drops_node():
+    session = WriteSession({"filial1": 100})
+
+    session.confirm("filial2")
+    assert not session.changed
+
+    session.confirm("filial1")
+    assert session.pending == {}
+    assert session.changed
+
+
+@pytest.fixture
+def manager(monkeypatch):
+    # Позиции применения на центральном узле задаются напрямую, как после опроса pg_stat_subscription
+    monkeypatch.setattr(Config, "REPLICATION_LSN_REFRESH", 60)
+    manager = DatabaseManager()
+    manager._applied_at = time.monotonic()
+    return manager
+
+
+@pytest.fixture
+def session():
+    session = WriteSession()
+    token = current_session.set(session)
+    yield session
+    current_session.reset(token)
+
+
+def test_reads_go_to_central_without_session(manager):
+    assert manager.read_nodes() == ["central"]
+
+
+def test_reads_go_to_central_without_pending_writes(manager, session):
+    assert manager.read_nodes() == ["central"]
+
+
+def test_unapplied_write_routes_reads_to_filial_first(manager, session):
+    session.pending = {"filial1": 200, "filial2": 100}
+    manager._applied = {"filial1": 150, "filial2": 100}
+
+    assert manager.read_nodes() == ["filial1", "central"]
+    assert session.pending == {"filial1": 200}
+    assert session.changed
+
+
+def test_unknown_apply_position_keeps_filial(manager, session):
+    session.pending = {"filial3": 1}
+
+    assert manager.read_nodes() == ["filial3", "central"]
+    assert not session.changed
+
+
+def test_applied_writes_return_reads_to_central(manager, session):
+    session.pending = {"filial1": 200}
+    manager._applied = {"filial1": 200}
+
+    assert manager.read_nodes() == ["central"]
+    assert session.pending == {}
+
+
+def test_commit_records_lsn_of_writing_transaction(conn, session):
+    session.track_writes = True
+    manager = DatabaseManager()
+
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT 1")
+    manager._commit(conn, "filial1")
+    assert session.pending == {}
+
+    with conn.cursor() as cursor:
+        # Временная таблица: запись получает txid, но не переживает соединение теста
+        cursor.execute("CREATE TEMP TABLE written (id INTEGER)")
+    manager._commit(conn, "filial1")
+    assert session.pending["filial1"] > 0
+
+    with conn.cursor() as cursor:
+        cursor.execute("INSERT INTO written VALUES (1)")
+    manager._commit(conn, "central")
+    assert set(session.pending) == {"filial1"}
@@ -0,0 +1,149 @@
+import time
+from contextlib import contextmanager
+
+import pytest
+from psycopg2.extras import RealDictCursor
+
+from config import Config
+from idempotency import IN_PROGRESS, NOT_SAVED, IdempotencyStore
+
+
+class TransactionDatabase:
+    """get_cursor поверх соединения теста: все запросы хранилища идут в одну транзакцию с откатом"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    @contextmanager
+    def get_cursor(self, db_name):
+        with self.conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            yield cursor
+
+
+@pytest.fixture
+def database(conn):
+    return TransactionDatabase(conn)
+
+
+def new_store(database):
+    store = IdempotencyStore(database)
+    # Фоновая очистка открыла бы курсор на соединении теста из другого потока
+    store._last_expire["central"] = time.monotonic()
+    return store
+
+
+def stored_response(cursor, key):
+    cursor.execute("SELECT response FROM idempotency_keys WHERE scope = 'book' AND key = %s", (key,))
+    row = cursor.fetchone()
+    return row and row["response"]
+
+
+def test_first_request_runs_and_stores_response(database, cursor):
+    result = new_store(database).run("central", "book", "k1", lambda: {"reservation_id": 1})
+
+    assert result == {"reservation_id": 1}
+    assert stored_response(cursor, "k1") == {"reservation_id": 1}
+
+
+def test_repeated_key_replays_response_without_running(database):
+    store = new_store(database)
+    store.run("central", "book", "k1", lambda: {"reservation_id": 1})
+
+    calls = []
+    replay = store.run("central", "book", "k1", lambda: calls.append(1) or {"reservation_id": 2})
+
+    assert replay == {"reservation_id": 1}
+    assert calls == []
+    assert store.stats()["hits"] == 1
+
+
+def test_other_process_replays_stored_response(database):
+    new_store(database).run("central", "book", "k1", lambda: {"reservation_id": 1})
+
+    # Пустой кэш: ответ берется из idempotency_keys
+    store = new_store(database)
+    replay = store.run("central", "book", "k1", lambda: {"reservation_id": 2})
+
+    assert replay == {"reservation_id": 1}
+    assert store.stats()["misses"] == 1
+
+
+def test_scopes_do_not_share_keys(database):
+    store = new_store(database)
+    store.run("central", "book", "k1", lambda: {"reservation_id": 1})
+
+    assert store.run("central", "pay", "k1", lambda: {"payment_id": 5}) == {"payment_id": 5}
+
+
+def test_unfinished_claim_is_in_progress(database, cursor):
+    cursor.execute("INSERT INTO idempotency_keys (scope, key) VALUES ('book', 'k1')")
+
+    assert new_store(database).run("central", "book", "k1", lambda: {"reservation_id": 1}) == IN_PROGRESS
+
+
+def test_stale_claim_is_taken_over(database, cursor):
+    cursor.execute(
+        """
+        INSERT INTO idempotency_keys (scope, key, created_at)
+        VALUES ('book', 'k1', NOW() - make_interval(secs => %s))
+    """,
+        (Config.IDEMPOTENCY_CLAIM_TIMEOUT + 1,),
+    )
+
+    assert new_store(database).run("central", "book", "k1", lambda: {"reservation_id": 1}) == {"reservation_id": 1}
+
+
+def test_server_error_releases_key(database, cursor):
+    store = new_store(database)
+    failure = {"error": "Database error", "status": 500}
+
+    assert store.run("central", "book", "k1", lambda: failure) == failure
+    assert stored_response(cursor, "k1") is None
+
+    assert store.run("central", "book", "k1", lambda: {"reservation_id": 1}) == {"reservation_id": 1}
+
+
+def test_client_error_is_replayed(database):
+    store = new_store(database)
+    rejected = {"error": "No rooms available", "status": 409}
+    store.run("central", "book", "k1", lambda: rejected)
+
+    assert store.run("central", "book", "k1", lambda: {"reservation_id": 1}) == rejected
+
+
+def test_exception_releases_key(database, cursor):
+    def fail():
+        raise RuntimeError("boom")
+
+    store = new_store(database)
+    with pytest.raises(RuntimeError):
+        store.run("central", "book", "k1", fail)
+
+    assert stored_response(cursor, "k1") is None
+    assert store.run("central", "book", "k1", lambda: {"reservation_id": 1}) == {"reservation_id": 1}
+
+
+def test_failed_save_keeps_key_claimed_and_replays_on_retry(database, cursor, monkeypatch):
+    store = new_store(database)
+    complete = store._complete
+
+    def fail(*args):
+        raise RuntimeError("connection lost")
+
+    monkeypatch.setattr(store, "_complete", fail)
+    calls = []
+
+    def book():
+        calls.append(1)
+        return {"reservation_id": len(calls)}
+
+    assert store.run("central", "book", "k1", book) == NOT_SAVED
+    cursor.execute("SELECT response FROM idempotency_keys WHERE scope = 'book' AND key = 'k1'")
+    assert cursor.fetchone() == {"response": None}
+    assert new_store(database).run("central", "book", "k1", book) == IN_PROGRESS
+
+    monkeypatch.setattr(store, "_complete", complete)
+
+    assert store.run("central", "book", "k1", book) == {"reservation_id": 1}
+    assert stored_response(cursor, "k1") == {"reservation_id": 1}
+    assert calls == [1]
@@ -0,0 +1,128 @@
+import gc
+import logging
+import threading
+
+import pytest
+
+from metrics import Counter, ErrorCountingHandler, Histogram, MetricsRegistry, _Sharded, render_family
+
+
+def test_counter_renders_sorted_series():
+    counter = Counter("queries_total", "Queries", ("node",))
+    counter.inc(("filial1",))
+    counter.inc(("central",), 2)
+    counter.inc(("filial1",))
+
+    assert counter.render() == [
+        "# HELP queries_total Queries",
+        "# TYPE queries_total counter",
+        'queries_total{node="central"} 2',
+        'queries_total{node="filial1"} 2',
+    ]
+
+
+def test_counter_without_labels():
+    counter = Counter("events_total", "Events", ())
+    counter.inc(amount=0.5)
+
+    assert counter.render()[-1] == "events_total 0.5"
+
+
+def test_label_values_are_escaped():
+    counter = Counter("queries_total", "Queries", ("caller",))
+    counter.inc(('say "hi"\\\n',))
+
+    assert counter.render()[-1] == 'queries_total{caller="say \\"hi\\"\\\\\\n"} 1'
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram("latency_seconds", "Latency", ("node",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(("central",), value)
+
+    assert histogram.render() == [
+        "# HELP latency_seconds Latency",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{node="central",le="0.1"} 2',
+        'latency_seconds_bucket{node="central",le="1.0"} 3',
+        'latency_seconds_bucket{node="central",le="+Inf"} 4',
+        'latency_seconds_sum{node="central"} 3.65',
+        'latency_seconds_count{node="central"} 4',
+    ]
+
+
+def test_render_family_formats_values():
+    lines = render_family("pool_in_use", "gauge", "Connections", ("node",), [(("central",), 3), (("filial1",), True)])
+
+    assert lines == [
+        "# HELP pool_in_use Connections",
+        "# TYPE pool_in_use gauge",
+        'pool_in_use{node="central"} 3',
+        'pool_in_use{node="filial1"} 1',
+    ]
+
+
+def test_registry_renders_metrics_then_collectors():
+    registry = MetricsRegistry()
+    registry.counter("a_total", "A").inc()
+    registry.collector(lambda: render_family("b", "gauge", "B", (), [((), 7)]))
+
+    assert registry.render() == "# HELP a_total A\n# TYPE a_total counter\na_total 1\n# HELP b B\n# TYPE b gauge\nb 7\n"
+
+
+def test_finished_threads_fold_into_base_shard():
+    counter = Counter("requests_total", "Requests", ("endpoint",))
+    histogram = Histogram("duration_seconds", "Duration", ("endpoint",), buckets=(1.0,))
+
+    def work():
+        counter.inc(("book",))
+        histogram.observe(("book",), 0.5)
+
+    for _ in range(20):
+        threads = [threading.Thread(target=work) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    gc.collect()
+
+    assert counter._shards == {}
+    assert histogram._shards == {}
+    assert counter.render()[-1] == 'requests_total{endpoint="book"} 200'
+    assert histogram.render()[-1] == 'duration_seconds_count{endpoint="book"} 200'
+
+
+def test_live_shard_is_included_in_totals():
+    counter = Counter("requests_total", "Requests", ())
+    counter.inc()
+    thread = threading.Thread(target=counter.inc)
+    thread.start()
+    thread.join()
+
+    assert len(counter._shards) == 1
+    assert counter.render()[-1] == "requests_total 2"
+
+
+def test_error_handler_counts_only_errors():
+    counter = Counter("logged_errors_total", "Errors", ("logger", "function"))
+    logger = logging.getLogger("tests.metrics")
+    handler = ErrorCountingHandler(counter)
+    logger.addHandler(handler)
+    try:
+        logger.warning("ignored")
+        logger.error("counted")
+    finally:
+        logger.removeHandler(handler)
+
+    assert (
+        counter.render()[-1]
+        == 'logged_errors_total{logger="tests.metrics",function="test_error_handler_counts_only_errors"} 1'
+    )
+
+
+def test_metric_without_combine_cannot_be_created():
+    class Gauge(_Sharded):
+        pass
+
+    with pytest.raises(TypeError):
+        Gauge("gauge", "Gauge", ())
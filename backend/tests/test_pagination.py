@@ -0,0 +1,100 @@
+from datetime import date, datetime
+
+import pytest
+
+from pagination import decode_cursor, encode_cursor, keyset_page, reservation_filters
+
+
+def rows(*keys):
+    # Строки в порядке выдачи (create_date DESC, id DESC); у бронирования может быть несколько строк деталей
+    return [{"create_date": create_date, "id": reservation_id} for create_date, reservation_id in keys]
+
+
+def test_cursor_round_trip():
+    token = encode_cursor({"create_date": "2024-03-01T12:30:45.123456", "id": 31})
+
+    assert token == "2024-03-01T12:30:45.123456_31"
+    assert decode_cursor(token) == (datetime(2024, 3, 1, 12, 30, 45, 123456), 31)
+
+
+def test_empty_cursor_starts_from_first_page():
+    assert decode_cursor(None) == (None, None)
+    assert decode_cursor("") == (None, None)
+
+
+@pytest.mark.parametrize("token", ["garbage", "2024-03-01T12:30:45_", "2024-13-01_7", "_7"])
+def test_malformed_cursor_raises_value_error(token):
+    with pytest.raises(ValueError):
+        decode_cursor(token)
+
+
+def test_short_page_has_no_next_cursor():
+    page = keyset_page(rows(("2024-03-02T10:00:00", 7), ("2024-03-01T10:00:00", 4)), limit=2)
+
+    assert [row["id"] for row in page["reservations"]] == [7, 4]
+    assert page["next_cursor"] is None
+
+
+def test_extra_reservation_is_dropped_and_sets_next_cursor():
+    page = keyset_page(
+        rows(("2024-03-03T10:00:00", 10), ("2024-03-02T10:00:00", 7), ("2024-03-01T10:00:00", 4)), limit=2
+    )
+
+    assert [row["id"] for row in page["reservations"]] == [10, 7]
+    assert page["next_cursor"] == "2024-03-02T10:00:00_7"
+
+
+def test_limit_counts_reservations_not_detail_rows():
+    page = keyset_page(
+        rows(
+            ("2024-03-03T10:00:00", 10),
+            ("2024-03-03T10:00:00", 10),
+            ("2024-03-02T10:00:00", 7),
+            ("2024-03-01T10:00:00", 4),
+            ("2024-03-01T10:00:00", 4),
+        ),
+        limit=2,
+    )
+
+    assert [row["id"] for row in page["reservations"]] == [10, 10, 7]
+    assert page["next_cursor"] == "2024-03-02T10:00:00_7"
+
+
+def test_next_cursor_continues_after_last_row():
+    page = keyset_page(rows(("2024-03-02T10:00:00", 7), ("2024-03-02T10:00:00", 4)), limit=1)
+
+    assert decode_cursor(page["next_cursor"]) == (datetime(2024, 3, 2, 10), 7)
+
+
+def test_reservation_filters():
+    filters = reservation_filters(
+        {
+            "hotel_id": "3",
+            "status": "confirmed",
+            "arrival_from": "2024-03-01",
+            "arrival_to": "2024-03-31",
+            "after": "2024-03-02T10:00:00_7",
+        }
+    )
+
+    assert filters == {
+        "hotel_id": 3,
+        "status": "confirmed",
+        "arrival_from": date(2024, 3, 1),
+        "arrival_to": date(2024, 3, 31),
+        "after_date": datetime(2024, 3, 2, 10),
+        "after_id": 7,
+    }
+
+
+def test_reservation_filters_default_to_none():
+    assert set(reservation_filters({"status": ""}).values()) == {None}
+
+
+@pytest.mark.parametrize(
+    "args",
+    [{"hotel_id": "abc"}, {"arrival_from": "01.03.2024"}, {"arrival_to": "2024-02-30"}, {"after": "bad"}],
+)
+def test_invalid_filters_raise_value_error(args):
+    with pytest.raises(ValueError):
+        reservation_filters(args)
@@ -0,0 +1,99 @@
+from datetime import date, timedelta
+
+START = date(2099, 1, 10)
+END = date(2099, 1, 13)
+
+
+def held(cursor, room, start=START, end=END):
+    cursor.execute(
+        """
+        SELECT d::date AS day, COALESCE(ri.held, 0) AS held
+        FROM generate_series(%s::date, %s::date - 1, interval '1 day') d
+        LEFT JOIN room_inventory ri
+            ON ri.hotel_id = %s AND ri.category_id = %s AND ri.day = d::date
+        ORDER BY d
+    """,
+        (start, end, room["hotel_id"], room["category_id"]),
+    )
+    return [row["held"] for row in cursor.fetchall()]
+
+
+def ledger(cursor, room):
+    cursor.execute(
+        "SELECT category_id, day, total, held FROM room_inventory WHERE hotel_id = %s AND held > 0 ORDER BY 1, 2",
+        (room["hotel_id"],),
+    )
+    return cursor.fetchall()
+
+
+def test_booking_holds_every_night_except_departure(cursor, room, reserve):
+    reserve(START, END)
+    reserve(START + timedelta(days=1), END)
+
+    assert held(cursor, room, START, END + timedelta(days=1)) == [1, 2, 2, 0]
+
+
+def test_cancellation_releases_nights(cursor, room, reserve):
+    reservation_id = reserve(START, END)
+    cursor.execute("UPDATE reservations SET status = 'cancelled' WHERE id = %s", (reservation_id,))
+
+    assert held(cursor, room) == [0, 0, 0]
+
+    cursor.execute("UPDATE reservations SET status = 'pending' WHERE id = %s", (reservation_id,))
+
+    assert held(cursor, room) == [1, 1, 1]
+
+
+def test_date_change_moves_hold(cursor, room, reserve):
+    reservation_id = reserve(START, END)
+    cursor.execute(
+        "UPDATE reservations SET start_date = %s, end_date = %s WHERE id = %s",
+        (END, END + timedelta(days=2), reservation_id),
+    )
+
+    assert held(cursor, room, START, END + timedelta(days=2)) == [0, 0, 0, 1, 1]
+
+
+def test_deleted_details_release_nights(cursor, room, reserve):
+    reservation_id = reserve(START, END)
+    cursor.execute("DELETE FROM details_reservations WHERE reservation_id = %s", (reservation_id,))
+
+    assert held(cursor, room) == [0, 0, 0]
+
+
+def test_new_room_increases_total(cursor, room, reserve):
+    reserve(START, END)
+    cursor.execute(
+        """
+        INSERT INTO rooms (hotel_id, categories_room_id, room_number, floor)
+        VALUES (%s, %s, 'T-1', 1)
+    """,
+        (room["hotel_id"], room["category_id"]),
+    )
+    cursor.execute(
+        """
+        SELECT
+            (SELECT COUNT(*) FROM rooms WHERE hotel_id = %(hotel_id)s AND categories_room_id = %(category_id)s)
+                AS rooms,
+            (SELECT array_agg(DISTINCT total) FROM room_inventory
+                WHERE hotel_id = %(hotel_id)s AND category_id = %(category_id)s AND day >= %(start)s AND day < %(end)s)
+                AS totals
+    """,
+        {**room, "start": START, "end": END},
+    )
+    row = cursor.fetchone()
+
+    assert row["totals"] == [row["rooms"]]
+
+
+def test_rebuild_reproduces_trigger_ledger(cursor, room, reserve):
+    reserve(START, END)
+    reserve(START + timedelta(days=1), END + timedelta(days=1))
+    cancelled = reserve(START, END)
+    cursor.execute("UPDATE reservations SET status = 'cancelled' WHERE id = %s", (cancelled,))
+    maintained = ledger(cursor, room)
+
+    cursor.execute("SELECT rebuild_room_inventory(%s) AS rows_built", (room["hotel_id"],))
+
+    assert cursor.fetchone()["rows_built"] > 0
+    assert ledger(cursor, room) == maintained
@@ -0,0 +1,66 @@
+from datetime import date
+
+import pytest
+from psycopg2 import errors
+from psycopg2.extras import DateRange
+
+START = date(2099, 2, 10)
+END = date(2099, 2, 13)
+
+
+def room_stay(cursor, reservation_id):
+    cursor.execute("SELECT room_stay FROM details_reservations WHERE reservation_id = %s", (reservation_id,))
+    return cursor.fetchone()["room_stay"]
+
+
+def test_room_stay_follows_reservation(cursor, room, reserve):
+    reservation_id = reserve(START, END, room_id=room["id"])
+
+    assert room_stay(cursor, reservation_id) == DateRange(START, END, "[)")
+
+    cursor.execute("UPDATE reservations SET status = 'cancelled' WHERE id = %s", (reservation_id,))
+
+    assert room_stay(cursor, reservation_id) is None
+
+
+def test_overlapping_stays_in_one_room_are_rejected(cursor, room, reserve):
+    reserve(START, END, room_id=room["id"])
+
+    with pytest.raises(errors.ExclusionViolation):
+        reserve(date(2099, 2, 12), date(2099, 2, 15), room_id=room["id"])
+
+
+def test_back_to_back_stays_are_allowed(cursor, room, reserve):
+    reserve(START, END, room_id=room["id"])
+    reservation_id = reserve(END, date(2099, 2, 15), room_id=room["id"])
+
+    assert room_stay(cursor, reservation_id) == DateRange(END, date(2099, 2, 15), "[)")
+
+
+def test_cancelled_reservation_frees_room(cursor, room, reserve):
+    pending = reserve(START, END, status="pending", room_id=room["id"])
+
+    cursor.execute("SAVEPOINT overlap")
+    with pytest.raises(errors.ExclusionViolation):
+        reserve(START, END, room_id=room["id"])
+    cursor.execute("ROLLBACK TO SAVEPOINT overlap")
+
+    cursor.execute("UPDATE reservations SET status = 'cancelled' WHERE id = %s", (pending,))
+    reservation_id = reserve(date(2099, 2, 11), END, room_id=room["id"])
+
+    assert room_stay(cursor, pending) is None
+    assert room_stay(cursor, reservation_id) == DateRange(date(2099, 2, 11), END, "[)")
+
+
+def test_reactivating_overlapping_reservation_is_rejected(cursor, room, reserve):
+    cancelled = reserve(START, END, room_id=room["id"])
+    cursor.execute("UPDATE reservations SET status = 'cancelled' WHERE id = %s", (cancelled,))
+    reserve(START, END, room_id=room["id"])
+
+    with pytest.raises(errors.ExclusionViolation):
+        cursor.execute("UPDATE reservations SET status = 'confirmed' WHERE id = %s", (cancelled,))
+
+
+def test_unassigned_rooms_are_not_constrained(cursor, reserve):
+    reserve(START, END)
+    reserve(START, END)
@@ -0,0 +1,119 @@
+import time
+
+import pytest
+
+import slow_queries
+from config import Config
+from database import TimedCursor
+from slow_queries import SlowQueryLog, normalize_sql
+
+
+@pytest.mark.parametrize(
+    "query, normalized",
+    [
+        ("SELECT * FROM rooms WHERE id = %s", "SELECT * FROM rooms WHERE id = ?"),
+        (
+            "SELECT * FROM rooms WHERE hotel_id = %(hotel_id)s LIMIT 10",
+            "SELECT * FROM rooms WHERE hotel_id = ? LIMIT ?",
+        ),
+        ("SELECT 'it''s', 'x' FROM guests", "SELECT ?, ? FROM guests"),
+        ("SELECT price * 1.5 FROM categories_room", "SELECT price * ? FROM categories_room"),
+        ("SELECT 1 -- комментарий\nFROM hotels", "SELECT ? FROM hotels"),
+        ("\n    SELECT *\n\tFROM   filial1_rooms  r2\n", "SELECT * FROM filial1_rooms r2"),
+    ],
+)
+def test_normalize_sql(query, normalized):
+    assert normalize_sql(query) == normalized
+
+
+def test_same_shape_queries_normalize_equally():
+    assert normalize_sql("SELECT * FROM rooms WHERE id = 1") == normalize_sql("SELECT * FROM rooms WHERE id = %s")
+
+
+@pytest.mark.parametrize(
+    "query, explainable",
+    [
+        ("SELECT * FROM rooms", True),
+        ("WITH t AS (SELECT ?) SELECT * FROM t", True),
+        ("select * from rooms", True),
+        ("UPDATE reservations SET status = ?", True),
+        ("SELECT pg_advisory_xact_lock(?)", False),
+        ("SET statement_timeout = ?", False),
+        ("CALL recalculate_loyalty_tiers()", False),
+    ],
+)
+def test_can_explain(query, explainable):
+    assert SlowQueryLog._can_explain(query) is explainable
+
+
+@pytest.fixture
+def log(monkeypatch):
+    monkeypatch.setattr(Config, "SLOW_QUERY_EXPLAIN_SAMPLE", 0)
+    log = SlowQueryLog()
+    # Любой запрос считается медленным
+    log.threshold = 1e-9
+    monkeypatch.setattr(slow_queries, "slow_query_log", log)
+    monkeypatch.setattr("database.slow_query_log", log)
+    return log
+
+
+@pytest.fixture
+def timed_cursor(conn):
+    with conn.cursor(cursor_factory=TimedCursor) as cursor:
+        cursor.node = "central"
+        cursor.caller = "tests.slow_queries"
+        yield cursor
+
+
+def test_slow_statement_is_logged_normalized(log, timed_cursor):
+    timed_cursor.execute("SELECT id FROM hotels WHERE id = %s AND name <> %s", (1, "Москва"))
+
+    (entry,) = log.entries()
+    assert entry["node"] == "central"
+    assert entry["caller"] == "tests.slow_queries"
+    assert entry["query"] == "SELECT id FROM hotels WHERE id = ? AND name <> ?"
+    assert entry["plan"] is None
+
+
+def test_entries_are_newest_first(log, timed_cursor):
+    for table in ("hotels", "rooms", "guests"):
+        timed_cursor.execute(f"SELECT COUNT(*) FROM {table}")
+
+    assert [entry["query"] for entry in log.entries(2)] == ["SELECT COUNT(*) FROM guests", "SELECT COUNT(*) FROM rooms"]
+
+
+def test_failing_log_does_not_break_statement(log, timed_cursor, monkeypatch):
+    def fail(*args):
+        raise RuntimeError("log is broken")
+
+    monkeypatch.setattr(log, "record", fail)
+    timed_cursor.execute("SELECT 1 AS one")
+
+    assert timed_cursor.fetchone() == {"one": 1}
+
+
+def explained(log, conn, timed_cursor, monkeypatch, query, params):
+    monkeypatch.setattr(Config, "SLOW_QUERY_EXPLAIN_SAMPLE", 1)
+    monkeypatch.setitem(Config.DATABASES, "central", conn.dsn)
+    timed_cursor.execute(query, params)
+
+    (entry,) = log.entries()
+    deadline = time.monotonic() + 10
+    while entry["plan"] is None and "plan_error" not in entry and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return entry
+
+
+def test_sampled_query_gets_analyzed_plan(log, conn, timed_cursor, monkeypatch):
+    entry = explained(log, conn, timed_cursor, monkeypatch, "SELECT id FROM hotels WHERE id = %s", (1,))
+
+    assert entry["analyzed"]
+    assert "actual time" in entry["plan"]
+
+
+def test_modifying_query_is_explained_without_execution(log, conn, timed_cursor, monkeypatch):
+    entry = explained(log, conn, timed_cursor, monkeypatch, "UPDATE hotels SET name = name WHERE id = %s", (-1,))
+
+    assert not entry["analyzed"]
+    assert entry["plan"].startswith("Update on hotels")
+    assert "actual time" not in entry["plan"]
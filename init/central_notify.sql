@@ -0,0 +1,31 @@
+-- ===========================================
+-- УВЕДОМЛЕНИЯ ОБ ИЗМЕНЕНИИ СПРАВОЧНЫХ ДАННЫХ (ЦЕНТРАЛЬНЫЙ УЗЕЛ)
+-- ===========================================
+
+-- Приложение слушает канал reference_data_changed и по имени таблицы
+-- в payload обновляет свои копии справочников (карта отель -> узел и т.д.)
+CREATE OR REPLACE FUNCTION notify_reference_data_changed()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('reference_data_changed', TG_TABLE_NAME);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Маршрутизация отель -> узел
+CREATE TRIGGER hotels_reference_data_changed
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON hotels
+FOR EACH STATEMENT EXECUTE FUNCTION notify_reference_data_changed();
+
+CREATE TRIGGER cities_reference_data_changed
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON cities
+FOR EACH STATEMENT EXECUTE FUNCTION notify_reference_data_changed();
+
+-- Справочники, кэшируемые приложением (цены, коэффициенты, скидки)
+CREATE TRIGGER categories_room_reference_data_changed
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON categories_room
+FOR EACH STATEMENT EXECUTE FUNCTION notify_reference_data_changed();
+
+CREATE TRIGGER loyalty_cards_reference_data_changed
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON loyalty_cards
+FOR EACH STATEMENT EXECUTE FUNCTION notify_reference_data_changed();
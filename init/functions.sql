@@ -0,0 +1,310 @@
+-- ===========================================
+-- СЕРВЕРНЫЕ ФУНКЦИИ (УСТАНАВЛИВАЮТСЯ НА ВСЕ УЗЛЫ)
+-- Справочники (hotels, categories_room) на филиалах получаются через репликацию
+-- ===========================================
+
+-- ===========================================
+-- ПОСУТОЧНЫЙ УЧЕТ НОМЕРОВ (room_inventory)
+-- held — число активных бронирований категории на дату, total — число номеров категории
+-- ===========================================
+
+-- Изменение числа удерживаемых номеров на каждую ночь периода [p_start_date, p_end_date)
+CREATE OR REPLACE FUNCTION room_inventory_hold(
+    p_hotel_id INTEGER,
+    p_category_id INTEGER,
+    p_start_date DATE,
+    p_end_date DATE,
+    p_delta INTEGER
+)
+RETURNS VOID AS $$
+    INSERT INTO room_inventory (hotel_id, category_id, day, total, held)
+    SELECT
+        p_hotel_id,
+        p_category_id,
+        d::date,
+        (SELECT COUNT(*) FROM rooms r WHERE r.hotel_id = p_hotel_id AND r.categories_room_id = p_category_id),
+        p_delta
+    FROM generate_series(p_start_date, p_end_date - 1, interval '1 day') d
+    ON CONFLICT (hotel_id, category_id, day)
+    DO UPDATE SET held = room_inventory.held + EXCLUDED.held;
+$$ LANGUAGE sql;
+
+-- Детали бронирования: появление, удаление и смена категории
+CREATE OR REPLACE FUNCTION room_inventory_on_details()
+RETURNS TRIGGER AS $$
+DECLARE
+    res RECORD;
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        SELECT hotel_id, start_date, end_date, status INTO res FROM reservations WHERE id = OLD.reservation_id;
+        IF FOUND AND res.status IN ('confirmed', 'pending') THEN
+            PERFORM room_inventory_hold(res.hotel_id, OLD.requested_room_category, res.start_date, res.end_date, -1);
+        END IF;
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        SELECT hotel_id, start_date, end_date, status INTO res FROM reservations WHERE id = NEW.reservation_id;
+        IF FOUND AND res.status IN ('confirmed', 'pending') THEN
+            PERFORM room_inventory_hold(res.hotel_id, NEW.requested_room_category, res.start_date, res.end_date, 1);
+        END IF;
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER details_reservations_room_inventory
+AFTER INSERT OR DELETE OR UPDATE OF reservation_id, requested_room_category ON details_reservations
+FOR EACH ROW EXECUTE FUNCTION room_inventory_on_details();
+
+-- Бронирование: отмена, восстановление и перенос дат
+CREATE OR REPLACE FUNCTION room_inventory_on_reservation()
+RETURNS TRIGGER AS $$
+DECLARE
+    was_active BOOLEAN := OLD.status IN ('confirmed', 'pending');
+    is_active BOOLEAN := NEW.status IN ('confirmed', 'pending');
+    detail RECORD;
+BEGIN
+    IF was_active = is_active
+        AND (NOT is_active OR (OLD.start_date = NEW.start_date AND OLD.end_date = NEW.end_date)) THEN
+        RETURN NULL;
+    END IF;
+
+    FOR detail IN SELECT requested_room_category FROM details_reservations WHERE reservation_id = NEW.id LOOP
+        IF was_active THEN
+            PERFORM room_inventory_hold(OLD.hotel_id, detail.requested_room_category, OLD.start_date, OLD.end_date, -1);
+        END IF;
+        IF is_active THEN
+            PERFORM room_inventory_hold(NEW.hotel_id, detail.requested_room_category, NEW.start_date, NEW.end_date, 1);
+        END IF;
+    END LOOP;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER reservations_room_inventory
+AFTER UPDATE OF status, start_date, end_date, hotel_id ON reservations
+FOR EACH ROW EXECUTE FUNCTION room_inventory_on_reservation();
+
+-- Номера: поддержание total в уже существующих строках учета
+CREATE OR REPLACE FUNCTION room_inventory_on_rooms()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE room_inventory SET total = total - 1
+        WHERE hotel_id = OLD.hotel_id AND category_id = OLD.categories_room_id;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        UPDATE room_inventory SET total = total + 1
+        WHERE hotel_id = NEW.hotel_id AND category_id = NEW.categories_room_id;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER rooms_room_inventory
+AFTER INSERT OR DELETE OR UPDATE OF hotel_id, categories_room_id ON rooms
+FOR EACH ROW EXECUTE FUNCTION room_inventory_on_rooms();
+
+-- Перестроение учета по существующим бронированиям (всех отелей узла или одного)
+CREATE OR REPLACE FUNCTION rebuild_room_inventory(p_hotel_id INTEGER DEFAULT NULL)
+RETURNS BIGINT AS $$
+DECLARE
+    rows_built BIGINT;
+BEGIN
+    LOCK TABLE reservations, details_reservations, rooms IN SHARE MODE;
+
+    DELETE FROM room_inventory WHERE p_hotel_id IS NULL OR hotel_id = p_hotel_id;
+
+    INSERT INTO room_inventory (hotel_id, category_id, day, total, held)
+    SELECT
+        res.hotel_id,
+        dr.requested_room_category,
+        d::date,
+        COALESCE(MAX(rc.total_rooms), 0),
+        COUNT(*)
+    FROM reservations res
+    JOIN details_reservations dr ON dr.reservation_id = res.id
+    CROSS JOIN LATERAL generate_series(res.start_date, res.end_date - 1, interval '1 day') d
+    LEFT JOIN (
+        SELECT hotel_id, categories_room_id, COUNT(*) AS total_rooms
+        FROM rooms
+        GROUP BY hotel_id, categories_room_id
+    ) rc ON rc.hotel_id = res.hotel_id AND rc.categories_room_id = dr.requested_room_category
+    WHERE res.status IN ('confirmed', 'pending')
+    AND (p_hotel_id IS NULL OR res.hotel_id = p_hotel_id)
+    GROUP BY res.hotel_id, dr.requested_room_category, d::date;
+
+    GET DIAGNOSTICS rows_built = ROW_COUNT;
+    RETURN rows_built;
+END;
+$$ LANGUAGE plpgsql;
+
+
+-- ===========================================
+-- ПЕРИОД ЗАНЯТОСТИ НОМЕРА (details_reservations.room_stay)
+-- Двойное назначение номера на пересекающиеся даты запрещает ограничение-исключение
+-- ===========================================
+
+CREATE OR REPLACE FUNCTION details_reservations_set_room_stay()
+RETURNS TRIGGER AS $$
+BEGIN
+    SELECT CASE WHEN res.status IN ('confirmed', 'pending') THEN res.stay END
+    INTO NEW.room_stay
+    FROM reservations res
+    WHERE res.id = NEW.reservation_id;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER details_reservations_room_stay
+BEFORE INSERT OR UPDATE OF reservation_id, room_id ON details_reservations
+FOR EACH ROW EXECUTE FUNCTION details_reservations_set_room_stay();
+
+CREATE OR REPLACE FUNCTION reservations_sync_room_stay()
+RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE details_reservations
+    SET room_stay = CASE WHEN NEW.status IN ('confirmed', 'pending') THEN NEW.stay END
+    WHERE reservation_id = NEW.id
+    AND room_stay IS DISTINCT FROM CASE WHEN NEW.status IN ('confirmed', 'pending') THEN NEW.stay END;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER reservations_room_stay
+AFTER UPDATE OF status, start_date, end_date ON reservations
+FOR EACH ROW EXECUTE FUNCTION reservations_sync_room_stay();
+
+
+-- Проверка доступности категории номеров на период за один запрос:
+-- количество номеров, занятых бронированиями, коэффициент отеля,
+-- информация о категории и несколько свободных на весь период номеров
+CREATE OR REPLACE FUNCTION check_room_availability(
+    p_hotel_id INTEGER,
+    p_category_id INTEGER,
+    p_start_date DATE,
+    p_end_date DATE,
+    p_sample_size INTEGER DEFAULT 5
+)
+RETURNS TABLE (
+    total_rooms BIGINT,
+    reserved_rooms BIGINT,
+    available_rooms_count BIGINT,
+    location_coeff_room NUMERIC,
+    room_info JSONB,
+    available_rooms JSONB
+) AS $$
+    WITH totals AS (
+        SELECT COUNT(*) AS total_rooms
+        FROM rooms r
+        WHERE r.hotel_id = p_hotel_id
+        AND r.categories_room_id = p_category_id
+    ),
+    free AS (
+        -- Минимум свободных номеров по ночам периода; ночи без строк учета свободны полностью
+        SELECT MIN(COALESCE(ri.total - ri.held, t.total_rooms)) AS free_rooms
+        FROM totals t
+        CROSS JOIN generate_series(p_start_date, p_end_date - 1, interval '1 day') d
+        LEFT JOIN room_inventory ri
+            ON ri.hotel_id = p_hotel_id
+            AND ri.category_id = p_category_id
+            AND ri.day = d::date
+    ),
+    reserved AS (
+        SELECT t.total_rooms - COALESCE(f.free_rooms, t.total_rooms) AS reserved_rooms
+        FROM totals t, free f
+    )
+    SELECT
+        t.total_rooms,
+        rs.reserved_rooms,
+        GREATEST(t.total_rooms - rs.reserved_rooms, 0),
+        COALESCE((SELECT h.location_coeff_room FROM hotels h WHERE h.id = p_hotel_id), 1.0),
+        (
+            SELECT to_jsonb(cr)
+            FROM (
+                SELECT id, category_name, guests_capacity, price_per_night, description
+                FROM categories_room
+                WHERE id = p_category_id
+            ) cr
+        ),
+        CASE WHEN t.total_rooms > rs.reserved_rooms THEN (
+            SELECT COALESCE(jsonb_agg(to_jsonb(s) ORDER BY s.room_number), '[]'::jsonb)
+            FROM (
+                SELECT r.id, r.room_number, r.floor, r.view
+                FROM rooms r
+                WHERE r.hotel_id = p_hotel_id
+                AND r.categories_room_id = p_category_id
+                AND NOT EXISTS (
+                    SELECT 1
+                    FROM details_reservations dr
+                    WHERE dr.room_id = r.id
+                    AND dr.room_stay && daterange(p_start_date, p_end_date, '[)')
+                )
+                ORDER BY r.room_number
+                LIMIT p_sample_size
+            ) s
+        ) ELSE '[]'::jsonb END
+    FROM totals t, reserved rs;
+$$ LANGUAGE sql STABLE;
+
+-- ===========================================
+-- ПЕРЕСЧЕТ УРОВНЕЙ ПРОГРАММЫ ЛОЯЛЬНОСТИ (guests.loyalty_card_id)
+-- Вне горячего пути оплаты: уровень определяется по бонусам соединением с диапазонами loyalty_cards
+-- ===========================================
+
+-- Гости обрабатываются порциями по id с фиксацией после каждой; обновляются только изменившиеся,
+-- поэтому повторный запуск и запуск на других узлах не порождают лишних изменений для репликации
+CREATE OR REPLACE PROCEDURE recalculate_loyalty_tiers(
+    p_chunk_size INTEGER DEFAULT 1000,
+    INOUT guests_updated BIGINT DEFAULT 0,
+    INOUT chunks INTEGER DEFAULT 0,
+    INOUT duration INTERVAL DEFAULT NULL
+) AS $$
+DECLARE
+    started TIMESTAMPTZ := clock_timestamp();
+    after_id INTEGER := 0;
+    last_id INTEGER;
+    updated INTEGER;
+BEGIN
+    guests_updated := 0;
+    chunks := 0;
+
+    LOOP
+        WITH tiers AS (
+            -- Уровень действует от своего порога до порога следующего
+            SELECT
+                lc.id,
+                int4range(lc.req_bonus_amount, LEAD(lc.req_bonus_amount) OVER (ORDER BY lc.req_bonus_amount)) AS points
+            FROM loyalty_cards lc
+        ),
+        chunk AS (
+            SELECT g.id, t.id AS loyalty_card_id
+            FROM guests g
+            JOIN tiers t ON t.points @> g.bonus_points
+            WHERE g.id > after_id
+            ORDER BY g.id
+            LIMIT p_chunk_size
+        ),
+        changed AS (
+            UPDATE guests g
+            SET loyalty_card_id = c.loyalty_card_id
+            FROM chunk c
+            WHERE g.id = c.id
+            AND g.loyalty_card_id IS DISTINCT FROM c.loyalty_card_id
+            RETURNING g.id
+        )
+        SELECT (SELECT MAX(id) FROM chunk), (SELECT COUNT(*) FROM changed) INTO last_id, updated;
+
+        EXIT WHEN last_id IS NULL;
+
+        guests_updated := guests_updated + updated;
+        chunks := chunks + 1;
+        after_id := last_id;
+        COMMIT;
+    END LOOP;
+
+    duration := clock_timestamp() - started;
+END;
+$$ LANGUAGE plpgsql;
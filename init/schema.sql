@@ -1,3 +1,6 @@
+-- GiST-индексы по (идентификатор, период) для проверок пересечения дат
+CREATE EXTENSION IF NOT EXISTS btree_gist;
+
 -- Типы удобств
 CREATE TABLE types_amenities (
     id SERIAL PRIMARY KEY,
@@ -129,8 +132,18 @@ CREATE TABLE reservations (
     payments_status VARCHAR(50) NOT NULL CHECK (payments_status IN ('paid', 'unpaid')),
     payer_id INTEGER NOT NULL REFERENCES guests(id),
     start_date DATE NOT NULL,
-    end_date DATE NOT NULL CHECK (end_date >= start_date)
-);
+    end_date DATE NOT NULL CHECK (end_date >= start_date),
+    stay DATERANGE GENERATED ALWAYS AS (daterange(start_date, end_date, '[)')) STORED
+);
+CREATE INDEX idx_reservations_hotel_stay
+ON reservations USING gist (hotel_id, stay)
+WHERE status IN ('confirmed', 'pending');
+-- Списки ресепшена: фильтр по отелю и статусу, keyset-пагинация по (create_date, id)
+CREATE INDEX idx_reservations_hotel_status_created
+ON reservations (hotel_id, status, create_date DESC, id DESC);
+CREATE INDEX idx_reservations_active_created
+ON reservations (create_date DESC, id DESC)
+WHERE status IN ('confirmed', 'pending');
 
 -- Детали бронирования
 CREATE TABLE details_reservations (
@@ -141,7 +154,11 @@ CREATE TABLE details_reservations (
     guest_id INTEGER NOT NULL REFERENCES guests(id),
     requested_room_category INTEGER NOT NULL REFERENCES categories_room(id),
     total_guest_number INTEGER NOT NULL CHECK (total_guest_number > 0),
-    UNIQUE (reservation_id, room_id, guest_id)
+    -- Период занятости номера: период активного бронирования, NULL для отмененных (ведется триггером)
+    room_stay DATERANGE,
+    UNIQUE (reservation_id, room_id, guest_id),
+    CONSTRAINT details_reservations_room_stay_excl
+        EXCLUDE USING gist (room_id WITH =, room_stay WITH &&) WHERE (room_id IS NOT NULL)
 );
 
 -- Платежи
@@ -170,3 +187,24 @@ CREATE TABLE payments_amenities (
     quantity INTEGER NOT NULL DEFAULT 1 CHECK (quantity > 0),
     total_amenities_price NUMERIC(12,2) NOT NULL CHECK (total_amenities_price >= 0)
 );
+
+-- Посуточный учет номеров по категориям (ведется триггерами, см. init/functions.sql)
+CREATE TABLE room_inventory (
+    hotel_id INTEGER NOT NULL REFERENCES hotels(id),
+    category_id INTEGER NOT NULL REFERENCES categories_room(id),
+    day DATE NOT NULL,
+    total INTEGER NOT NULL DEFAULT 0,
+    held INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (hotel_id, category_id, day)
+);
+
+-- Ключи идемпотентности запросов бронирования и оплаты (локальны для узла, не реплицируются).
+-- response = NULL — запрос еще выполняется; устаревшие ключи удаляются порциями
+CREATE TABLE idempotency_keys (
+    scope VARCHAR(20) NOT NULL,
+    key VARCHAR(255) NOT NULL,
+    response JSONB,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (scope, key)
+);
+CREATE INDEX idx_idempotency_keys_created ON idempotency_keys (created_at);
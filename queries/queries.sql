@@ -144,42 +144,8 @@ WHERE id = 1;
 
 
 -- Проверка доступности номера конкретной категории на конкретную дату
-CREATE OR REPLACE FUNCTION check_room_availability(
-    p_hotel_id INTEGER,
-    p_category_id INTEGER,
-    p_start_date DATE,
-    p_end_date DATE
-)
-RETURNS TABLE (
-    room_id INTEGER,
-    room_number VARCHAR(10),
-    floor INTEGER,
-    view VARCHAR(30),
-    is_available BOOLEAN
-) AS $$
-BEGIN
-    RETURN QUERY
-    SELECT
-        r.id,
-        r.room_number,
-        r.floor,
-        r.view,
-        NOT EXISTS (
-            SELECT 1
-            FROM details_reservations dr
-            JOIN reservations res ON dr.reservation_id = res.id
-            WHERE dr.room_id = r.id
-            AND res.status IN ('confirmed', 'pending')
-            AND (
-                (res.start_date <= p_end_date AND res.end_date >= p_start_date)
-            )
-        ) AS is_available
-    FROM rooms r
-    WHERE r.hotel_id = p_hotel_id
-    AND r.categories_room_id = p_category_id;
-END;
--- Использование функции
--- SELECT * FROM check_room_availability(1, 1, '2024-05-10', '2024-05-15'); -- вписать в запросы выше
+-- Функция check_room_availability устанавливается на все узлы из init/functions.sql
+SELECT * FROM check_room_availability(1, 1, '2024-05-10', '2024-05-15');
 
 
 -- Юзер:
@@ -423,42 +389,8 @@ WHERE id = 1;
 
 
 -- Проверка доступности номера конкретной категории на конкретную дату
-CREATE OR REPLACE FUNCTION check_room_availability(
-    p_hotel_id INTEGER,
-    p_category_id INTEGER,
-    p_start_date DATE,
-    p_end_date DATE
-)
-RETURNS TABLE (
-    room_id INTEGER,
-    room_number VARCHAR(10),
-    floor INTEGER,
-    view VARCHAR(30),
-    is_available BOOLEAN
-) AS $$
-BEGIN
-    RETURN QUERY
-    SELECT
-        r.id,
-        r.room_number,
-        r.floor,
-        r.view,
-        NOT EXISTS (
-            SELECT 1
-            FROM details_reservations dr
-            JOIN reservations res ON dr.reservation_id = res.id
-            WHERE dr.room_id = r.id
-            AND res.status IN ('confirmed', 'pending')
-            AND (
-                (res.start_date <= p_end_date AND res.end_date >= p_start_date)
-            )
-        ) AS is_available
-    FROM rooms r
-    WHERE r.hotel_id = p_hotel_id
-    AND r.categories_room_id = p_category_id;
-END;
--- Использование функции
--- SELECT * FROM check_room_availability(1, 1, '2024-05-10', '2024-05-15'); -- вписать в запросы выше
+-- Функция check_room_availability устанавливается на все узлы из init/functions.sql
+SELECT * FROM check_room_availability(1, 1, '2024-05-10', '2024-05-15');
 
 
 -- Юзер:
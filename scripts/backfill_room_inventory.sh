@@ -0,0 +1,11 @@
+#!/bin/bash
+
+# Перестроение посуточного учета номеров (room_inventory) по существующим бронированиям.
+# Использование: ./scripts/backfill_room_inventory.sh [hotel_id]
+
+hotel_id=${1:-NULL}
+
+for node in hotel_central_node hotel_filial1_node hotel_filial2_node hotel_filial3_node; do
+    echo "Перестроение room_inventory в $node..."
+    docker exec -i $node psql -U postgres -d hotel_management -t -c "SELECT rebuild_room_inventory($hotel_id);" || exit 1
+done
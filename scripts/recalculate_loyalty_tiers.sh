@@ -0,0 +1,12 @@
+#!/bin/bash
+
+# Пакетный пересчет уровней программы лояльности гостей на всех узлах.
+# Выводит по каждому узлу число обновленных гостей, число порций и длительность.
+# Использование: ./scripts/recalculate_loyalty_tiers.sh [chunk_size]
+
+chunk_size=${1:-1000}
+
+for node in hotel_central_node hotel_filial1_node hotel_filial2_node hotel_filial3_node; do
+    echo "Пересчет уровней лояльности в $node..."
+    docker exec -i $node psql -U postgres -d hotel_management -c "CALL recalculate_loyalty_tiers($chunk_size);" || exit 1
+done